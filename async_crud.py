@@ -0,0 +1,43 @@
+"""
+Variantes asynchrones des fonctions `crud` utilisées par les routes les plus sollicitées.
+
+La logique métier reste celle de `crud`, exécutée sur la session synchrone sous-jacente via
+`AsyncSession.run_sync` sans bloquer la boucle d'événements ; les lectures simples sont écrites
+directement en asynchrone. Les objets renvoyés
+sont chargés avec les profils de `crud.LOAD_PROFILES` pour être sérialisés sans I/O implicite.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from . import crud, models, schemas
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalar_one_or_none()
+
+async def get_users_version(db: AsyncSession):
+    result = await db.execute(select(models.TableVersion.version).where(models.TableVersion.table_name == "users"))
+    return result.scalar_one_or_none() or 0
+
+async def get_product(db: AsyncSession, product_id: int):
+    # Fournisseur chargé d'emblée : schemas.Product le sérialise
+    result = await db.execute(select(models.Product).options(joinedload(models.Product.supplier)).where(models.Product.id == product_id))
+    return result.scalar_one_or_none()
+
+async def search_products(db: AsyncSession, query: str, limit: int = 20, in_stock: bool = False):
+    return await db.run_sync(crud.search_products, query, limit, in_stock)
+
+async def get_products_page(db: AsyncSession, cursor: str = None, limit: int = 50, category: str = None, in_stock: bool = False):
+    return await db.run_sync(crud.get_products_page, cursor, limit, category, in_stock)
+
+async def quote_cart(db: AsyncSession, cart: schemas.Cart):
+    return await db.run_sync(crud.quote_cart, [(item.product_id, item.quantity) for item in cart.items], cart.client_id)
+
+async def create_sale(db: AsyncSession, sale: schemas.SaleCreate, user_id: int):
+    # La vente est relue avec le profil "detail" dans le même aller-retour pour la réponse
+    def _create(session):
+        return crud.get_sale(session, crud.create_sale(session, sale, user_id).id)
+    return await db.run_sync(_create)
+
+async def get_dashboard_kpis(db: AsyncSession):
+    return await db.run_sync(crud.get_dashboard_kpis)
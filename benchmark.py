@@ -0,0 +1,374 @@
+"""
+Jeu de données synthétique et mesures de performance des fonctions `crud` les plus sollicitées.
+
+Usage : python -m app.benchmark [--sales 20000 ...] [--output resultats.json] [--compare reference.json]
+
+La base de mesure est distincte de la base de l'application (`--database-url`, par défaut
+sqlite:///benchmark.db). Elle est générée une seule fois avec une graine fixe (mêmes volumes et même
+graine = mêmes données) puis réutilisée ; `--fresh` la régénère. Chaque mesure relève la durée
+(médiane, min, max) et le nombre de requêtes SQL émises ; `--compare` signale les régressions par
+rapport à un fichier de référence produit par une exécution précédente ; `--check-plans` vérifie
+sur SQLite que les requêtes sensibles au volume restent servies par leurs index.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+import sqlalchemy
+from sqlalchemy import event, func, insert, text
+from sqlalchemy.orm import sessionmaker
+from . import models, crud, schemas
+from .database import DATABASE_URL, make_engine
+from .maintenance import run_migrations
+
+DEFAULT_BENCHMARK_URL = "sqlite:///benchmark.db"
+
+CATEGORIES = ["Peinture", "Plomberie", "Électricité", "Outillage", "Matériaux de Construction", "Quincaillerie", "Jardinage", "Sécurité", "Non classé"]
+UNITS = ["Unité", "Boite", "Carton", "Sac", "Rouleau", "kg", "Litre", "Mètre", "Barre"]
+PRODUCT_WORDS = {
+    "Peinture": ["Peinture", "Vernis", "Rouleau", "Pinceau", "Diluant"], "Plomberie": ["Tuyau", "Coude", "Robinet", "Raccord", "Vanne"],
+    "Électricité": ["Câble", "Prise", "Interrupteur", "Ampoule", "Disjoncteur"], "Outillage": ["Marteau", "Tournevis", "Pince", "Scie", "Clé"],
+    "Matériaux de Construction": ["Ciment", "Fer", "Brique", "Sable", "Tôle"], "Quincaillerie": ["Vis", "Boulon", "Écrou", "Clou", "Charnière"],
+    "Jardinage": ["Pelle", "Râteau", "Arrosoir", "Sécateur", "Brouette"], "Sécurité": ["Cadenas", "Serrure", "Gants", "Casque", "Lunettes"],
+    "Non classé": ["Article", "Divers"],
+}
+QUALIFIERS = ["acier", "inox", "PVC", "laiton", "galvanisé", "pro", "standard", "renforcé", "blanc", "noir"]
+PAYMENT_METHODS = ["Espèce", "Mvola", "Orange money", "Airtel money", "Chèque", "Virement", "Carte visa"]
+
+def _chunks(rows, size=5000):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def generate_fixtures(db, products=5000, clients=500, suppliers=50, sales=20000, orders=1000, days=365, seed=42):
+    """
+    Remplit une base vide : popularité des produits en loi de Zipf, prix log-normaux, ventes réparties
+    sur `days` jours aux heures d'ouverture (dimanche plus calme), paniers de 1 à 6 lignes, ~35 % des
+    ventes rattachées à un client dont ~8 % à crédit, ~85 % des commandes reçues. Le journal de stock,
+    les agrégats journaliers et l'index de recherche sont cohérents avec les données.
+    """
+    if db.query(models.Product.id).first():
+        raise RuntimeError("La base de mesure contient déjà des produits : utiliser --fresh pour la régénérer.")
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=days)
+
+    def moment():
+        # Jour ouvré plus probable que le dimanche, heure d'ouverture 8 h - 18 h
+        while True:
+            day = start + timedelta(days=rng.randrange(days))
+            if day.weekday() != 6 or rng.random() < 0.3:
+                stamp = day.replace(hour=rng.randrange(8, 18), minute=rng.randrange(60), second=rng.randrange(60))
+                return min(stamp, now)
+
+    db.execute(insert(models.User), [{"id": i, "username": f"caissier{i}", "hashed_password": "!", "role": models.UserRole.PERSONNEL, "is_active": True} for i in range(1, 6)])
+    db.execute(insert(models.Supplier), [{"id": i, "name": f"Fournisseur {i:03d}", "phone": f"034 {rng.randrange(10**7):07d}"} for i in range(1, suppliers + 1)])
+    db.execute(insert(models.Client), [
+        {"id": i, "name": f"Client {i:05d}", "type": models.ClientType.PROFESSIONNEL if rng.random() < 0.2 else models.ClientType.PARTICULIER, "phone": f"033 {rng.randrange(10**7):07d}"}
+        for i in range(1, clients + 1)
+    ])
+    catalog = []
+    for i in range(1, products + 1):
+        category = rng.choice(CATEGORIES)
+        purchase_price = max(100.0, round(rng.lognormvariate(7.5, 1.0), -1))
+        selling_price = round(purchase_price * rng.choice([1.2, 1.3, 1.4, 1.5]), -1)
+        catalog.append({
+            "id": i, "sku": f"BEN-{i:06d}", "name": f"{rng.choice(PRODUCT_WORDS[category])} {rng.choice(QUALIFIERS)} {i}", "category": category,
+            "purchase_price": purchase_price, "selling_price": selling_price, "promo_price": round(selling_price * 0.9, -1) if rng.random() < 0.05 else None,
+            "unit": rng.choice(UNITS), "supplier_id": rng.randrange(1, suppliers + 1), "stock_quantity": 0,
+        })
+    # Popularité en loi de Zipf : quelques références font l'essentiel des ventes
+    ranked = [p["id"] for p in catalog]
+    rng.shuffle(ranked)
+    cumulative, total = [], 0.0
+    for rank in range(1, products + 1):
+        total += 1 / rank ** 1.1
+        cumulative.append(total)
+    prices = {p["id"]: (p["promo_price"] or p["selling_price"], p["purchase_price"]) for p in catalog}
+
+    sale_rows, item_rows, movements = [], [], []
+    sold = dict.fromkeys(prices, 0)
+    for sale_id in range(1, sales + 1):
+        sale_date = moment()
+        client_id = rng.randrange(1, clients + 1) if clients and rng.random() < 0.35 else None
+        status = models.SaleStatus.CREDIT if client_id and rng.random() < 0.08 else models.SaleStatus.PAYEE
+        lines = {}
+        for product_id in rng.choices(ranked, cum_weights=cumulative, k=rng.choices([1, 2, 3, 4, 5, 6], weights=[30, 25, 18, 12, 9, 6])[0]):
+            lines[product_id] = lines.get(product_id, 0) + rng.choices([1, 2, 3, 5, 10], weights=[50, 25, 12, 8, 5])[0]
+        total_amount = 0.0
+        for product_id, quantity in lines.items():
+            price, cost = prices[product_id]
+            total_amount += price * quantity
+            sold[product_id] += quantity
+            item_rows.append({"sale_id": sale_id, "product_id": product_id, "quantity": quantity, "price_per_unit": price, "unit_cost": cost})
+            movements.append({"product_id": product_id, "movement_type": models.StockMovementType.VENTE, "quantity": -quantity, "sale_id": sale_id, "movement_date": sale_date})
+        sale_rows.append({
+            "id": sale_id, "sale_date": sale_date, "total_amount": total_amount, "status": status, "client_id": client_id, "user_id": rng.randrange(1, 6),
+            "payment_method": "Crédit" if status == models.SaleStatus.CREDIT else rng.choice(PAYMENT_METHODS),
+        })
+
+    order_rows, order_items = [], []
+    received = dict.fromkeys(prices, 0)
+    by_supplier = {}
+    for p in catalog:
+        by_supplier.setdefault(p["supplier_id"], []).append(p["id"])
+    for order_id in range(1, orders + 1):
+        supplier_id = rng.choice(list(by_supplier))
+        order_date = moment()
+        reception_date = order_date + timedelta(days=rng.randrange(1, 11), hours=rng.randrange(8))
+        is_received = rng.random() < 0.85 and reception_date <= now
+        total_cost = 0.0
+        for product_id in rng.sample(by_supplier[supplier_id], min(len(by_supplier[supplier_id]), rng.randrange(2, 11))):
+            quantity = rng.choice([5, 10, 20, 50, 100])
+            cost = prices[product_id][1]
+            total_cost += cost * quantity
+            order_items.append({"order_id": order_id, "product_id": product_id, "quantity": quantity, "purchase_price_per_unit": cost})
+            if is_received:
+                received[product_id] += quantity
+                movements.append({"product_id": product_id, "movement_type": models.StockMovementType.RECEPTION, "quantity": quantity, "order_id": order_id, "movement_date": reception_date})
+        order_rows.append({
+            "id": order_id, "supplier_id": supplier_id, "order_date": order_date, "total_cost": total_cost,
+            "status": models.OrderStatus.RECUE if is_received else models.OrderStatus.EN_COURS, "reception_date": reception_date if is_received else None,
+        })
+
+    # Stock d'ouverture : de quoi couvrir les ventes, plus une réserve ; le stock courant en découle
+    for p in catalog:
+        reserve = rng.randrange(0, 200)
+        opening = sold[p["id"]] + reserve
+        p["stock_quantity"] = reserve + received[p["id"]]
+        if opening:
+            movements.append({"product_id": p["id"], "movement_type": models.StockMovementType.AJUSTEMENT, "quantity": opening, "note": "Stock initial", "movement_date": start})
+    for model, rows in ((models.Product, catalog), (models.Sale, sale_rows), (models.SaleItem, item_rows), (models.PurchaseOrder, order_rows),
+                        (models.PurchaseOrderItem, order_items), (models.StockMovement, movements)):
+        for chunk in _chunks(rows):
+            db.execute(insert(model), chunk)
+    db.commit()
+    crud.rebuild_daily_sales_rollup(db)
+    return {"products": products, "clients": clients, "suppliers": suppliers, "sales": sales, "sale_items": len(item_rows), "orders": orders, "stock_movements": len(movements)}
+
+class QueryCounter:
+    # Nombre d'allers-retours SQL (un executemany compte pour un)
+    def __init__(self, bind):
+        self.count = 0
+        event.listen(bind, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+SEARCH_TERMS = ["vis", "peinture", "robinet inox", "câble", "marteau pro", "BEN-0001", "serrure"]
+
+def _case_create_sale(db, rng):
+    products = db.query(models.Product.id).filter(models.Product.stock_quantity >= 5).order_by(func.random()).limit(3).all()
+    sale = schemas.SaleCreate(payment_method="Espèce", status=models.SaleStatus.PAYEE, items=[schemas.SaleItemCreate(product_id=p.id, quantity=1, price_per_unit=0) for p in products])
+    return lambda: crud.create_sale(db, sale, user_id=1)
+
+def _case_receive_purchase_order(db, rng):
+    supplier_id = db.query(models.Product.supplier_id).filter(models.Product.supplier_id.isnot(None)).order_by(func.random()).first()[0]
+    products = db.query(models.Product).filter(models.Product.supplier_id == supplier_id).limit(5).all()
+    order = crud.create_purchase_order(db, schemas.PurchaseOrderCreate(supplier_id=supplier_id, items=[
+        schemas.PurchaseOrderItemCreate(product_id=p.id, quantity=10, purchase_price_per_unit=p.purchase_price) for p in products
+    ]))
+    db.expunge_all()
+    return lambda: crud.receive_purchase_order(db, order.id)
+
+def _last_days(days):
+    return date.today() - timedelta(days=days - 1), date.today()
+
+BENCHMARKS = {
+    "create_sale": _case_create_sale,
+    "receive_purchase_order": _case_receive_purchase_order,
+    "get_dashboard_kpis": lambda db, rng: lambda: crud.get_dashboard_kpis(db),
+    "get_finance_kpis": lambda db, rng: lambda: crud.get_finance_kpis(db),
+    "get_monthly_sales_chart_data": lambda db, rng: lambda: crud.get_monthly_sales_chart_data(db, date.today().year),
+    "get_sales_in_date_range_30d": lambda db, rng: lambda: crud.get_sales_in_date_range(db, *_last_days(30)),
+    "get_received_orders_in_date_range_90d": lambda db, rng: lambda: crud.get_received_orders_in_date_range(db, *_last_days(90)),
+    "get_realized_profit_in_date_range_365d": lambda db, rng: lambda: crud.get_realized_profit_in_date_range(db, *_last_days(365)),
+    "get_report_day_365d": lambda db, rng: lambda: crud.get_report(db, *_last_days(365), group_by="day"),
+    "get_report_product_365d": lambda db, rng: lambda: crud.get_report(db, *_last_days(365), group_by="product"),
+    "iter_sales_export_rows_30d": lambda db, rng: lambda: sum(1 for _ in crud.iter_sales_export_rows(db, *_last_days(30))),
+    "get_sales_page_credit": lambda db, rng: lambda: crud.get_sales_page(db, status=models.SaleStatus.CREDIT, oldest_first=True),
+    "search_products": lambda db, rng: (lambda term: lambda: crud.search_products(db, term, limit=20))(rng.choice(SEARCH_TERMS)),
+    "get_products_page_pos": lambda db, rng: lambda: crud.get_products_page(db, category=rng.choice(CATEGORIES), in_stock=True, limit=24),
+    "quote_cart_10": lambda db, rng: (lambda items: lambda: crud.quote_cart(db, items))([(rng.randint(1, 500), rng.randint(1, 5)) for _ in range(10)]),
+}
+
+def run_benchmarks(session_factory, counter, repeat=20, seed=42, only=None):
+    rng = random.Random(seed)
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        durations, queries = [], []
+        db = session_factory()
+        try:
+            for _ in range(repeat):
+                run = setup(db, rng)
+                # Mesure à froid côté session : aucun objet déjà chargé ne masque le coût des requêtes
+                db.expunge_all()
+                counter.count = 0
+                started = time.perf_counter()
+                run()
+                durations.append((time.perf_counter() - started) * 1000)
+                queries.append(counter.count)
+        finally:
+            db.close()
+        results[name] = {
+            "median_ms": round(statistics.median(durations), 3), "min_ms": round(min(durations), 3), "max_ms": round(max(durations), 3),
+            "queries": int(statistics.median(queries)), "runs": repeat,
+        }
+        print(f"{name:42s} {results[name]['median_ms']:10.2f} ms  (min {results[name]['min_ms']:.2f})  {results[name]['queries']:3d} requête(s)")
+    return results
+
+# Plans d'exécution (SQLite) : les requêtes émises par ces fonctions doivent passer par les index
+# attendus et ne parcourir entièrement aucune des grandes tables, quel que soit le volume.
+PLAN_TABLES = {"products", "sales", "sale_items", "purchase_orders", "purchase_order_items", "stock_movements", "client_ledger"}
+PLAN_CHECKS = {
+    "get_sales_in_date_range_30d": (lambda db: crud.get_sales_in_date_range(db, *_last_days(30), profile="detail"), {"ix_sales_sale_date_id", "ix_sale_items_sale_id"}),
+    "get_sales_page_credit": (lambda db: crud.get_sales_page(db, status=models.SaleStatus.CREDIT, oldest_first=True), {"ix_sales_status_sale_date"}),
+    "get_sales_page_client": (lambda db: crud.get_sales_page(db, client_id=1), {"ix_sales_client_sale_date"}),
+    "get_sales_by_client": (lambda db: crud.get_sales_by_client(db, 1, profile="list"), {"ix_sales_client_sale_date"}),
+    "get_realized_profit_in_date_range_30d": (lambda db: crud.get_realized_profit_in_date_range(db, *_last_days(30)), {"ix_sales_sale_date_id", "ix_sale_items_sale_id"}),
+    "get_report_product_30d": (lambda db: crud.get_report(db, *_last_days(30), group_by="product"), {"ix_sales_sale_date_id", "ix_sale_items_sale_id"}),
+    "get_received_orders_in_date_range_90d": (lambda db: crud.get_received_orders_in_date_range(db, *_last_days(90)), {"ix_purchase_orders_status_reception"}),
+    "get_orders_by_supplier": (lambda db: crud.get_orders_by_supplier(db, 1, profile="detail"), {"ix_purchase_orders_supplier_order_date", "ix_purchase_order_items_order_id"}),
+    "get_aged_receivables": (lambda db: crud.get_aged_receivables(db), {"ix_sales_status_sale_date"}),
+    "get_client_ledger_page": (lambda db: crud.get_client_ledger_page(db, 1), {"ix_client_ledger_client_date"}),
+    "get_client_profile": (lambda db: crud.get_client_profile(db, 1), {"ix_sales_client_sale_date"}),
+    "get_supplier_profile": (lambda db: crud.get_supplier_profile(db, 1), {"ix_products_supplier_id", "ix_purchase_orders_supplier_order_date"}),
+    "get_products_page_category": (lambda db: crud.get_products_page(db, category="Plomberie", in_stock=True, limit=24), {"ix_products_category_name_id"}),
+}
+
+def _full_scans(plan):
+    # « SCAN sales » sans index = parcours complet ; « SEARCH » et « SCAN ... USING INDEX » restent bornés par l'index
+    return [line for line in plan if line.startswith("SCAN ") and line.split()[1] in PLAN_TABLES and "INDEX" not in line]
+
+def query_plan(session_factory, run):
+    """Exécute `run(db)`, relève ses SELECT et rend les lignes de leur EXPLAIN QUERY PLAN (SQLite)."""
+    statements = []
+    db = session_factory()
+    conn = db.connection()
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+    event.listen(conn, "before_cursor_execute", capture)
+    try:
+        run(db)
+        event.remove(conn, "before_cursor_execute", capture)
+        return [row[-1] for statement, parameters in statements for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+    finally:
+        db.close()
+
+def plan_problems(plan, expected):
+    """Index attendus absents du plan et parcours complets de grandes tables."""
+    used = {index for index in expected if any(index in line for line in plan)}
+    return [f"index non utilisé : {index}" for index in sorted(expected - used)] + [f"parcours complet : {line}" for line in dict.fromkeys(_full_scans(plan))]
+
+def check_query_plans(session_factory, only=None):
+    """Contrôle le plan de chaque cas de PLAN_CHECKS (mêmes vérifications que tests/test_query_plans.py). Rend les anomalies."""
+    failures = []
+    for name, (run, expected) in PLAN_CHECKS.items():
+        if only and name not in only:
+            continue
+        problems = plan_problems(query_plan(session_factory, run), expected)
+        failures += [f"{name} : {problem}" for problem in problems]
+        print(f"{name:42s} {'OK' if not problems else 'ÉCHEC'}")
+    return failures
+
+def compare(results, baseline, tolerance=0.3, min_delta_ms=1.0):
+    """Régressions par rapport à `baseline` : requêtes en plus, ou médiane plus lente au-delà de la tolérance."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference is None:
+            continue
+        if result["queries"] > reference["queries"]:
+            regressions.append(f"{name} : {reference['queries']} -> {result['queries']} requête(s)")
+        if result["median_ms"] > reference["median_ms"] * (1 + tolerance) and result["median_ms"] - reference["median_ms"] > min_delta_ms:
+            regressions.append(f"{name} : {reference['median_ms']:.2f} -> {result['median_ms']:.2f} ms")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.benchmark", description="Mesures de performance de Quincaillerie PRO sur données synthétiques")
+    parser.add_argument("--database-url", default=DEFAULT_BENCHMARK_URL)
+    parser.add_argument("--fresh", action="store_true", help="Supprime et régénère les données de mesure")
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--suppliers", type=int, default=50)
+    parser.add_argument("--sales", type=int, default=20000)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="Limiter aux mesures indiquées")
+    parser.add_argument("--output", help="Fichier JSON des résultats (référence pour --compare)")
+    parser.add_argument("--compare", help="Fichier JSON de référence")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Ralentissement toléré (0.3 = +30 %%)")
+    parser.add_argument("--check-plans", action="store_true", help="Contrôle les plans d'exécution (SQLite) : échoue si une requête n'utilise pas ses index")
+    args = parser.parse_args(argv)
+    if args.database_url == DATABASE_URL:
+        parser.error("--database-url doit désigner une base distincte de celle de l'application.")
+
+    bind = make_engine(args.database_url)
+    if args.fresh:
+        with bind.begin() as conn:
+            if bind.dialect.name == "sqlite":
+                conn.execute(text("DROP TABLE IF EXISTS products_fts"))
+        models.Base.metadata.drop_all(bind)
+    models.Base.metadata.create_all(bind)
+    run_migrations(bind)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+    db = session_factory()
+    try:
+        if not db.query(models.Product.id).first():
+            started = time.perf_counter()
+            volumes = generate_fixtures(db, args.products, args.clients, args.suppliers, args.sales, args.orders, args.days, args.seed)
+            print(f"Données générées en {time.perf_counter() - started:.1f} s : " + ", ".join(f"{count} {name}" for name, count in volumes.items()))
+        volumes = {name: db.query(func.count()).select_from(model).scalar() for name, model in (
+            ("products", models.Product), ("clients", models.Client), ("sales", models.Sale), ("sale_items", models.SaleItem), ("orders", models.PurchaseOrder),
+        )}
+    finally:
+        db.close()
+
+    plan_failures = []
+    if args.check_plans:
+        if bind.dialect.name == "sqlite":
+            plan_failures = check_query_plans(session_factory)
+        else:
+            print("Contrôle des plans d'exécution disponible uniquement sur SQLite.")
+
+    counter = QueryCounter(bind)
+    results = run_benchmarks(session_factory, counter, args.repeat, args.seed, args.only)
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"), "database": bind.dialect.name, "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__, "seed": args.seed, "repeat": args.repeat, "volumes": volumes,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Résultats enregistrés dans {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        # Les mesures d'écriture ajoutent des ventes et des commandes : seul le référentiel doit être identique
+        reference = baseline.get("meta", {}).get("volumes", {})
+        if any(reference.get(name) != volumes[name] for name in ("products", "clients")):
+            print("Attention : volumes de données différents de la référence, comparaison indicative.")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("Aucune régression par rapport à la référence.")
+    for failure in plan_failures:
+        print(f"PLAN {failure}")
+    if plan_failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
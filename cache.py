@@ -0,0 +1,42 @@
+"""
+Cache en mémoire des données de référence (catalogue, fournisseurs, clients, paramètres).
+
+Chaque entrée est associée à la version des tables dont elle dépend. Les fonctions d'écriture de
+`crud` incrémentent ces versions (table `table_versions`) dans la même transaction que la
+modification : une entrée reste donc valable tant que ses tables n'ont pas changé, quel que soit
+la session ou le processus qui a écrit, sans deviner de durée de vie.
+"""
+import threading
+from collections import OrderedDict
+
+class VersionedCache:
+    # `max_entries` : borne optionnelle, les entrées les moins récemment lues sont évincées en premier
+    def __init__(self, max_entries: int = None):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, version, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = loader()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            if self._max_entries is not None and len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def discard(self, key, value):
+        # Retire l'entrée seulement si elle contient encore `value` (une valeur rechargée entre-temps est conservée)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is value:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,6 +1,50 @@
+import os
 from datetime import timedelta
 # Configuration pour JWT (JSON Web Tokens)
 # En production, ces valeurs devraient venir de variables d'environnement.
 SECRET_KEY = "a_very_secret_key_that_should_be_changed_and_be_longer"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 8 # 8 heures
+
+# Base de données. L'URL asynchrone est déduite de DATABASE_URL (aiosqlite pour SQLite, asyncpg pour
+# PostgreSQL) sauf si ASYNC_DATABASE_URL est fournie explicitement.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./quincaillerie_pro.db")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Pool de connexions (PostgreSQL, ou fichier SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # secondes
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30")) # secondes
+
+# PRAGMAs SQLite appliqués à chaque connexion. Le mode WAL permet aux lectures des rapports
+# de ne pas bloquer les écritures de la caisse (et inversement).
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")), # valeur négative = en Kio (64 Mio)
+    # Contrôle des clés étrangères : désactivé par défaut (comportement SQLite), une base existante pouvant
+    # contenir des client_id / supplier_id orphelins ; SQLITE_FOREIGN_KEYS=ON après nettoyage
+    "foreign_keys": os.getenv("SQLITE_FOREIGN_KEYS", "OFF"),
+}
+
+# Cache en mémoire des jetons déjà vérifiés (jeton -> utilisateur), borné en taille et en durée
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("QP_AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("QP_AUTH_CACHE_MAX_ENTRIES", "1024"))
+# Délai maximal avant qu'une modification de compte faite par un autre processus invalide le cache
+AUTH_VERSION_POLL_SECONDS = float(os.getenv("QP_AUTH_VERSION_POLL", "5"))
+
+# Mode test : toute relation chargée paresseusement (lazy load) lève une erreur.
+# Permet de vérifier que les profils de chargement de `crud` couvrent tout ce que les schémas sérialisent.
+STRICT_LAZY_LOADS = os.getenv("QP_STRICT_LAZY_LOADS", "0") == "1"
+
+# Mesures exposées sur /metrics (metrics.py) ; une requête SQL plus lente que le seuil est journalisée
+METRICS_ENABLED = os.getenv("QP_METRICS", "1") == "1"
+SLOW_QUERY_MS = float(os.getenv("QP_SLOW_QUERY_MS", "200"))
+
+# Page États de Streamlit : lignes affichées en aperçu, et plafond d'un export généré dans l'interface.
+# Un export complet, en flux et en mémoire constante, passe par /api/reports/*/export
+REPORT_PREVIEW_ROWS = int(os.getenv("QP_REPORT_PREVIEW_ROWS", "200"))
+UI_EXPORT_MAX_ROWS = int(os.getenv("QP_UI_EXPORT_MAX_ROWS", "50000"))
@@ -1,7 +1,16 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, extract
-from datetime import datetime, date
+import base64
+import json
+import re
+import unicodedata
+from contextlib import contextmanager
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import event, func, and_, or_, extract, case, insert, update, select, distinct, literal, literal_column, table, column, tuple_, union, cast, Integer
+from datetime import datetime, date, timedelta
+from sqlalchemy.dialects import postgresql, sqlite
+from pydantic import ValidationError
 from . import models, schemas
+from .cache import VersionedCache
+from .config import STRICT_LAZY_LOADS
 from passlib.context import CryptContext
 
 # ... (Toutes les fonctions jusqu'à get_sales_by_client sont identiques)
@@ -13,12 +22,141 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# Profils de chargement : exactement les relations dont chaque usage (et chaque schéma) a besoin,
+# pour qu'une page coûte un nombre constant de requêtes quel que soit le nombre de lignes.
+LOAD_PROFILES = {
+    models.Sale: {
+        "list": [joinedload(models.Sale.client), joinedload(models.Sale.user)],
+        "detail": [
+            joinedload(models.Sale.client), joinedload(models.Sale.user),
+            selectinload(models.Sale.items).joinedload(models.SaleItem.product).joinedload(models.Product.supplier),
+        ],
+        "invoice": [joinedload(models.Sale.client), selectinload(models.Sale.items).joinedload(models.SaleItem.product)],
+    },
+    models.PurchaseOrder: {
+        "list": [joinedload(models.PurchaseOrder.supplier)],
+        "detail": [
+            joinedload(models.PurchaseOrder.supplier),
+            selectinload(models.PurchaseOrder.items).joinedload(models.PurchaseOrderItem.product).joinedload(models.Product.supplier),
+        ],
+    },
+}
+
+def _with_profile(query, model, profile):
+    if profile is None:
+        return query
+    return query.options(*LOAD_PROFILES[model][profile])
+
+class LazyLoadError(RuntimeError):
+    pass
+
+@event.listens_for(Session, "do_orm_execute")
+def _check_lazy_load(orm_execute_state):
+    if not orm_execute_state.is_select:
+        return
+    if orm_execute_state.lazy_loaded_from is not None and (STRICT_LAZY_LOADS or orm_execute_state.session.info.get("forbid_lazy_loads")):
+        raise LazyLoadError(f"Chargement paresseux interdit : {orm_execute_state.lazy_loaded_from.class_.__name__} -> {orm_execute_state.statement}")
+
+@contextmanager
+def forbid_lazy_loads(db: Session):
+    # Mode test : échoue dès qu'une sérialisation déclenche un lazy load
+    previous = db.info.get("forbid_lazy_loads", False)
+    db.info["forbid_lazy_loads"] = True
+    try:
+        yield db
+    finally:
+        db.info["forbid_lazy_loads"] = previous
+
+def _encode_cursor(values):
+    payload = json.dumps([v.isoformat() if isinstance(v, (datetime, date)) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def _decode_cursor(cursor: str, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return [datetime.fromisoformat(v) if column.type.python_type is datetime else v for column, v in zip(columns, values)]
+    except (ValueError, TypeError) as e:
+        raise ValueError("Curseur de pagination invalide.") from e
+
+def _keyset_page(query, columns, cursor: str = None, limit: int = 50, descending: bool = False):
+    # Pagination par clé (seek) sur l'ordre de tri existant : coût constant quelle que soit la profondeur,
+    # et pas de lignes décalées entre deux pages pendant que les ventes continuent.
+    if cursor:
+        after = tuple_(*[literal(v, c.type) for c, v in zip(columns, _decode_cursor(cursor, columns))])
+        query = query.filter(tuple_(*columns) < after if descending else tuple_(*columns) > after)
+    query = query.order_by(*[c.desc() if descending else c.asc() for c in columns])
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor([getattr(rows[-1], c.key) for c in columns])
+    return rows, next_cursor
+
+def _dialect_insert(db: Session, model):
+    # INSERT supportant ON CONFLICT ... DO UPDATE (SQLite et PostgreSQL)
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def _bump_daily_rollup(db: Session, moment: datetime, **deltas):
+    # `moment` : horodatage tel qu'enregistré (sale_date, reception_date). Le jour en est la partie date,
+    # exactement comme func.date() dans rebuild_daily_sales_rollup : les deux chemins tombent sur le même jour.
+    stmt = _dialect_insert(db, models.DailySalesRollup).values(day=moment.date(), **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.DailySalesRollup.day],
+        set_={key: getattr(models.DailySalesRollup, key) + stmt.excluded[key] for key in deltas},
+    )
+    db.execute(stmt)
+
+def _bump_table_versions(db: Session, *table_names):
+    # Invalide les entrées du cache de référence qui dépendent de ces tables (même transaction que l'écriture)
+    stmt = _dialect_insert(db, models.TableVersion).values([{"table_name": name, "version": 1} for name in table_names])
+    db.execute(stmt.on_conflict_do_update(index_elements=[models.TableVersion.table_name], set_={"version": models.TableVersion.version + 1}))
+
+def get_table_versions(db: Session, *table_names):
+    versions = dict(db.query(models.TableVersion.table_name, models.TableVersion.version).filter(models.TableVersion.table_name.in_(table_names)).all())
+    return tuple(versions.get(name, 0) for name in table_names)
+
+_reference_cache = VersionedCache()
+
+def get_reference_products(db: Session):
+    # Catalogue complet (avec fournisseur) en instantanés détachés, sans le stock, rechargé uniquement après une
+    # écriture sur les fiches : les mouvements de stock (ventes, réceptions) ne font pas avancer la version "products".
+    # populate_existing : la session appelante peut détenir des objets périmés écrits par un autre processus.
+    def load():
+        products = db.query(models.Product).options(joinedload(models.Product.supplier)).populate_existing().order_by(models.Product.name, models.Product.id)
+        return [schemas.ProductReference.model_validate(p) for p in products]
+    return _reference_cache.get_or_load("products", get_table_versions(db, "products", "suppliers"), load)
+
+def get_reference_suppliers(db: Session):
+    def load():
+        return [schemas.Supplier.model_validate(s) for s in db.query(models.Supplier).populate_existing().order_by(models.Supplier.name, models.Supplier.id)]
+    return _reference_cache.get_or_load("suppliers", get_table_versions(db, "suppliers"), load)
+
+def get_reference_clients(db: Session):
+    def load():
+        return [schemas.ClientReference.model_validate(c) for c in db.query(models.Client).populate_existing().order_by(models.Client.name, models.Client.id)]
+    return _reference_cache.get_or_load("clients", get_table_versions(db, "clients"), load)
+
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.User).offset(skip).limit(limit).all()
 
+# Versions des comptes utilisateurs, qui invalident le cache d'authentification (dependencies.get_current_user) :
+# la ligne "users" de table_versions est partagée entre processus, le compteur local a un effet immédiat ici
+_local_users_version = 0
+
+def get_users_version(db: Session):
+    return get_table_versions(db, "users")[0]
+
+def get_local_users_version():
+    return _local_users_version
+
+def get_user(db: Session, user_id: int):
+    return db.query(models.User).filter(models.User.id == user_id).first()
+
 def create_user(db: Session, user: schemas.UserCreate):
     hashed_password = get_password_hash(user.password)
     db_user = models.User(username=user.username, hashed_password=hashed_password, role=user.role)
@@ -26,6 +164,23 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.commit()
     db.refresh(db_user)
     return db_user
+
+def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
+    db_user = get_user(db, user_id)
+    if not db_user: return None
+    update_data = user_update.model_dump(exclude_unset=True)
+    password = update_data.pop("password", None)
+    if password:
+        db_user.hashed_password = get_password_hash(password)
+    for key, value in update_data.items():
+        if value is not None:
+            setattr(db_user, key, value)
+    _bump_table_versions(db, "users")
+    db.commit()
+    global _local_users_version
+    _local_users_version += 1
+    db.refresh(db_user)
+    return db_user
     
 def get_product(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id == product_id).first()
@@ -33,20 +188,304 @@ def get_product(db: Session, product_id: int):
 def get_products(db: Session, skip: int = 0, limit: int = 1000):
     return db.query(models.Product).order_by(models.Product.name).offset(skip).limit(limit).all()
 
+def get_products_page(db: Session, cursor: str = None, limit: int = 50, category: str = None, in_stock: bool = False):
+    query = db.query(models.Product).options(joinedload(models.Product.supplier))
+    if category:
+        query = query.filter(models.Product.category == category)
+    if in_stock:
+        query = query.filter(models.Product.stock_quantity > 0)
+    return _keyset_page(query, [models.Product.name, models.Product.id], cursor, limit)
+
+def get_supplier_products(db: Session, supplier_id: int):
+    # Produits d'un fournisseur, stock à jour (index ix_products_supplier_id)
+    return db.query(models.Product).filter(models.Product.supplier_id == supplier_id).order_by(models.Product.name, models.Product.id).all()
+
+def get_stock_valuation(db: Session):
+    # (nombre de références, valeur du stock au prix d'achat), calculés en base
+    count, value = db.query(func.count(models.Product.id), func.sum(models.Product.purchase_price * models.Product.stock_quantity)).one()
+    return count, value or 0
+
+# Index plein texte SQLite FTS5 (voir maintenance.create_product_search_index), synchronisé par triggers
+products_fts = table("products_fts", column("rowid"))
+
+def search_products(db: Session, query: str, limit: int = 20, in_stock: bool = False):
+    # Recherche par préfixe, insensible aux accents, sur le nom, le SKU et la catégorie, classée par pertinence
+    terms = re.findall(r"\w+", query or "")
+    if not terms:
+        return []
+    products = db.query(models.Product).options(joinedload(models.Product.supplier))
+    if in_stock:
+        products = products.filter(models.Product.stock_quantity > 0)
+    if db.get_bind().dialect.name == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        fts = literal_column("products_fts")
+        return (
+            products.join(products_fts, products_fts.c.rowid == models.Product.id)
+            .filter(fts.op("MATCH")(match))
+            .order_by(func.bm25(fts, 10.0, 5.0, 1.0))
+            .limit(limit).all()
+        )
+    # Autres bases : repli sur ILIKE (l'insensibilité aux accents demande l'extension unaccent)
+    for term in terms:
+        pattern = f"%{term}%"
+        products = products.filter(or_(models.Product.name.ilike(pattern), models.Product.sku.ilike(pattern), models.Product.category.ilike(pattern)))
+    return products.order_by(models.Product.name, models.Product.id).limit(limit).all()
+
 def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(**product.model_dump())
     db.add(db_product)
+    db.flush()
+    if db_product.stock_quantity:
+        db.add(models.StockMovement(product_id=db_product.id, movement_type=models.StockMovementType.AJUSTEMENT, quantity=db_product.stock_quantity, note="Stock initial"))
+    _bump_table_versions(db, "products")
     db.commit()
     db.refresh(db_product)
     return db_product
 
+def _sku_prefix(name: str):
+    letters = re.sub(r"[^A-Z0-9]", "", unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().upper())
+    return (letters[:3] or "PRD").ljust(3, "X")
+
+def generate_skus(db: Session, names, reserved=()):
+    """
+    SKU uniques (« PREFIXE-00001 ») pour une liste de noms de produits, dans l'ordre des noms.
+    Une seule requête lit les derniers numéros utilisés pour l'ensemble des préfixes ; `reserved` :
+    SKU pas encore en base mais déjà pris (SKU explicites d'un même fichier d'import).
+    """
+    prefixes = [_sku_prefix(name) for name in names]
+    last_numbers = dict.fromkeys(prefixes, 0)
+    existing = db.query(models.Product.sku).filter(func.substr(models.Product.sku, 1, 4).in_([f"{prefix}-" for prefix in last_numbers]))
+    for sku in [row.sku for row in existing] + [sku for sku in reserved if sku[:3] in last_numbers and sku[3:4] == "-"]:
+        suffix = sku[4:]
+        if suffix.isdigit():
+            last_numbers[sku[:3]] = max(last_numbers[sku[:3]], int(suffix))
+    skus = []
+    for prefix in prefixes:
+        last_numbers[prefix] += 1
+        skus.append(f"{prefix}-{last_numbers[prefix]:05d}")
+    return skus
+
+def generate_sku(db: Session, name: str):
+    return generate_skus(db, [name])[0]
+
+PRODUCT_IMPORT_FIELDS = ("sku", "name", "category", "purchase_price", "selling_price", "promo_price", "stock_quantity", "unit", "image_url", "supplier_id")
+
+def import_products(db: Session, rows, user_id: int = None, chunk_size: int = 1000):
+    """
+    Import en masse du catalogue (voir `imports.read_product_file`) : création ou mise à jour sur le SKU.
+    Les lignes sans SKU reçoivent un SKU généré ; le fournisseur est désigné par son nom et, pour un
+    produit existant, les colonnes absentes du fichier conservent leur valeur. Les écarts de stock sont
+    inscrits au journal des mouvements. Les lignes invalides sont ignorées et listées dans le rapport,
+    les autres sont enregistrées en une seule transaction.
+    """
+    rows = [dict(row, row=row.get("row", index)) for index, row in enumerate(rows, start=1)]
+    errors = []
+    # Fournisseurs : une seule requête pour tous les noms du fichier (comparaison insensible à la casse)
+    supplier_names = {str(row["supplier"]).strip().lower() for row in rows if row.get("supplier")}
+    suppliers = dict(db.query(func.lower(models.Supplier.name), models.Supplier.id).filter(func.lower(models.Supplier.name).in_(supplier_names)).all()) if supplier_names else {}
+    without_sku = [row for row in rows if not row.get("sku")]
+    explicit_skus = [str(row["sku"]).strip() for row in rows if row.get("sku")]
+    for row, sku in zip(without_sku, generate_skus(db, [row.get("name", "") for row in without_sku], reserved=explicit_skus)):
+        row["sku"] = sku
+    for row in rows:
+        row["sku"] = str(row["sku"]).strip()
+    # Produits existants lus par lots de SKU : fusion des colonnes absentes et calcul des écarts de stock
+    skus = list({row["sku"] for row in rows})
+    existing = {}
+    for start in range(0, len(skus), chunk_size):
+        for current in db.query(models.Product.id, *[getattr(models.Product, key) for key in PRODUCT_IMPORT_FIELDS]).filter(models.Product.sku.in_(skus[start:start + chunk_size])):
+            existing[current.sku] = current
+    valid, seen = {}, {}
+    for row in rows:
+        supplier = row.pop("supplier", None)
+        if supplier:
+            # Cellule XLSX numérique possible (fournisseur nommé « 3 ») : comparée sous forme de texte
+            supplier = str(supplier).strip()
+            if supplier.lower() not in suppliers:
+                errors.append({"row": row["row"], "sku": row["sku"], "error": f"Fournisseur inconnu : {supplier}"})
+                continue
+            row["supplier_id"] = suppliers[supplier.lower()]
+        if row["sku"] in seen:
+            errors.append({"row": row["row"], "sku": row["sku"], "error": f"SKU en double (déjà présent ligne {seen[row['sku']]})"})
+            continue
+        current = existing.get(row["sku"])
+        defaults = current._asdict() if current else {"stock_quantity": 0}
+        try:
+            product = schemas.ProductCreate(**{**defaults, **{key: row[key] for key in PRODUCT_IMPORT_FIELDS if key in row}})
+        except ValidationError as e:
+            errors.append({"row": row["row"], "sku": row["sku"], "error": "; ".join(f"{'.'.join(map(str, err['loc']))} : {err['msg']}" for err in e.errors())})
+            continue
+        seen[row["sku"]] = row["row"]
+        valid[row["sku"]] = product.model_dump()
+    if not valid:
+        return {"created": 0, "updated": 0, "errors": errors}
+    # Upsert par lots sur la contrainte d'unicité du SKU (executemany)
+    stmt = _dialect_insert(db, models.Product)
+    stmt = stmt.on_conflict_do_update(index_elements=[models.Product.sku], set_={key: stmt.excluded[key] for key in PRODUCT_IMPORT_FIELDS if key != "sku"})
+    values = list(valid.values())
+    for start in range(0, len(values), chunk_size):
+        db.execute(stmt, values[start:start + chunk_size])
+    new_skus = [sku for sku in valid if sku not in existing]
+    new_ids = {}
+    for start in range(0, len(new_skus), chunk_size):
+        new_ids.update(db.query(models.Product.sku, models.Product.id).filter(models.Product.sku.in_(new_skus[start:start + chunk_size])).all())
+    movements = [
+        {"product_id": new_ids[sku], "movement_type": models.StockMovementType.AJUSTEMENT, "quantity": valid[sku]["stock_quantity"], "user_id": user_id, "note": "Stock initial (import)"}
+        for sku in new_skus if valid[sku]["stock_quantity"]
+    ] + [
+        {"product_id": existing[sku].id, "movement_type": models.StockMovementType.AJUSTEMENT, "quantity": data["stock_quantity"] - existing[sku].stock_quantity, "user_id": user_id, "note": "Import catalogue"}
+        for sku, data in valid.items() if sku in existing and data["stock_quantity"] != existing[sku].stock_quantity
+    ]
+    if movements:
+        db.execute(insert(models.StockMovement), movements)
+    # Historique des prix des produits existants dont le prix de vente ou le prix promo change
+    price_changes = [
+        {"product_id": existing[sku].id, "user_id": user_id, "note": "Import catalogue", "old_selling_price": existing[sku].selling_price, "new_selling_price": data["selling_price"],
+         "old_promo_price": existing[sku].promo_price, "new_promo_price": data["promo_price"]}
+        for sku, data in valid.items() if sku in existing and (data["selling_price"], data["promo_price"]) != (existing[sku].selling_price, existing[sku].promo_price)
+    ]
+    if price_changes:
+        db.execute(insert(models.PriceHistory), price_changes)
+    _bump_table_versions(db, "products")
+    db.commit()
+    return {"created": len(new_skus), "updated": len(valid) - len(new_skus), "errors": errors}
+
+def effective_price(product, on: date = None):
+    # Prix promo uniquement s'il est renseigné et que la date tombe dans sa période d'application
+    on = on or date.today()
+    if product.promo_price and product.promo_price > 0 and (product.promo_start is None or product.promo_start <= on) and (product.promo_end is None or on <= product.promo_end):
+        return product.promo_price
+    return product.selling_price
+
+def _effective_price_expr(on: date):
+    # Équivalent SQL de `effective_price`
+    promo_active = and_(
+        models.Product.promo_price > 0,
+        or_(models.Product.promo_start.is_(None), models.Product.promo_start <= on),
+        or_(models.Product.promo_end.is_(None), models.Product.promo_end >= on),
+    )
+    return case((promo_active, models.Product.promo_price), else_=models.Product.selling_price)
+
+def quote_cart(db: Session, items: list, client_id: int = None, on: date = None):
+    """
+    Devis d'un panier [(product_id, quantité), ...] : prix effectifs (promotions du jour comprises) et
+    disponibilités lus en une requête. `ok` est faux si un produit est inconnu ou en stock insuffisant.
+    """
+    on = on or date.today()
+    quantities = {}
+    for product_id, quantity in items:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    rows = {row.id: row for row in db.execute(
+        select(models.Product.id, models.Product.sku, models.Product.name, models.Product.unit, models.Product.stock_quantity,
+               models.Product.selling_price, _effective_price_expr(on).label("unit_price"))
+        .where(models.Product.id.in_(quantities))
+    )} if quantities else {}
+    lines, total, savings = [], 0, 0
+    for product_id, quantity in quantities.items():
+        row = rows.get(product_id)
+        if row is None:
+            # Produit supprimé ou inconnu : même forme de ligne, sans prix ni stock
+            lines.append({"product_id": product_id, "sku": None, "name": None, "unit": None, "quantity": quantity, "unit_price": 0, "regular_price": 0,
+                          "line_total": 0, "available": 0, "in_stock": False})
+            continue
+        line_total = row.unit_price * quantity
+        total += line_total
+        savings += (row.selling_price - row.unit_price) * quantity
+        lines.append({
+            "product_id": product_id, "sku": row.sku, "name": row.name, "unit": row.unit, "quantity": quantity, "unit_price": row.unit_price,
+            "regular_price": row.selling_price, "line_total": line_total, "available": row.stock_quantity, "in_stock": row.stock_quantity >= quantity,
+        })
+    quote = {"lines": lines, "total": total, "savings": savings, "ok": bool(lines) and all(line["in_stock"] for line in lines), "client_id": client_id, "credit": None}
+    if client_id:
+        quote["credit"] = get_client_credit(db, client_id)
+    return quote
+
+def _repricing_filters(repricing: schemas.BulkRepricing):
+    filters = []
+    if repricing.category:
+        filters.append(models.Product.category == repricing.category)
+    if repricing.supplier_id:
+        filters.append(models.Product.supplier_id == repricing.supplier_id)
+    if repricing.skus:
+        filters.append(models.Product.sku.in_(repricing.skus))
+    return filters
+
+def _repricing_values(repricing: schemas.BulkRepricing):
+    # Nouvelles valeurs sous forme d'expressions SQL évaluées ligne à ligne (arrondies à l'ariary) ;
+    # dans un UPDATE elles lisent les anciennes valeurs des colonnes
+    product = models.Product
+    values = {}
+    selling = product.selling_price
+    if repricing.coefficient is not None:
+        selling = values["selling_price"] = func.round(product.purchase_price * repricing.coefficient)
+    elif repricing.percent_change is not None:
+        selling = values["selling_price"] = func.round(product.selling_price * (1 + repricing.percent_change / 100))
+    if repricing.promo_percent is not None:
+        values.update(promo_price=func.round(selling * (1 - repricing.promo_percent / 100)), promo_start=literal(repricing.promo_start, product.promo_start.type), promo_end=literal(repricing.promo_end, product.promo_end.type))
+    elif repricing.clear_promo:
+        values.update(promo_price=literal(None, product.promo_price.type), promo_start=literal(None, product.promo_start.type), promo_end=literal(None, product.promo_end.type))
+    return values
+
+def preview_repricing(db: Session, repricing: schemas.BulkRepricing, limit: int = None):
+    values = _repricing_values(repricing)
+    product = models.Product
+    stmt = select(
+        product.id, product.sku, product.name, product.purchase_price,
+        product.selling_price.label("old_selling_price"), values.get("selling_price", product.selling_price).label("new_selling_price"),
+        product.promo_price.label("old_promo_price"), values.get("promo_price", product.promo_price).label("new_promo_price"),
+        values.get("promo_start", product.promo_start).label("promo_start"), values.get("promo_end", product.promo_end).label("promo_end"),
+    ).where(*_repricing_filters(repricing)).order_by(product.name, product.id).limit(limit)
+    return db.execute(stmt).all()
+
+def apply_repricing(db: Session, repricing: schemas.BulkRepricing, user_id: int = None, note: str = "Révision des prix en masse"):
+    """
+    Applique la révision en une seule instruction UPDATE ; l'historique des prix est écrit juste avant
+    par un INSERT ... SELECT sur la même sélection, dans la même transaction.
+    """
+    values = _repricing_values(repricing)
+    filters = _repricing_filters(repricing)
+    product, history = models.Product, models.PriceHistory
+    db.execute(insert(history).from_select(
+        ["product_id", "user_id", "note", "old_selling_price", "new_selling_price", "old_promo_price", "new_promo_price", "promo_start", "promo_end"],
+        select(
+            product.id, literal(user_id, history.user_id.type), literal(note, history.note.type),
+            product.selling_price, values.get("selling_price", product.selling_price), product.promo_price, values.get("promo_price", product.promo_price),
+            values.get("promo_start", product.promo_start), values.get("promo_end", product.promo_end),
+        ).where(*filters),
+    ))
+    result = db.execute(update(product).where(*filters).values(**values).execution_options(synchronize_session=False))
+    _bump_table_versions(db, "products")
+    db.commit()
+    return result.rowcount
+
+def get_price_history(db: Session, product_id: int, limit: int = 100):
+    return db.query(models.PriceHistory).filter(models.PriceHistory.product_id == product_id).order_by(models.PriceHistory.changed_at.desc(), models.PriceHistory.id.desc()).limit(limit).all()
+
 def update_product(db: Session, product_id: int, product_update: schemas.ProductUpdate):
     db_product = get_product(db, product_id)
     if not db_product: return None
     update_data = product_update.model_dump(exclude_unset=True)
+    new_stock = update_data.pop("stock_quantity", None)
+    old_prices = (db_product.selling_price, db_product.promo_price, db_product.promo_start, db_product.promo_end)
     for key, value in update_data.items():
-        if value is not None:
+        # Les champs de promotion transmis à None sont effacés ; les autres None sont ignorés
+        if value is not None or key in ("promo_price", "promo_start", "promo_end"):
             setattr(db_product, key, value)
+    if (db_product.selling_price, db_product.promo_price, db_product.promo_start, db_product.promo_end) != old_prices:
+        db.add(models.PriceHistory(
+            product_id=db_product.id, old_selling_price=old_prices[0], new_selling_price=db_product.selling_price, old_promo_price=old_prices[1],
+            new_promo_price=db_product.promo_price, promo_start=db_product.promo_start, promo_end=db_product.promo_end, note="Modification manuelle",
+        ))
+    # Une correction manuelle du stock passe par le journal sous forme d'ajustement, appliqué en relatif
+    # par rapport au stock lu : une vente validée entre-temps n'est pas écrasée
+    if new_stock is not None and new_stock != db_product.stock_quantity:
+        delta = new_stock - db_product.stock_quantity
+        if not _apply_stock_delta(db, db_product.id, delta):
+            db.rollback()
+            raise ValueError("Stock insuffisant pour cette correction.")
+        db.add(models.StockMovement(product_id=db_product.id, movement_type=models.StockMovementType.AJUSTEMENT, quantity=delta, note="Correction manuelle"))
+    if update_data:
+        _bump_table_versions(db, "products")
     db.commit()
     db.refresh(db_product)
     return db_product
@@ -57,9 +496,13 @@ def get_supplier(db: Session, supplier_id: int):
 def get_suppliers(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Supplier).order_by(models.Supplier.name).offset(skip).limit(limit).all()
 
+def get_suppliers_page(db: Session, cursor: str = None, limit: int = 50):
+    return _keyset_page(db.query(models.Supplier), [models.Supplier.name, models.Supplier.id], cursor, limit)
+
 def create_supplier(db: Session, supplier: schemas.SupplierCreate):
     db_supplier = models.Supplier(**supplier.model_dump())
     db.add(db_supplier)
+    _bump_table_versions(db, "suppliers")
     db.commit()
     db.refresh(db_supplier)
     return db_supplier
@@ -70,6 +513,7 @@ def update_supplier(db: Session, supplier_id: int, supplier_update: schemas.Supp
     update_data = supplier_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_supplier, key, value)
+    _bump_table_versions(db, "suppliers")
     db.commit()
     db.refresh(db_supplier)
     return db_supplier
@@ -80,6 +524,7 @@ def delete_supplier(db: Session, supplier_id: int):
     if db_supplier.products:
         raise ValueError("Impossible de supprimer. Ce fournisseur est lié à des produits.")
     db.delete(db_supplier)
+    _bump_table_versions(db, "suppliers")
     db.commit()
     return db_supplier
 
@@ -89,9 +534,13 @@ def get_client(db: Session, client_id: int):
 def get_clients(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Client).order_by(models.Client.name).offset(skip).limit(limit).all()
 
+def get_clients_page(db: Session, cursor: str = None, limit: int = 50):
+    return _keyset_page(db.query(models.Client), [models.Client.name, models.Client.id], cursor, limit)
+
 def create_client(db: Session, client: schemas.ClientCreate):
     db_client = models.Client(**client.model_dump())
     db.add(db_client)
+    _bump_table_versions(db, "clients")
     db.commit()
     db.refresh(db_client)
     return db_client
@@ -102,6 +551,7 @@ def update_client(db: Session, client_id: int, client_update: schemas.ClientUpda
     update_data = client_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_client, key, value)
+    _bump_table_versions(db, "clients")
     db.commit()
     db.refresh(db_client)
     return db_client
@@ -112,49 +562,218 @@ def delete_client(db: Session, client_id: int):
     if db_client.sales:
         raise ValueError("Impossible de supprimer. Ce client est lié à des ventes.")
     db.delete(db_client)
+    _bump_table_versions(db, "clients")
     db.commit()
     return db_client
 
 def create_sale(db: Session, sale: schemas.SaleCreate, user_id: int):
-    total_amount = 0
+    if sale.status == models.SaleStatus.CREDIT and not sale.client_id:
+        raise ValueError("Une vente à crédit doit être associée à un client.")
+    # Quantités regroupées par produit (un même produit peut apparaître sur plusieurs lignes)
+    quantities = {}
     for item in sale.items:
-        product = get_product(db, item.product_id)
-        if not product or product.stock_quantity < item.quantity:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if not quantities:
+        raise ValueError("Le panier est vide.")
+    # Une seule requête pour charger tous les produits du panier
+    products = {p.id: p for p in db.query(models.Product).filter(models.Product.id.in_(quantities)).all()}
+    total_amount = cost_of_goods = 0
+    for item in sale.items:
+        product = products.get(item.product_id)
+        if not product or product.stock_quantity < quantities[item.product_id]:
             raise ValueError(f"Stock insuffisant pour le produit: {product.name if product else 'ID inconnu'}")
-        price_to_use = product.promo_price if product.promo_price and product.promo_price > 0 else product.selling_price
+        price_to_use = effective_price(product)
         total_amount += price_to_use * item.quantity
+        cost_of_goods += product.purchase_price * item.quantity
         item.price_per_unit = price_to_use
-    db_sale = models.Sale(total_amount=total_amount, payment_method=sale.payment_method, status=sale.status, client_id=sale.client_id, user_id=user_id)
+    sale_date = models.app_now()
+    db_sale = models.Sale(sale_date=sale_date, total_amount=total_amount, payment_method=sale.payment_method, status=sale.status, client_id=sale.client_id, user_id=user_id)
     db.add(db_sale)
     db.flush()
-    for item in sale.items:
-        db_sale_item = models.SaleItem(quantity=item.quantity, price_per_unit=item.price_per_unit, sale_id=db_sale.id, product_id=item.product_id)
-        db.add(db_sale_item)
-        product = get_product(db, item.product_id)
-        product.stock_quantity -= item.quantity
+    db.execute(insert(models.SaleItem), [{"quantity": item.quantity, "price_per_unit": item.price_per_unit, "unit_cost": products[item.product_id].purchase_price, "sale_id": db_sale.id, "product_id": item.product_id} for item in sale.items])
+    # Décrément atomique et ensembliste : une seule instruction UPDATE gardée par `stock_quantity >= qty`.
+    # Si une vente concurrente a vidé le stock entre-temps, le nombre de lignes modifiées est inférieur
+    # au nombre de produits et toute la transaction est annulée.
+    qty_case = case(quantities, value=models.Product.id)
+    result = db.execute(
+        update(models.Product)
+        .where(models.Product.id.in_(quantities), models.Product.stock_quantity >= qty_case)
+        .values(stock_quantity=models.Product.stock_quantity - qty_case)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(quantities):
+        db.rollback()
+        short = db.query(models.Product.name).filter(models.Product.id.in_(quantities), models.Product.stock_quantity < case(quantities, value=models.Product.id)).first()
+        raise ValueError(f"Stock insuffisant pour le produit: {short.name if short else 'ID inconnu'}")
+    db.execute(insert(models.StockMovement), [{"product_id": product_id, "movement_type": models.StockMovementType.VENTE, "quantity": -quantity, "sale_id": db_sale.id, "user_id": user_id} for product_id, quantity in quantities.items()])
+    if sale.status == models.SaleStatus.CREDIT and not _post_client_entries(db, sale.client_id, [
+        {"entry_type": models.LedgerEntryType.FACTURE, "amount": total_amount, "sale_id": db_sale.id, "user_id": user_id},
+    ], check_limit=True):
+        db.rollback()
+        raise ValueError(f"Plafond de crédit dépassé ou client inconnu (vente de {total_amount:,.2f} Ar).".replace(",", " "))
+    _bump_daily_rollup(
+        db, sale_date, revenue=total_amount, sale_count=1, cost_of_goods=cost_of_goods, realized_profit=total_amount - cost_of_goods,
+        credit_outstanding=total_amount if sale.status == models.SaleStatus.CREDIT else 0,
+    )
     db.commit()
     db.refresh(db_sale)
     return db_sale
 
-def get_sales(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Sale).order_by(models.Sale.sale_date.desc()).offset(skip).limit(limit).all()
+def get_sales(db: Session, skip: int = 0, limit: int = 100, profile: str = "detail"):
+    return _with_profile(db.query(models.Sale), models.Sale, profile).order_by(models.Sale.sale_date.desc()).offset(skip).limit(limit).all()
+
+def get_sales_page(db: Session, cursor: str = None, limit: int = 50, status: models.SaleStatus = None, client_id: int = None, oldest_first: bool = False, profile: str = "list"):
+    query = _with_profile(db.query(models.Sale), models.Sale, profile)
+    if status:
+        query = query.filter(models.Sale.status == status)
+    if client_id:
+        query = query.filter(models.Sale.client_id == client_id)
+    return _keyset_page(query, [models.Sale.sale_date, models.Sale.id], cursor, limit, descending=not oldest_first)
+
+def get_sale(db: Session, sale_id: int, profile: str = "detail"):
+    return _with_profile(db.query(models.Sale), models.Sale, profile).filter(models.Sale.id == sale_id).first()
+
+def get_client_profile(db: Session, client_id: int):
+    # Fiche client en une requête : les agrégats sont des sous-requêtes corrélées servies par l'index (client_id, sale_date)
+    sales = select(models.Sale.id).where(models.Sale.client_id == models.Client.id)
+    row = db.execute(select(
+        models.Client,
+        sales.with_only_columns(func.count(models.Sale.id)).scalar_subquery().label("sale_count"),
+        sales.with_only_columns(func.coalesce(func.sum(models.Sale.total_amount), 0)).scalar_subquery().label("total_spent"),
+        sales.with_only_columns(func.max(models.Sale.sale_date)).scalar_subquery().label("last_sale_date"),
+    ).where(models.Client.id == client_id)).first()
+    if row is None: return None
+    return {**schemas.Client.model_validate(row.Client).model_dump(), "sale_count": row.sale_count, "total_spent": row.total_spent, "last_sale_date": row.last_sale_date}
 
-def get_sale(db: Session, sale_id: int):
-    return db.query(models.Sale).filter(models.Sale.id == sale_id).first()
+def get_sales_by_client(db: Session, client_id: int, profile: str = "detail"):
+    return _with_profile(db.query(models.Sale), models.Sale, profile).filter(models.Sale.client_id == client_id).order_by(models.Sale.sale_date.desc()).all()
 
-def get_sales_by_client(db: Session, client_id: int):
-    return db.query(models.Sale).filter(models.Sale.client_id == client_id).order_by(models.Sale.sale_date.desc()).all()
+# --- Facturation en lot : ventes lues par pages pour invoices.iter_invoice_archive ---
+def iter_sales_for_invoicing(db: Session, start_date: date = None, end_date: date = None, client_id: int = None, status: models.SaleStatus = None, batch_size: int = 200):
+    """
+    Ventes à facturer en lot, dans l'ordre chronologique, avec le profil "invoice" : une requête par page
+    de `batch_size` ventes (plus le chargement groupé de leurs lignes). Rend (nombre total, itérateur).
+    """
+    query = db.query(models.Sale)
+    if start_date and end_date:
+        start, end = _day_range(start_date, end_date)
+        query = query.filter(models.Sale.sale_date >= start, models.Sale.sale_date < end)
+    if client_id:
+        query = query.filter(models.Sale.client_id == client_id)
+    if status:
+        query = query.filter(models.Sale.status == status)
+    total = query.with_entities(func.count(models.Sale.id)).scalar()
+    def batches():
+        # Pages par clé (date, id) : yield_per n'est pas compatible avec le chargement groupé des lignes
+        cursor = None
+        while True:
+            sales, cursor = _keyset_page(_with_profile(query, models.Sale, "invoice"), [models.Sale.sale_date, models.Sale.id], cursor, batch_size)
+            yield from sales
+            if cursor is None:
+                return
+    return total, batches()
 
 # --- MODIFICATION DE LA FONCTION ---
 def settle_credit_sale(db: Session, sale_id: int, payment_method: str):
-    db_sale = get_sale(db, sale_id)
+    # Règlement du reste dû d'une vente ; passe par le compte client quand la vente en a un
+    db_sale = get_sale(db, sale_id, profile=None)
     if not db_sale: return None
+    if db_sale.status == models.SaleStatus.CREDIT and db_sale.client_id:
+        record_client_payment(db, db_sale.client_id, db_sale.total_amount - db_sale.amount_paid, payment_method, sale_id=db_sale.id)
+        db.refresh(db_sale)
+        return db_sale
+    if db_sale.status == models.SaleStatus.CREDIT:
+        _bump_daily_rollup(db, db_sale.sale_date, credit_outstanding=-(db_sale.total_amount - db_sale.amount_paid))
+        db_sale.amount_paid = db_sale.total_amount
     db_sale.status = models.SaleStatus.PAYEE
     db_sale.payment_method = payment_method # On met à jour le mode de paiement
     db.commit()
     db.refresh(db_sale)
     return db_sale
 
+# --- Compte client ---
+def _post_client_entries(db: Session, client_id: int, entries: list, check_limit: bool = False):
+    """
+    Écritures du compte client et mise à jour de `Client.balance` par un seul UPDATE sur la clé primaire.
+    Avec `check_limit`, l'UPDATE est gardé par le plafond d'encours : rend False (rien n'est modifié) s'il serait dépassé.
+    """
+    delta = sum(entry["amount"] for entry in entries)
+    conditions = [models.Client.id == client_id]
+    if check_limit:
+        conditions.append(or_(models.Client.credit_limit.is_(None), models.Client.balance + delta <= models.Client.credit_limit))
+    result = db.execute(update(models.Client).where(*conditions).values(balance=models.Client.balance + delta).execution_options(synchronize_session=False))
+    if result.rowcount != 1:
+        return False
+    db.execute(insert(models.ClientLedgerEntry), [{"client_id": client_id, **entry} for entry in entries])
+    return True
+
+def get_client_credit(db: Session, client_id: int):
+    # Encours et plafond d'un client : une lecture sur la clé primaire (contrôle en caisse)
+    row = db.execute(select(models.Client.balance, models.Client.credit_limit).where(models.Client.id == client_id)).first()
+    if row is None: return None
+    available = None if row.credit_limit is None else max(row.credit_limit - row.balance, 0)
+    return {"balance": row.balance, "credit_limit": row.credit_limit, "available": available}
+
+def _settle_client_sales(db: Session, client_id: int, amount: float, entry_type: models.LedgerEntryType, payment_method: str = None,
+                         sale_id: int = None, note: str = None, user_id: int = None):
+    # Imputation sur la vente indiquée ou, à défaut, sur les ventes à crédit les plus anciennes du client
+    query = db.query(models.Sale).filter(models.Sale.client_id == client_id, models.Sale.status == models.SaleStatus.CREDIT)
+    if sale_id:
+        query = query.filter(models.Sale.id == sale_id)
+    open_sales = query.order_by(models.Sale.sale_date, models.Sale.id).with_for_update().all()
+    outstanding = round(sum(s.total_amount - s.amount_paid for s in open_sales), 2)
+    if amount > outstanding + 0.005:
+        raise ValueError(f"Montant supérieur au reste dû ({outstanding:,.2f} Ar).".replace(",", " "))
+    entries, remaining = [], amount
+    for db_sale in open_sales:
+        applied = round(min(remaining, db_sale.total_amount - db_sale.amount_paid), 2)
+        if applied <= 0:
+            break
+        db_sale.amount_paid += applied
+        if db_sale.amount_paid >= db_sale.total_amount - 0.005:
+            db_sale.status = models.SaleStatus.PAYEE
+            if payment_method:
+                db_sale.payment_method = payment_method
+        _bump_daily_rollup(db, db_sale.sale_date, credit_outstanding=-applied)
+        entries.append({"entry_type": entry_type, "amount": -applied, "payment_method": payment_method, "note": note, "sale_id": db_sale.id, "user_id": user_id})
+        remaining -= applied
+    if not entries or not _post_client_entries(db, client_id, entries):
+        db.rollback()
+        raise ValueError("Aucune vente à crédit à régler pour ce client.")
+    db.commit()
+    return {"applied": amount, "allocations": [{"sale_id": e["sale_id"], "amount": -e["amount"]} for e in entries], "balance": get_client_credit(db, client_id)["balance"]}
+
+def record_client_payment(db: Session, client_id: int, amount: float, payment_method: str, sale_id: int = None, note: str = None, user_id: int = None):
+    return _settle_client_sales(db, client_id, amount, models.LedgerEntryType.PAIEMENT, payment_method, sale_id, note, user_id)
+
+def record_credit_note(db: Session, client_id: int, amount: float, note: str, sale_id: int = None, user_id: int = None):
+    return _settle_client_sales(db, client_id, amount, models.LedgerEntryType.AVOIR, None, sale_id, note, user_id)
+
+def get_client_ledger_page(db: Session, client_id: int, cursor: str = None, limit: int = 50):
+    query = db.query(models.ClientLedgerEntry).filter(models.ClientLedgerEntry.client_id == client_id)
+    return _keyset_page(query, [models.ClientLedgerEntry.entry_date, models.ClientLedgerEntry.id], cursor, limit, descending=True)
+
+# Tranches d'ancienneté des créances (jours écoulés depuis la vente, bornes incluses)
+AGING_BUCKETS = {"days_0_30": ("0-30 j", 0, 30), "days_31_60": ("31-60 j", 31, 60), "days_61_90": ("61-90 j", 61, 90), "days_over_90": ("+90 j", 91, None)}
+
+def get_aged_receivables(db: Session, as_of: date = None):
+    """Balance âgée par client, calculée en SQL sur les ventes à crédit (index (status, sale_date))."""
+    as_of = as_of or date.today()
+    due = models.Sale.total_amount - models.Sale.amount_paid
+    buckets = []
+    for key, (label, low, high) in AGING_BUCKETS.items():
+        # Âge dans [low, high] jours <=> vente dans [as_of - high, lendemain de as_of - low[
+        start, end = _day_range(as_of - timedelta(days=high if high is not None else 0), as_of - timedelta(days=low))
+        conditions = [models.Sale.sale_date < end] + ([models.Sale.sale_date >= start] if high is not None else [])
+        buckets.append(func.sum(case((and_(*conditions), due), else_=0)).label(key))
+    return db.execute(
+        select(models.Client.id.label("client_id"), models.Client.name, models.Client.credit_limit, *buckets, func.sum(due).label("total"))
+        .join(models.Client, models.Sale.client_id == models.Client.id)
+        .where(models.Sale.status == models.SaleStatus.CREDIT)
+        .group_by(models.Client.id, models.Client.name, models.Client.credit_limit)
+        .order_by(func.sum(due).desc())
+    ).all()
+
 def create_purchase_order(db: Session, order: schemas.PurchaseOrderCreate):
     total_cost = sum(item.purchase_price_per_unit * item.quantity for item in order.items)
     db_order = models.PurchaseOrder(total_cost=total_cost, supplier_id=order.supplier_id, status=models.OrderStatus.EN_COURS)
@@ -167,91 +786,400 @@ def create_purchase_order(db: Session, order: schemas.PurchaseOrderCreate):
     db.refresh(db_order)
     return db_order
 
-def get_purchase_orders(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.PurchaseOrder).order_by(models.PurchaseOrder.order_date.desc()).offset(skip).limit(limit).all()
+def get_purchase_orders(db: Session, skip: int = 0, limit: int = 100, profile: str = "detail"):
+    return _with_profile(db.query(models.PurchaseOrder), models.PurchaseOrder, profile).order_by(models.PurchaseOrder.order_date.desc()).offset(skip).limit(limit).all()
+
+def get_purchase_orders_page(db: Session, cursor: str = None, limit: int = 50, status: models.OrderStatus = None, supplier_id: int = None, profile: str = "list"):
+    query = _with_profile(db.query(models.PurchaseOrder), models.PurchaseOrder, profile)
+    if status:
+        query = query.filter(models.PurchaseOrder.status == status)
+    if supplier_id:
+        query = query.filter(models.PurchaseOrder.supplier_id == supplier_id)
+    return _keyset_page(query, [models.PurchaseOrder.order_date, models.PurchaseOrder.id], cursor, limit, descending=True)
+
+def get_supplier_profile(db: Session, supplier_id: int):
+    # Fiche fournisseur en une requête : nombre de produits, commandes (total, en cours) et dernière activité
+    orders = select(models.PurchaseOrder.id).where(models.PurchaseOrder.supplier_id == models.Supplier.id)
+    row = db.execute(select(
+        models.Supplier,
+        select(func.count(models.Product.id)).where(models.Product.supplier_id == models.Supplier.id).scalar_subquery().label("product_count"),
+        orders.with_only_columns(func.count(models.PurchaseOrder.id)).scalar_subquery().label("order_count"),
+        orders.with_only_columns(func.coalesce(func.sum(models.PurchaseOrder.total_cost), 0)).scalar_subquery().label("total_spent"),
+        orders.with_only_columns(func.count(models.PurchaseOrder.id)).where(models.PurchaseOrder.status == models.OrderStatus.EN_COURS).scalar_subquery().label("pending_orders"),
+        orders.with_only_columns(func.max(models.PurchaseOrder.order_date)).scalar_subquery().label("last_order_date"),
+        orders.with_only_columns(func.max(models.PurchaseOrder.reception_date)).scalar_subquery().label("last_reception_date"),
+    ).where(models.Supplier.id == supplier_id)).first()
+    if row is None: return None
+    return {**schemas.Supplier.model_validate(row.Supplier).model_dump(), **{key: getattr(row, key) for key in ("product_count", "order_count", "total_spent", "pending_orders", "last_order_date", "last_reception_date")}}
 
-def get_orders_by_supplier(db: Session, supplier_id: int):
-    return db.query(models.PurchaseOrder).filter(models.PurchaseOrder.supplier_id == supplier_id).order_by(models.PurchaseOrder.order_date.desc()).all()
+def get_orders_by_supplier(db: Session, supplier_id: int, profile: str = "detail"):
+    return _with_profile(db.query(models.PurchaseOrder), models.PurchaseOrder, profile).filter(models.PurchaseOrder.supplier_id == supplier_id).order_by(models.PurchaseOrder.order_date.desc()).all()
+
+# --- Réapprovisionnement : données de reorder.py ---
+def get_demand_watermark(db: Session):
+    return db.query(func.max(models.ProductDemand.through_sale_item_id)).scalar() or 0
+
+def get_last_sale_item_id(db: Session):
+    return db.query(func.max(models.SaleItem.id)).scalar() or 0
+
+def get_sales_velocity_extract(db: Session, since_item_id: int, through_item_id: int, start_date: date, stale_before: datetime = None, window_days: int = None):
+    """
+    Extrait compact pour le calcul de la demande : identifiants des produits vendus dans les lignes
+    ]since_item_id, through_item_id], plus ceux dont la demande non nulle a été calculée avant `stale_before`
+    ou sur une autre fenêtre, et leurs ventes (produit, date, quantité) depuis `start_date`.
+    """
+    sold = select(models.SaleItem.product_id).where(models.SaleItem.id > since_item_id, models.SaleItem.id <= through_item_id)
+    if stale_before is not None:
+        # La fenêtre a glissé depuis le calcul : des ventes en sont sorties, la demande doit baisser même sans nouvelle vente
+        stale = or_(models.ProductDemand.computed_at < stale_before, models.ProductDemand.window_days != window_days)
+        sold = union(sold, select(models.ProductDemand.product_id).where(models.ProductDemand.daily_mean > 0, stale))
+    else:
+        sold = sold.distinct()
+    product_ids = db.execute(sold).scalars().all()
+    rows = db.execute(
+        select(models.SaleItem.product_id, models.Sale.sale_date, models.SaleItem.quantity)
+        .join(models.Sale, models.SaleItem.sale_id == models.Sale.id)
+        .where(models.SaleItem.product_id.in_(sold), models.SaleItem.id <= through_item_id, models.Sale.sale_date >= datetime.combine(start_date, datetime.min.time()))
+    ).all()
+    return product_ids, rows
+
+def save_product_demand(db: Session, rows: list, chunk_size: int = 500):
+    for i in range(0, len(rows), chunk_size):
+        stmt = _dialect_insert(db, models.ProductDemand).values(rows[i:i + chunk_size])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[models.ProductDemand.product_id],
+            set_={key: stmt.excluded[key] for key in ("daily_mean", "daily_std", "window_days", "through_sale_item_id", "computed_at")},
+        ))
+    db.commit()
+
+def get_reorder_candidates(db: Session):
+    # Produits ayant une demande, avec le délai de leur fournisseur et les quantités déjà en commande
+    on_order = (
+        select(models.PurchaseOrderItem.product_id, func.sum(models.PurchaseOrderItem.quantity).label("quantity"))
+        .join(models.PurchaseOrder, models.PurchaseOrderItem.order_id == models.PurchaseOrder.id)
+        .where(models.PurchaseOrder.status == models.OrderStatus.EN_COURS)
+        .group_by(models.PurchaseOrderItem.product_id)
+        .subquery()
+    )
+    return db.execute(
+        select(models.Product.id, models.Product.sku, models.Product.name, models.Product.unit, models.Product.stock_quantity, models.Product.purchase_price,
+               models.Product.supplier_id, models.Supplier.name.label("supplier_name"), models.Supplier.lead_time_days,
+               models.ProductDemand.daily_mean, models.ProductDemand.daily_std, func.coalesce(on_order.c.quantity, 0).label("on_order"))
+        .join(models.ProductDemand, models.ProductDemand.product_id == models.Product.id)
+        .outerjoin(models.Supplier, models.Product.supplier_id == models.Supplier.id)
+        .outerjoin(on_order, on_order.c.product_id == models.Product.id)
+        .where(models.ProductDemand.daily_mean > 0)
+        .order_by(models.Product.supplier_id, models.Product.name)
+    ).all()
 
 def receive_purchase_order(db: Session, order_id: int):
     db_order = db.query(models.PurchaseOrder).filter(models.PurchaseOrder.id == order_id).first()
     if not db_order or db_order.status == models.OrderStatus.RECUE: return None
+    quantities = {}
     for item in db_order.items:
-        product = get_product(db, item.product_id)
-        if product: product.stock_quantity += item.quantity
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    existing_ids = [row.id for row in db.query(models.Product.id).filter(models.Product.id.in_(quantities))]
+    if existing_ids:
+        qty_case = case(quantities, value=models.Product.id)
+        db.execute(update(models.Product).where(models.Product.id.in_(existing_ids)).values(stock_quantity=models.Product.stock_quantity + qty_case).execution_options(synchronize_session=False))
+        db.execute(insert(models.StockMovement), [{"product_id": product_id, "movement_type": models.StockMovementType.RECEPTION, "quantity": quantities[product_id], "order_id": db_order.id} for product_id in existing_ids])
     db_order.status = models.OrderStatus.RECUE
-    db_order.reception_date = datetime.now()
+    db_order.reception_date = models.app_now()
+    _bump_daily_rollup(db, db_order.reception_date, purchases_received=db_order.total_cost)
     db.commit()
     db.refresh(db_order)
     return db_order
 
+def _apply_stock_delta(db: Session, product_id: int, delta: float):
+    # Variation relative gardée : une sortie ne peut pas rendre le stock négatif. Rend False si rien n'a été modifié.
+    conditions = [models.Product.id == product_id]
+    if delta < 0:
+        conditions.append(models.Product.stock_quantity >= -delta)
+    result = db.execute(update(models.Product).where(*conditions).values(stock_quantity=models.Product.stock_quantity + delta).execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+def record_stock_movement(db: Session, movement: schemas.StockMovementCreate, user_id: int = None):
+    # Ajustements d'inventaire et retours clients
+    if not _apply_stock_delta(db, movement.product_id, movement.quantity):
+        db.rollback()
+        raise ValueError("Produit introuvable ou stock insuffisant pour ce mouvement.")
+    db_movement = models.StockMovement(**movement.model_dump(), user_id=user_id)
+    db.add(db_movement)
+    db.commit()
+    db.refresh(db_movement)
+    return db_movement
+
+def get_stock_movements(db: Session, product_id: int, start_date: date = None, end_date: date = None, limit: int = 500):
+    query = db.query(models.StockMovement).filter(models.StockMovement.product_id == product_id)
+    if start_date:
+        query = query.filter(models.StockMovement.movement_date >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        query = query.filter(models.StockMovement.movement_date < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return query.order_by(models.StockMovement.movement_date.desc(), models.StockMovement.id.desc()).limit(limit).all()
+
+def get_stock_at(db: Session, product_id: int, at: datetime):
+    return db.query(func.coalesce(func.sum(models.StockMovement.quantity), 0)).filter(models.StockMovement.product_id == product_id, models.StockMovement.movement_date <= at).scalar()
+
+def seed_stock_ledger(db: Session):
+    # Mouvement d'ouverture pour les produits dont le stock existait avant le journal
+    has_movement = db.query(models.StockMovement.id).filter(models.StockMovement.product_id == models.Product.id).exists()
+    opening = select(
+        models.Product.id, literal(models.StockMovementType.AJUSTEMENT, models.StockMovement.movement_type.type),
+        models.Product.stock_quantity, literal("Solde d'ouverture")
+    ).where(models.Product.stock_quantity != 0, ~has_movement)
+    result = db.execute(insert(models.StockMovement).from_select(["product_id", "movement_type", "quantity", "note"], opening))
+    db.commit()
+    return result.rowcount
+
+def seed_client_ledger(db: Session):
+    # Écriture d'ouverture pour les ventes à crédit antérieures au compte client, puis soldes recalculés
+    has_entry = db.query(models.ClientLedgerEntry.id).filter(models.ClientLedgerEntry.sale_id == models.Sale.id).exists()
+    opening = select(
+        models.Sale.client_id, models.Sale.id, models.Sale.sale_date, literal(models.LedgerEntryType.FACTURE, models.ClientLedgerEntry.entry_type.type),
+        models.Sale.total_amount - models.Sale.amount_paid, literal("Solde d'ouverture")
+    ).where(models.Sale.status == models.SaleStatus.CREDIT, models.Sale.client_id.isnot(None), ~has_entry)
+    result = db.execute(insert(models.ClientLedgerEntry).from_select(["client_id", "sale_id", "entry_date", "entry_type", "amount", "note"], opening))
+    if result.rowcount:
+        reconcile_client_balances(db)
+    db.commit()
+    return result.rowcount
+
+def reconcile_client_balances(db: Session):
+    # Recalcule `Client.balance` depuis le journal du compte client ; renvoie le nombre de clients corrigés
+    ledger = select(func.coalesce(func.sum(models.ClientLedgerEntry.amount), 0)).where(models.ClientLedgerEntry.client_id == models.Client.id).scalar_subquery()
+    result = db.execute(update(models.Client).where(func.abs(models.Client.balance - ledger) > 0.005).values(balance=ledger).execution_options(synchronize_session=False))
+    db.commit()
+    return result.rowcount
+
+def reconcile_stock_snapshots(db: Session, batch_size: int = 1000):
+    # Recalcule `stock_quantity` depuis le journal en une seule passe en flux ; renvoie le nombre de produits corrigés
+    ledger = select(models.StockMovement.product_id, func.sum(models.StockMovement.quantity).label("on_hand")).group_by(models.StockMovement.product_id).subquery()
+    stmt = (
+        select(models.Product.id, models.Product.stock_quantity, func.coalesce(ledger.c.on_hand, 0))
+        .outerjoin(ledger, ledger.c.product_id == models.Product.id)
+        .order_by(models.Product.id)
+        .execution_options(yield_per=batch_size)
+    )
+    # Seuls les écarts sont conservés, puis corrigés par lots (executemany sur la clé primaire)
+    fixes = [{"id": product_id, "stock_quantity": on_hand} for product_id, snapshot, on_hand in db.execute(stmt) if abs(snapshot - on_hand) > 1e-9]
+    for start in range(0, len(fixes), batch_size):
+        db.execute(update(models.Product), fixes[start:start + batch_size])
+    db.commit()
+    return len(fixes)
+
+# Types des paramètres non textuels : convertis une seule fois au chargement du cache
+SETTING_TYPES = {"tvaRate": float}
+
+def _parse_setting(key, value):
+    parser = SETTING_TYPES.get(key)
+    if parser is None or value in (None, ""):
+        return value
+    try:
+        return parser(value)
+    except ValueError:
+        return value
+
 def get_settings(db: Session):
-    settings = db.query(models.Setting).all()
-    return {s.key: s.value for s in settings}
+    def load():
+        return {s.key: _parse_setting(s.key, s.value) for s in db.query(models.Setting).populate_existing()}
+    # Copie : l'appelant peut modifier le dictionnaire sans altérer le cache
+    return dict(_reference_cache.get_or_load("settings", get_table_versions(db, "settings"), load))
 
 def update_settings(db: Session, settings_data: dict):
-    for key, value in settings_data.items():
-        db_setting = db.query(models.Setting).filter(models.Setting.key == key).first()
-        if db_setting:
-            db_setting.value = str(value)
-        else:
-            db_setting = models.Setting(key=key, value=str(value))
-            db.add(db_setting)
-    db.commit()
+    # Un seul INSERT ... ON CONFLICT DO UPDATE pour toutes les clés
+    if settings_data:
+        stmt = _dialect_insert(db, models.Setting).values([{"key": key, "value": None if value is None else str(value)} for key, value in settings_data.items()])
+        db.execute(stmt.on_conflict_do_update(index_elements=[models.Setting.key], set_={"value": stmt.excluded.value}))
+        _bump_table_versions(db, "settings")
+        db.commit()
     return get_settings(db)
 
 def get_dashboard_kpis(db: Session):
-    today = date.today()
-    start_of_today = datetime.combine(today, datetime.min.time())
-    ca_jour = db.query(func.sum(models.Sale.total_amount)).filter(models.Sale.sale_date >= start_of_today).scalar() or 0
-    nb_ventes = db.query(func.count(models.Sale.id)).filter(models.Sale.sale_date >= start_of_today).scalar() or 0
+    today = db.get(models.DailySalesRollup, date.today())
+    ca_jour = today.revenue if today else 0
+    nb_ventes = today.sale_count if today else 0
     valeur_stock_query = db.query(func.sum(models.Product.purchase_price * models.Product.stock_quantity)).scalar()
     valeur_stock = valeur_stock_query or 0
-    total_achats = db.query(func.sum(models.PurchaseOrder.total_cost)).filter(models.PurchaseOrder.status == models.OrderStatus.RECUE).scalar() or 0
+    total_achats = db.query(func.sum(models.DailySalesRollup.purchases_received)).scalar() or 0
     return {"kpi_ca_jour": ca_jour, "kpi_nb_ventes": nb_ventes, "kpi_valeur_stock": valeur_stock, "kpi_total_achats": total_achats}
 
 def get_low_stock_products(db: Session, threshold: int = 10):
     return db.query(models.Product).filter(and_(models.Product.stock_quantity > 0, models.Product.stock_quantity < threshold)).all()
 
 def get_finance_kpis(db: Session):
-    today = date.today()
-    start_of_today = datetime.combine(today, datetime.min.time())
     projected_profit_query = db.query(func.sum((models.Product.selling_price - models.Product.purchase_price) * models.Product.stock_quantity)).scalar()
     projected_profit = projected_profit_query or 0
-    today_sales_items = db.query(models.SaleItem).join(models.Sale).filter(models.Sale.sale_date >= start_of_today).all()
-    real_profit_today = sum((item.price_per_unit - item.product.purchase_price) * item.quantity for item in today_sales_items if item.product)
-    total_credits_query = db.query(func.sum(models.Sale.total_amount)).filter(models.Sale.status == models.SaleStatus.CREDIT).scalar()
-    total_credits = total_credits_query or 0
+    today = db.get(models.DailySalesRollup, date.today())
+    real_profit_today = today.realized_profit if today else 0
+    total_credits = db.query(func.sum(models.DailySalesRollup.credit_outstanding)).scalar() or 0
     return {"projected_profit": projected_profit, "real_profit_today": real_profit_today, "total_credits": total_credits}
 
 def get_monthly_sales_chart_data(db: Session, year: int):
-    sales_data = db.query(extract('month', models.Sale.sale_date).label('month'), func.sum(models.Sale.total_amount).label('total')).filter(extract('year', models.Sale.sale_date) == year).group_by('month').all()
+    sales_data = db.query(extract('month', models.DailySalesRollup.day).label('month'), func.sum(models.DailySalesRollup.revenue).label('total')).filter(
+        models.DailySalesRollup.day >= date(year, 1, 1), models.DailySalesRollup.day < date(year + 1, 1, 1)
+    ).group_by('month').all()
     monthly_totals = [0.0] * 12
     for row in sales_data:
         monthly_totals[int(row.month) - 1] = float(row.total)
     return monthly_totals
 
-def get_sales_in_date_range(db: Session, start_date: date, end_date: date):
-    start_datetime = datetime.combine(start_date, datetime.min.time())
-    end_datetime = datetime.combine(end_date, datetime.max.time())
-    return db.query(models.Sale).filter(models.Sale.sale_date.between(start_datetime, end_datetime)).all()
+def rebuild_daily_sales_rollup(db: Session):
+    # Reconstruit entièrement les agrégats journaliers depuis les ventes et commandes reçues
+    rollup = {}
+    def row_for(day):
+        day = date.fromisoformat(day) if isinstance(day, str) else day
+        return rollup.setdefault(day, {"day": day, "revenue": 0, "sale_count": 0, "cost_of_goods": 0, "realized_profit": 0, "credit_outstanding": 0, "purchases_received": 0})
+    sale_day = func.date(models.Sale.sale_date)
+    sales = db.query(
+        sale_day, func.sum(models.Sale.total_amount), func.count(models.Sale.id),
+        func.sum(case((models.Sale.status == models.SaleStatus.CREDIT, models.Sale.total_amount), else_=0)),
+    ).group_by(sale_day)
+    for day, revenue, count, credit in sales:
+        row = row_for(day)
+        row.update(revenue=revenue or 0, sale_count=count, credit_outstanding=credit or 0, realized_profit=revenue or 0)
+    costs = db.query(sale_day, func.sum(models.SaleItem.quantity * models.SaleItem.unit_cost)).select_from(models.SaleItem).join(models.Sale).group_by(sale_day)
+    for day, cost in costs:
+        row = row_for(day)
+        row["cost_of_goods"] = cost or 0
+        row["realized_profit"] -= cost or 0
+    reception_day = func.date(models.PurchaseOrder.reception_date)
+    receptions = db.query(reception_day, func.sum(models.PurchaseOrder.total_cost)).filter(models.PurchaseOrder.status == models.OrderStatus.RECUE).group_by(reception_day)
+    for day, total in receptions:
+        if day is not None:
+            row_for(day)["purchases_received"] = total or 0
+    db.query(models.DailySalesRollup).delete()
+    if rollup:
+        db.execute(insert(models.DailySalesRollup), list(rollup.values()))
+    db.commit()
+    return len(rollup)
+
+def _day_range(start_date: date, end_date: date):
+    # Bornes semi-ouvertes [début, lendemain de la fin[ : prédicat de plage utilisable par les index
+    return datetime.combine(start_date, datetime.min.time()), datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+
+def get_sales_in_date_range(db: Session, start_date: date, end_date: date, profile: str = "list"):
+    start, end = _day_range(start_date, end_date)
+    return _with_profile(db.query(models.Sale), models.Sale, profile).filter(models.Sale.sale_date >= start, models.Sale.sale_date < end).all()
 
-def get_received_orders_in_date_range(db: Session, start_date: date, end_date: date):
-    start_datetime = datetime.combine(start_date, datetime.min.time())
-    end_datetime = datetime.combine(end_date, datetime.max.time())
-    return db.query(models.PurchaseOrder).filter(
+REPORT_GROUPINGS = {"day": "Jour", "week": "Semaine", "month": "Mois", "product": "Produit", "category": "Catégorie", "client": "Client", "supplier": "Fournisseur", "user": "Vendeur"}
+REPORT_COLUMNS = ["Clé", "Libellé", "Nb ventes", "Quantité", "CA", "Coût", "Marge"]
+
+def _date_bucket(db: Session, column, grain: str):
+    # Clé calendaire textuelle et triable, calculée par la base ; semaines ISO 8601 sur les deux moteurs
+    if db.get_bind().dialect.name == "sqlite":
+        if grain == "week":
+            # Le jeudi de la semaine ISO fixe son année, et son rang dans l'année le numéro de semaine
+            thursday = func.date(column, "-3 days", "weekday 4")
+            return func.printf("%s-S%02d", func.strftime("%Y", thursday), (cast(func.strftime("%j", thursday), Integer) - 1) // 7 + 1)
+        return func.strftime({"day": "%Y-%m-%d", "month": "%Y-%m"}[grain], column)
+    return func.to_char(column, {"day": "YYYY-MM-DD", "week": 'IYYY-"S"IW', "month": "YYYY-MM"}[grain])
+
+def get_report(db: Session, start_date: date, end_date: date, group_by: str = "day"):
+    """
+    Agrégats des ventes de la période calculés en SQL : un tuple
+    (clé, libellé, nb ventes, quantité, CA, coût, marge) par groupe.
+    """
+    if group_by not in REPORT_GROUPINGS:
+        raise ValueError(f"Regroupement inconnu : {group_by}")
+    start, end = _day_range(start_date, end_date)
+    revenue = func.sum(models.SaleItem.quantity * models.SaleItem.price_per_unit)
+    cost = func.sum(models.SaleItem.quantity * func.coalesce(models.SaleItem.unit_cost, 0))
+    if group_by in ("day", "week", "month"):
+        key = label = _date_bucket(db, models.Sale.sale_date, group_by)
+    elif group_by == "product":
+        key, label = models.Product.id, models.Product.name
+    elif group_by == "category":
+        key = label = func.coalesce(models.Product.category, "Non classé")
+    elif group_by == "client":
+        key, label = models.Sale.client_id, func.coalesce(models.Client.name, "Comptoir")
+    elif group_by == "supplier":
+        key, label = models.Product.supplier_id, func.coalesce(models.Supplier.name, "Sans fournisseur")
+    else:
+        key, label = models.User.id, models.User.username
+    stmt = (
+        select(key.label("key"), label.label("label"), func.count(distinct(models.Sale.id)).label("sale_count"), func.sum(models.SaleItem.quantity).label("quantity"),
+               revenue.label("revenue"), cost.label("cost"), (revenue - cost).label("margin"))
+        .select_from(models.SaleItem)
+        .join(models.Sale, models.SaleItem.sale_id == models.Sale.id)
+        .where(models.Sale.sale_date >= start, models.Sale.sale_date < end)
+    )
+    if group_by in ("product", "category", "supplier"):
+        stmt = stmt.join(models.Product, models.SaleItem.product_id == models.Product.id)
+    if group_by == "supplier":
+        stmt = stmt.outerjoin(models.Supplier, models.Product.supplier_id == models.Supplier.id)
+    elif group_by == "client":
+        stmt = stmt.outerjoin(models.Client, models.Sale.client_id == models.Client.id)
+    elif group_by == "user":
+        stmt = stmt.join(models.User, models.Sale.user_id == models.User.id)
+    # Périodes dans l'ordre chronologique, autres regroupements du plus gros CA au plus petit
+    stmt = stmt.group_by(key, label).order_by(key if group_by in ("day", "week", "month") else revenue.desc())
+    return db.execute(stmt).all()
+
+SALES_EXPORT_COLUMNS = ["N° Vente", "Date", "Client", "Vendeur", "Mode de paiement", "Statut", "Montant"]
+
+def iter_sales_export_rows(db: Session, start_date: date, end_date: date, batch_size: int = 1000, limit: int = None):
+    # Colonnes jointes sélectionnées d'emblée, lues en flux (curseur serveur) : aucun objet ORM, aucun lazy load.
+    # `limit` borne la lecture (aperçu ou export plafonné de l'interface)
+    start, end = _day_range(start_date, end_date)
+    stmt = (
+        select(models.Sale.id, models.Sale.sale_date, func.coalesce(models.Client.name, "Comptoir"), models.User.username,
+               models.Sale.payment_method, models.Sale.status, models.Sale.total_amount)
+        .outerjoin(models.Client, models.Sale.client_id == models.Client.id)
+        .join(models.User, models.Sale.user_id == models.User.id)
+        .where(models.Sale.sale_date >= start, models.Sale.sale_date < end)
+        .order_by(models.Sale.sale_date, models.Sale.id)
+        .limit(limit)
+        .execution_options(yield_per=batch_size)
+    )
+    yield from db.execute(stmt)
+
+def get_sales_export_totals(db: Session, start_date: date, end_date: date):
+    # (nombre de ventes, montant total) de la période, sans lire les lignes
+    start, end = _day_range(start_date, end_date)
+    count, total = db.query(func.count(models.Sale.id), func.sum(models.Sale.total_amount)).filter(models.Sale.sale_date >= start, models.Sale.sale_date < end).one()
+    return count, total or 0
+
+ORDERS_EXPORT_COLUMNS = ["N° Commande", "Date commande", "Date réception", "Fournisseur", "Coût"]
+
+def iter_received_orders_export_rows(db: Session, start_date: date, end_date: date, batch_size: int = 1000, limit: int = None):
+    start, end = _day_range(start_date, end_date)
+    stmt = (
+        select(models.PurchaseOrder.id, models.PurchaseOrder.order_date, models.PurchaseOrder.reception_date, models.Supplier.name, models.PurchaseOrder.total_cost)
+        .join(models.Supplier, models.PurchaseOrder.supplier_id == models.Supplier.id)
+        .where(models.PurchaseOrder.status == models.OrderStatus.RECUE, models.PurchaseOrder.reception_date >= start, models.PurchaseOrder.reception_date < end)
+        .order_by(models.PurchaseOrder.reception_date, models.PurchaseOrder.id)
+        .limit(limit)
+        .execution_options(yield_per=batch_size)
+    )
+    yield from db.execute(stmt)
+
+def get_received_orders_export_totals(db: Session, start_date: date, end_date: date):
+    start, end = _day_range(start_date, end_date)
+    count, total = db.query(func.count(models.PurchaseOrder.id), func.sum(models.PurchaseOrder.total_cost)).filter(
+        models.PurchaseOrder.status == models.OrderStatus.RECUE,
+        models.PurchaseOrder.reception_date >= start, models.PurchaseOrder.reception_date < end
+    ).one()
+    return count, total or 0
+
+def get_received_orders_in_date_range(db: Session, start_date: date, end_date: date, profile: str = "list"):
+    start, end = _day_range(start_date, end_date)
+    return _with_profile(db.query(models.PurchaseOrder), models.PurchaseOrder, profile).filter(
         models.PurchaseOrder.status == models.OrderStatus.RECUE,
-        models.PurchaseOrder.reception_date.between(start_datetime, end_datetime)
+        models.PurchaseOrder.reception_date >= start, models.PurchaseOrder.reception_date < end
     ).all()
 
 def get_realized_profit_in_date_range(db: Session, start_date: date, end_date: date):
-    start_datetime = datetime.combine(start_date, datetime.min.time())
-    end_datetime = datetime.combine(end_date, datetime.max.time())
-    sales_items = db.query(models.SaleItem).join(models.Sale).filter(
-        models.Sale.sale_date.between(start_datetime, end_datetime)
-    ).all()
-    real_profit = sum(
-        (item.price_per_unit - (item.product.purchase_price if item.product else 0)) * item.quantity
-        for item in sales_items
-    )
-    return real_profit
+    start, end = _day_range(start_date, end_date)
+    real_profit = db.query(
+        func.sum((models.SaleItem.price_per_unit - func.coalesce(models.SaleItem.unit_cost, 0)) * models.SaleItem.quantity)
+    ).join(models.Sale).filter(
+        models.Sale.sale_date >= start, models.Sale.sale_date < end
+    ).scalar()
+    return real_profit or 0
+
+def backfill_sale_item_costs(db: Session):
+    # Lignes antérieures au coût figé : on reprend le prix d'achat actuel du produit
+    current_cost = select(models.Product.purchase_price).where(models.Product.id == models.SaleItem.product_id).scalar_subquery()
+    result = db.execute(update(models.SaleItem).where(models.SaleItem.unit_cost.is_(None)).values(unit_cost=current_cost).execution_options(synchronize_session=False))
+    db.commit()
+    return result.rowcount
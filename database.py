@@ -1,16 +1,49 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from . import metrics
+from .config import (
+    DATABASE_URL, ASYNC_DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT, SQLITE_PRAGMAS
+)
 
-# Configuration de la base de données SQLite
-# Pour un déploiement en production, cette URL devra pointer vers une BDD PostgreSQL.
-SQLALCHEMY_DATABASE_URL = "sqlite:///./quincaillerie_pro.db"
+# Configuration de la base de données (SQLite par défaut), entièrement pilotée par config.py / l'environnement.
+# Passer à PostgreSQL revient à changer DATABASE_URL.
+SQLALCHEMY_DATABASE_URL = DATABASE_URL
+IS_SQLITE = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    # `connect_args` est nécessaire uniquement pour SQLite pour autoriser les connexions multithread.
-    connect_args={"check_same_thread": False} 
-)
+def _engine_options(url, asynchronous=False):
+    url = make_url(url)
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        # `check_same_thread` est nécessaire uniquement pour SQLite pour autoriser les connexions multithread.
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            return options # Base en mémoire : pool à connexion unique, pas de réglage de taille
+        if asynchronous:
+            options["poolclass"] = AsyncAdaptedQueuePool # aiosqlite utilise NullPool par défaut
+    else:
+        options["pool_pre_ping"] = True
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_recycle=DB_POOL_RECYCLE, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def make_engine(url):
+    # Moteur synchrone avec les réglages de config.py (pool, PRAGMAs SQLite) ; utilisé aussi par benchmark.py
+    bind = create_engine(url, **_engine_options(url))
+    if bind.dialect.name == "sqlite":
+        event.listen(bind, "connect", _apply_sqlite_pragmas)
+    return bind
+
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
+metrics.instrument_engine(engine, "sync")
 
 # Création d'une usine de sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -18,6 +51,19 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Base déclarative pour les modèles SQLAlchemy
 Base = declarative_base()
 
+def check_database_settings(bind=engine):
+    """
+    Vérification au démarrage : affiche les réglages effectivement appliqués par la base
+    (un PRAGMA refusé par SQLite n'échoue pas, il est simplement ignoré).
+    """
+    print(f"Base de données : {bind.url.render_as_string(hide_password=True)} ({bind.pool.status()})")
+    if bind.dialect.name == "sqlite":
+        with bind.connect() as conn:
+            effective = {name: conn.execute(text(f"PRAGMA {name}")).scalar() for name in SQLITE_PRAGMAS}
+        print("PRAGMAs SQLite : " + ", ".join(f"{name}={value}" for name, value in effective.items()))
+        if str(effective["journal_mode"]).lower() != str(SQLITE_PRAGMAS["journal_mode"]).lower():
+            print(f"Attention : journal_mode demandé {SQLITE_PRAGMAS['journal_mode']}, obtenu {effective['journal_mode']}.")
+
 # Dépendance pour obtenir la session de la base de données dans les routes
 def get_db():
     db = SessionLocal()
@@ -25,3 +71,34 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Moteur asynchrone pour les routes les plus sollicitées (ventes, recherche produit, tableau de bord).
+# Créé à la première utilisation : le pilote (aiosqlite / asyncpg) n'est requis que si ces routes servent.
+def _async_database_url():
+    if ASYNC_DATABASE_URL:
+        return ASYNC_DATABASE_URL
+    url = make_url(SQLALCHEMY_DATABASE_URL)
+    driver = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"Aucun pilote asynchrone connu pour {url.get_backend_name()} : définir ASYNC_DATABASE_URL.")
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}")
+
+_async_engine = None
+_async_session_factory = None
+
+def get_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        async_url = _async_database_url()
+        _async_engine = create_async_engine(async_url, **_engine_options(async_url, asynchronous=True))
+        if IS_SQLITE:
+            event.listen(_async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        metrics.instrument_engine(_async_engine.sync_engine, "async")
+        _async_session_factory = async_sessionmaker(bind=_async_engine, class_=AsyncSession, autoflush=False)
+    return _async_engine
+
+# Dépendance asynchrone équivalente à `get_db`
+async def get_async_db():
+    get_async_engine()
+    async with _async_session_factory() as db:
+        yield db
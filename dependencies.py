@@ -1,39 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import ValidationError
-from . import crud, models, schemas
-from .database import get_db
-from .config import SECRET_KEY, ALGORITHM
+from . import async_crud, crud, models, schemas
+from .database import get_db, get_async_db
+from .config import SECRET_KEY, ALGORITHM, AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES, AUTH_VERSION_POLL_SECONDS
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+# Cache jeton vérifié -> instantané de l'utilisateur (schemas.User, détaché de toute session).
+# Une entrée expire après AUTH_CACHE_TTL_SECONDS, à l'expiration du jeton, ou quand un compte est
+# modifié (désactivation, changement de rôle) via crud.update_user : aussitôt dans ce processus, et au
+# plus AUTH_VERSION_POLL_SECONDS plus tard pour une modification faite ailleurs (Streamlit, autre worker),
+# la version partagée n'étant relue en base qu'à ce rythme. Une requête servie par le cache n'émet aucun SQL.
+_auth_cache = OrderedDict()
+_auth_cache_lock = threading.Lock()
+_shared_users_version = None
+_shared_version_checked_at = float("-inf")
+
+def _users_version_due():
+    return time.monotonic() - _shared_version_checked_at >= AUTH_VERSION_POLL_SECONDS
+
+def _set_shared_users_version(version):
+    global _shared_users_version, _shared_version_checked_at
+    _shared_users_version, _shared_version_checked_at = version, time.monotonic()
+
+def _current_users_version(db: Session):
+    if _users_version_due():
+        _set_shared_users_version(crud.get_users_version(db))
+    return (_shared_users_version, crud.get_local_users_version())
+
+def _get_cached_user(token: str, current_version):
+    with _auth_cache_lock:
+        entry = _auth_cache.get(token)
+        if entry is None:
+            return None
+        expires_at, users_version, user = entry
+        if expires_at <= time.monotonic() or users_version != current_version:
+            del _auth_cache[token]
+            return None
+        _auth_cache.move_to_end(token)
+        return user
+
+def _cache_user(token: str, user: schemas.User, token_exp, users_version):
+    # `users_version` doit avoir été lue avant le chargement du compte : une modification concurrente invalide alors l'entrée
+    ttl = AUTH_CACHE_TTL_SECONDS
+    if token_exp is not None:
+        ttl = min(ttl, token_exp - time.time())
+    if ttl <= 0:
+        return
+    with _auth_cache_lock:
+        _auth_cache[token] = (time.monotonic() + ttl, users_version, user)
+        _auth_cache.move_to_end(token)
+        while len(_auth_cache) > AUTH_CACHE_MAX_ENTRIES:
+            _auth_cache.popitem(last=False)
+
+def clear_auth_cache():
+    global _shared_version_checked_at
+    with _auth_cache_lock:
+        _auth_cache.clear()
+        _shared_version_checked_at = float("-inf")
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _decode_token(token: str):
+    # Rend (nom d'utilisateur, expiration) d'un jeton valide
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise _credentials_exception()
         token_data = schemas.TokenData(username=username)
     except (JWTError, ValidationError):
-        raise credentials_exception
-    user = crud.get_user_by_username(db, username=token_data.username)
+        raise _credentials_exception()
+    return token_data.username, payload.get("exp")
+
+def _remember_user(token: str, user, token_exp, users_version):
     if user is None:
-        raise credentials_exception
-    return user
+        raise _credentials_exception()
+    current_user = schemas.User.model_validate(user)
+    _cache_user(token, current_user, token_exp, users_version)
+    return current_user
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> schemas.User:
+    users_version = _current_users_version(db)
+    cached_user = _get_cached_user(token, users_version)
+    if cached_user is not None:
+        return cached_user
+    username, token_exp = _decode_token(token)
+    return _remember_user(token, crud.get_user_by_username(db, username=username), token_exp, users_version)
 
-def get_current_active_user(current_user: models.User = Depends(get_current_user)):
+# Variante pour les routes asynchrones : lectures sur la session asynchrone de la requête, aucun thread bloqué
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> schemas.User:
+    if _users_version_due():
+        _set_shared_users_version(await async_crud.get_users_version(db))
+    users_version = (_shared_users_version, crud.get_local_users_version())
+    cached_user = _get_cached_user(token, users_version)
+    if cached_user is not None:
+        return cached_user
+    username, token_exp = _decode_token(token)
+    return _remember_user(token, await async_crud.get_user_by_username(db, username), token_exp, users_version)
+
+def _check_active(current_user: schemas.User):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def require_admin_role(current_user: models.User = Depends(get_current_active_user)):
+def get_current_active_user(current_user: schemas.User = Depends(get_current_user)):
+    return _check_active(current_user)
+
+async def get_current_active_user_async(current_user: schemas.User = Depends(get_current_user_async)):
+    return _check_active(current_user)
+
+def require_admin_role(current_user: schemas.User = Depends(get_current_active_user)):
     if current_user.role != models.UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
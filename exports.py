@@ -0,0 +1,135 @@
+"""
+Écriture en flux des exports CSV et XLSX.
+
+Les lignes sont consommées une à une (typiquement depuis un curseur serveur, voir
+`crud.iter_sales_export_rows`) et le fichier est produit par morceaux : la mémoire reste
+constante quelle que soit la période exportée et le téléchargement démarre immédiatement.
+"""
+import csv
+import enum
+import io
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+CHUNK_SIZE = 64 * 1024
+
+def format_cell(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    return value
+
+def iter_csv(header, rows):
+    # Séparateur « ; » et BOM UTF-8 : ouverture directe dans un tableur configuré en français
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(["" if v is None else format_cell(v) for v in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0); buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+class _StreamSink(io.RawIOBase):
+    # Destination non « seekable » de zipfile : les octets écrits sont récupérés au fil de l'eau
+    def __init__(self):
+        self._chunks = []
+        self.pending = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.pending = 0
+        return data
+
+def iter_zip(entries):
+    """Archive ZIP en flux. `entries` : itérable de (nom, itérable de morceaux bytes ou str)."""
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in entries:
+            with archive.open(name, "w", force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+                    if sink.pending >= CHUNK_SIZE:
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+def _workbook(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    )
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        value = format_cell(value)
+        if value is None:
+            cells.append("<c/>")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>')
+    return f"<row>{''.join(cells)}</row>"
+
+def _iter_sheet(header, rows):
+    yield ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+    yield _xlsx_row(header)
+    for row in rows:
+        yield _xlsx_row(row)
+    yield "</sheetData></worksheet>"
+
+def iter_xlsx(header, rows, sheet_name="Export"):
+    # Classeur minimal à une feuille (chaînes en ligne, sans table de styles) écrit ligne par ligne
+    return iter_zip([
+        ("[Content_Types].xml", [_CONTENT_TYPES]),
+        ("_rels/.rels", [_ROOT_RELS]),
+        ("xl/workbook.xml", [_workbook(sheet_name)]),
+        ("xl/_rels/workbook.xml.rels", [_WORKBOOK_RELS]),
+        ("xl/worksheets/sheet1.xml", _iter_sheet(header, rows)),
+    ])
+
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv; charset=utf-8"),
+    "xlsx": (iter_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
@@ -0,0 +1,87 @@
+"""
+Lecture des fichiers d'import du catalogue (CSV et XLSX).
+
+Les en-têtes sont reconnus en français ou en anglais, sans tenir compte de la casse ni des
+accents ; chaque ligne est rendue sous forme de dictionnaire aux clés de `ProductCreate`
+(plus `supplier` pour le nom du fournisseur), prêt pour `crud.import_products`.
+"""
+import csv
+import io
+import unicodedata
+
+HEADER_ALIASES = {
+    "sku": "sku", "reference": "sku", "ref": "sku",
+    "name": "name", "nom": "name", "designation": "name", "produit": "name",
+    "category": "category", "categorie": "category",
+    "purchase price": "purchase_price", "prix d'achat": "purchase_price", "prix achat": "purchase_price",
+    "selling price": "selling_price", "prix de vente": "selling_price", "prix vente": "selling_price",
+    "promo price": "promo_price", "prix promo": "promo_price",
+    "stock quantity": "stock_quantity", "stock": "stock_quantity", "quantite": "stock_quantity",
+    "unit": "unit", "unite": "unit",
+    "image url": "image_url",
+    "supplier": "supplier", "fournisseur": "supplier",
+}
+
+def _normalize_header(header):
+    text = unicodedata.normalize("NFKD", str(header or "")).encode("ascii", "ignore").decode()
+    return HEADER_ALIASES.get(" ".join(text.lower().replace("_", " ").split()))
+
+NUMERIC_FIELDS = {"purchase_price", "selling_price", "promo_price", "stock_quantity"}
+
+def _clean(field, value):
+    if not isinstance(value, str):
+        return value
+    value = value.strip()
+    # Décimales à la française (« 12,50 ») et séparateurs de milliers
+    return value.replace("\u00a0", "").replace(" ", "").replace(",", ".") if field in NUMERIC_FIELDS else value
+
+def _rows_to_dicts(header, rows):
+    fields = [_normalize_header(h) for h in header]
+    if "name" not in fields and "sku" not in fields:
+        raise ValueError("En-tête non reconnu : une colonne « Nom » ou « SKU » est requise.")
+    # `row` : numéro de ligne dans le fichier (l'en-tête est la ligne 1), repris dans le rapport d'erreurs
+    for line, values in enumerate(rows, start=2):
+        record = {field: _clean(field, value) for field, value in zip(fields, values) if field and value not in (None, "")}
+        if record:
+            yield {"row": line, **record}
+
+class _Semicolon(csv.excel):
+    delimiter = ";"
+
+def read_csv(data: bytes):
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Fichier CSV non encodé en UTF-8 (octet invalide en position {e.start}) : l'enregistrer au format « CSV UTF-8 ».") from e
+    # Séparateur détecté (« ; » des tableurs français ou « , ») ; « ; » par défaut (fichier à une seule colonne)
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=";,\t")
+    except csv.Error:
+        dialect = _Semicolon
+    try:
+        reader = csv.reader(io.StringIO(text), dialect)
+        header = next(reader, [])
+        return list(_rows_to_dicts(header, reader))
+    except csv.Error as e:
+        raise ValueError(f"Fichier CSV illisible : {e}") from e
+
+def read_xlsx(data: bytes):
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise ValueError("L'import XLSX nécessite le paquet openpyxl.") from e
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, ())
+        return list(_rows_to_dicts(header, rows))
+    finally:
+        workbook.close()
+
+IMPORT_READERS = {"csv": read_csv, "xlsx": read_xlsx}
+
+def read_product_file(filename: str, data: bytes):
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension not in IMPORT_READERS:
+        raise ValueError(f"Format de fichier non pris en charge : .{extension}")
+    return IMPORT_READERS[extension](data)
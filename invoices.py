@@ -0,0 +1,304 @@
+"""
+Rendu des factures de vente (HTML et PDF).
+
+Le gabarit Jinja2 est compilé une seule fois à l'import. Le rendu part d'une vente chargée avec le
+profil "invoice" de `crud` (client, lignes et produits en une passe) et le résultat est mis en
+cache par numéro de vente et version des paramètres / clients : une réimpression ne relit ni ne
+recalcule rien. Le PDF (fpdf2, optionnel, sans dépendance système) est produit dans un pool de
+travailleurs à partir d'un contexte de données simples, sans session ni objet ORM.
+"""
+import multiprocessing
+import re
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from jinja2 import Environment
+from sqlalchemy.orm import Session
+from . import crud, exports, models
+from .cache import VersionedCache
+
+try:
+    from fpdf import FPDF
+except ImportError:  # fpdf2 non installé : seule la facture HTML est proposée
+    FPDF = None
+
+PDF_AVAILABLE = FPDF is not None
+
+def format_amount(value):
+    return f"{value or 0:,.2f}".replace(",", " ")
+
+_environment = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+_environment.filters["ar"] = format_amount
+
+INVOICE_TEMPLATE = _environment.from_string("""<!DOCTYPE html><html lang="fr"><head><meta charset="UTF-8"><title>Facture N°{{ sale.id }}</title>
+<style>body{font-family:sans-serif;margin:0;}.invoice-box{max-width:800px;margin:auto;padding:30px;border:1px solid #eee;background:#fff;} .header{text-align:center;border-bottom:2px solid #333;padding-bottom:10px;margin-bottom:20px;} .invoice-details{display:flex;justify-content:space-between;margin-bottom:30px;} table{width:100%;border-collapse:collapse;} th,td{border-bottom:1px solid #ddd;padding:8px;} th{background-color:#f2f2f2;text-align:left;} .right{text-align:right;} .center{text-align:center;} .total-row{font-weight:bold;font-size:1.2em;border-top:2px solid #333;} .footer{text-align:center;margin-top:30px;font-size:0.9em;color:#777;}</style></head>
+<body><div class="invoice-box">
+<div class="header"><h2>{{ company.name }}</h2><p>{{ company.address }}<br>Tél: {{ company.phone }} | Email: {{ company.email }}<br>NIF: {{ company.nif }} | STAT: {{ company.stat }}</p></div>
+<div class="invoice-details"><div><strong>Facture N° :</strong> {{ sale.id }}<br><strong>Date :</strong> {{ sale.date }}</div><div>
+{% if client %}<h4>Client : {{ client.name }}</h4><p>{{ client.address }}<br>Tel: {{ client.phone }}<br>NIF: {{ client.nif }} | STAT: {{ client.stat }}</p>
+{% else %}<h4>Client : Vente au comptoir</h4>{% endif %}
+</div></div>
+<table><thead><tr><th>Produit</th><th class="center">Quantité</th><th class="right">P.U.</th><th class="right">Sous-total</th></tr></thead><tbody>
+{% for line in lines %}<tr><td>{{ line.name }} (Réf: {{ line.sku }})</td><td class="center">{{ line.quantity }}</td><td class="right">{{ line.unit_price|ar }} Ar</td><td class="right">{{ line.subtotal|ar }} Ar</td></tr>
+{% endfor %}
+</tbody><tfoot><tr><td colspan="3" class="total-row right">TOTAL</td><td class="total-row right">{{ sale.total|ar }} Ar</td></tr></tfoot></table>
+<div class="footer"><p>Merci de votre visite !</p></div>
+</div></body></html>""")
+
+STATEMENT_TEMPLATE = _environment.from_string("""<!DOCTYPE html><html lang="fr"><head><meta charset="UTF-8"><title>Relevé client - {{ client.name }}</title>
+<style>body{font-family:sans-serif;margin:0;}.invoice-box{max-width:800px;margin:auto;padding:30px;border:1px solid #eee;background:#fff;} .header{text-align:center;border-bottom:2px solid #333;padding-bottom:10px;margin-bottom:20px;} table{width:100%;border-collapse:collapse;} th,td{border-bottom:1px solid #ddd;padding:8px;} th{background-color:#f2f2f2;text-align:left;} .right{text-align:right;} .total-row{font-weight:bold;font-size:1.2em;border-top:2px solid #333;}</style></head>
+<body><div class="invoice-box">
+<div class="header"><h2>{{ company.name }}</h2><p>{{ company.address }}<br>Tél: {{ company.phone }} | Email: {{ company.email }}</p></div>
+<h3>Relevé des ventes à crédit au {{ issued }}</h3>
+<h4>Client : {{ client.name }}</h4><p>{{ client.address }}<br>Tel: {{ client.phone }}<br>NIF: {{ client.nif }} | STAT: {{ client.stat }}</p>
+<table><thead><tr><th>Facture N°</th><th>Date</th><th class="right">Montant</th><th class="right">Reste dû</th></tr></thead><tbody>
+{% for sale in sales %}<tr><td>{{ sale.id }}</td><td>{{ sale.date }}</td><td class="right">{{ sale.total|ar }} Ar</td><td class="right">{{ sale.due|ar }} Ar</td></tr>
+{% endfor %}
+</tbody><tfoot><tr><td colspan="3" class="total-row right">TOTAL DÛ</td><td class="total-row right">{{ total|ar }} Ar</td></tr></tfoot></table>
+</div></body></html>""")
+
+def company_context(settings: dict):
+    return {
+        "name": settings.get("nom_societe") or "Quincaillerie PRO", "address": settings.get("adresse_societe", ""), "phone": settings.get("tel_societe", ""),
+        "email": settings.get("email_societe", ""), "nif": settings.get("nif_societe", ""), "stat": settings.get("stat_societe", ""),
+    }
+
+def invoice_context(sale, settings: dict):
+    # Données simples (dictionnaires, chaînes, nombres) : transmissibles à un travailleur et indépendantes de la session
+    client = sale.client
+    return {
+        "company": company_context(settings),
+        "sale": {"id": sale.id, "date": sale.sale_date.strftime("%d/%m/%Y %H:%M"), "total": sale.total_amount, "due": sale.total_amount - sale.amount_paid, "status": sale.status.value, "payment_method": sale.payment_method},
+        "client": {"id": client.id, "name": client.name, "address": client.address or "", "phone": client.phone or "N/A", "nif": client.nif or "N/A", "stat": client.stat or "N/A"} if client else None,
+        "lines": [
+            {"name": item.product.name, "sku": item.product.sku, "quantity": item.quantity, "unit_price": item.price_per_unit, "subtotal": item.quantity * item.price_per_unit}
+            for item in sale.items
+        ],
+    }
+
+def render_invoice_html(context: dict):
+    return INVOICE_TEMPLATE.render(**context)
+
+def render_statement_html(context: dict):
+    return STATEMENT_TEMPLATE.render(**context)
+
+def _latin1(text):
+    # Polices PDF standard : jeu de caractères latin-1 uniquement
+    return str(text).encode("latin-1", "replace").decode("latin-1")
+
+def render_invoice_pdf(context: dict):
+    if FPDF is None:
+        raise RuntimeError("La facture PDF nécessite le paquet fpdf2.")
+    company, sale, client = context["company"], context["sale"], context["client"]
+    pdf = FPDF(format="A4")
+    pdf.set_auto_page_break(auto=True, margin=15)
+    _pdf_header(pdf, company)
+    pdf.set_font("Helvetica", "B", 11)
+    pdf.cell(95, 6, _latin1(f"Facture N° : {sale['id']}"))
+    pdf.cell(0, 6, _latin1(f"Client : {client['name'] if client else 'Vente au comptoir'}"), new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", size=9)
+    pdf.cell(95, 5, _latin1(f"Date : {sale['date']}"))
+    if client:
+        pdf.multi_cell(0, 5, _latin1(f"{client['address']}\nTel: {client['phone']}\nNIF: {client['nif']} | STAT: {client['stat']}"), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(6)
+    widths = (95, 25, 35, 35)
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.set_fill_color(242, 242, 242)
+    for width, title, align in zip(widths, ("Produit", "Quantité", "P.U.", "Sous-total"), ("L", "C", "R", "R")):
+        pdf.cell(width, 8, _latin1(title), border="B", align=align, fill=True)
+    pdf.ln()
+    pdf.set_font("Helvetica", size=9)
+    for line in context["lines"]:
+        cells = (f"{line['name']} (Réf: {line['sku']})", f"{line['quantity']:g}", f"{format_amount(line['unit_price'])} Ar", f"{format_amount(line['subtotal'])} Ar")
+        for width, text, align in zip(widths, cells, ("L", "C", "R", "R")):
+            pdf.cell(width, 7, _latin1(text), border="B", align=align)
+        pdf.ln()
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(sum(widths[:3]), 10, "TOTAL", align="R")
+    pdf.cell(widths[3], 10, _latin1(f"{format_amount(sale['total'])} Ar"), align="R", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(8)
+    pdf.set_font("Helvetica", "I", 9)
+    pdf.cell(0, 5, "Merci de votre visite !", align="C")
+    return bytes(pdf.output())
+
+def _pdf_header(pdf, company):
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.cell(0, 9, _latin1(company["name"]), align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", size=9)
+    for line in (company["address"], f"Tél: {company['phone']} | Email: {company['email']}", f"NIF: {company['nif']} | STAT: {company['stat']}"):
+        pdf.cell(0, 5, _latin1(line), align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(6)
+
+def render_statement_pdf(context: dict):
+    if FPDF is None:
+        raise RuntimeError("Le relevé PDF nécessite le paquet fpdf2.")
+    client = context["client"]
+    pdf = FPDF(format="A4")
+    pdf.set_auto_page_break(auto=True, margin=15)
+    _pdf_header(pdf, context["company"])
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(0, 7, _latin1(f"Relevé des ventes à crédit au {context['issued']}"), new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.cell(0, 6, _latin1(f"Client : {client['name']}"), new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font("Helvetica", size=9)
+    pdf.multi_cell(0, 5, _latin1(f"{client['address']}\nTel: {client['phone']}\nNIF: {client['nif']} | STAT: {client['stat']}"), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(4)
+    widths = (35, 55, 50, 50)
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.set_fill_color(242, 242, 242)
+    for width, title, align in zip(widths, ("Facture N°", "Date", "Montant", "Reste dû"), ("L", "L", "R", "R")):
+        pdf.cell(width, 8, _latin1(title), border="B", align=align, fill=True)
+    pdf.ln()
+    pdf.set_font("Helvetica", size=9)
+    for sale in context["sales"]:
+        for width, text, align in zip(widths, (str(sale["id"]), sale["date"], f"{format_amount(sale['total'])} Ar", f"{format_amount(sale['due'])} Ar"), ("L", "L", "R", "R")):
+            pdf.cell(width, 7, _latin1(text), border="B", align=align)
+        pdf.ln()
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(sum(widths[:3]), 10, _latin1("TOTAL DÛ"), align="R")
+    pdf.cell(widths[3], 10, _latin1(f"{format_amount(context['total'])} Ar"), align="R")
+    return bytes(pdf.output())
+
+_invoice_cache = VersionedCache(max_entries=512)
+_pdf_executor = None
+
+def _get_pdf_executor():
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="invoice-pdf")
+    return _pdf_executor
+
+def _invoice_version(db: Session):
+    # Une facture ne dépend que des paramètres de l'entreprise et de la fiche client ; les lignes de vente ne changent plus
+    return crud.get_table_versions(db, "settings", "clients")
+
+class _SaleNotFound(LookupError):
+    pass
+
+def _get_context(db: Session, sale_id: int, version):
+    def load():
+        sale = crud.get_sale(db, sale_id, profile="invoice")
+        if sale is None:
+            raise _SaleNotFound(sale_id)  # Rien n'est mis en cache pour une vente inexistante
+        return invoice_context(sale, crud.get_settings(db))
+    return _invoice_cache.get_or_load(("context", sale_id), version, load)
+
+def get_invoice_html(db: Session, sale_id: int):
+    version = _invoice_version(db)
+    try:
+        return _invoice_cache.get_or_load(("html", sale_id), version, lambda: render_invoice_html(_get_context(db, sale_id, version)))
+    except _SaleNotFound:
+        return None
+
+def _failed(future):
+    return future.done() and (future.cancelled() or future.exception() is not None)
+
+def submit_invoice_pdf(db: Session, sale_id: int):
+    """
+    Lance (ou retrouve) la production du PDF de la vente et rend immédiatement un `Future` ;
+    None si la vente n'existe pas ou si fpdf2 n'est pas installé.
+    """
+    if not PDF_AVAILABLE:
+        return None
+    version = _invoice_version(db)
+    key = ("pdf", sale_id)
+    submitted = []
+    def submit():
+        future = _get_pdf_executor().submit(render_invoice_pdf, _get_context(db, sale_id, version))
+        # Un rendu en échec n'est pas gardé : la demande suivante le relance
+        future.add_done_callback(lambda done: _failed(done) and _invoice_cache.discard(key, done))
+        submitted.append(future)
+        return future
+    try:
+        future = _invoice_cache.get_or_load(key, version, submit)
+        if not submitted and _failed(future):
+            # Échec d'une demande précédente dont le rappel n'a pas encore évincé l'entrée
+            _invoice_cache.discard(key, future)
+            future = _invoice_cache.get_or_load(key, version, submit)
+    except _SaleNotFound:
+        return None
+    return future
+
+# --- FACTURATION EN LOT ---
+RENDERERS = {
+    "html": (render_invoice_html, render_statement_html),
+    "pdf": (render_invoice_pdf, render_statement_pdf),
+}
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_")[:40] or "client"
+
+_archive_executor = None
+
+def _get_archive_executor():
+    # Pool de processus unique, créé à la première archive volumineuse puis réutilisé par les suivantes
+    # (le démarrer à chaque requête ou à chaque réexécution Streamlit dupliquerait tout le processus à chaque fois).
+    # Démarrage « spawn » : un fork depuis un processus multithread (uvicorn, Streamlit, pool PDF) peut figer
+    # l'enfant sur un verrou hérité.
+    global _archive_executor
+    if _archive_executor is None:
+        _archive_executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+    return _archive_executor
+
+def _render_all(renderer, contexts, parallel, count):
+    # En dessous de quelques documents, l'envoi aux processus coûte plus que le rendu lui-même
+    if not parallel or count < 20:
+        return map(renderer, contexts)
+    return _get_archive_executor().map(renderer, contexts, chunksize=8)
+
+def iter_invoice_archive(db: Session, start_date: date = None, end_date: date = None, client_id: int = None, export_format: str = "html",
+                         invoices: bool = True, statements: bool = True, parallel: bool = True, window: int = 256, progress=None):
+    """
+    Archive ZIP en flux des factures d'une période et/ou d'un client, et des relevés de crédit par client.
+
+    Les ventes sont lues par lots avec le profil "invoice" et converties en contextes simples, rendus
+    en parallèle dans le pool de processus partagé par fenêtres de `window` documents (mémoire bornée) ;
+    `parallel=False` rend tout dans le processus appelant. Les relevés sont construits à partir des
+    mêmes ventes. `progress(done, total)` est appelé après chaque document écrit.
+    """
+    render_invoice, render_statement = RENDERERS[export_format]
+    settings = crud.get_settings(db)
+    # Relevés seuls : seules les ventes à crédit sont lues
+    total, sales = crud.iter_sales_for_invoicing(db, start_date, end_date, client_id, status=None if invoices else models.SaleStatus.CREDIT)
+    if not invoices:
+        total = 0
+    credits = {}
+    done = 0
+
+    def contexts():
+        for sale in sales:
+            context = invoice_context(sale, settings)
+            if sale.status == models.SaleStatus.CREDIT and context["client"]:
+                entry = credits.setdefault(context["client"]["id"], {"client": context["client"], "sales": []})
+                entry["sales"].append(context["sale"])
+            yield context
+
+    def entries():
+        nonlocal done, total
+        if invoices:
+            pending = contexts()
+            while True:
+                batch = list(islice(pending, window))
+                if not batch:
+                    break
+                for context, document in zip(batch, _render_all(render_invoice, batch, parallel, total)):
+                    done += 1
+                    yield f"factures/facture_{context['sale']['id']}.{export_format}", [document]
+                    if progress: progress(done, total)
+        else:
+            for _ in contexts():
+                pass
+        if statements:
+            issued = date.today().strftime("%d/%m/%Y")
+            statement_contexts = [
+                {"company": company_context(settings), "client": entry["client"], "sales": entry["sales"], "total": sum(sale["due"] for sale in entry["sales"]), "issued": issued}
+                for entry in credits.values()
+            ]
+            total += len(statement_contexts)
+            for context, document in zip(statement_contexts, _render_all(render_statement, statement_contexts, parallel, len(statement_contexts))):
+                done += 1
+                yield f"releves/releve_{context['client']['id']}_{_slug(context['client']['name'])}.{export_format}", [document]
+                if progress: progress(done, total)
+
+    yield from exports.iter_zip(entries())
@@ -1,13 +1,20 @@
-from fastapi import FastAPI
+from datetime import date
+from typing import List, Literal, Optional
+from fastapi import Depends, FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base, get_db
-from . import models, crud
+from .database import engine, Base, SessionLocal, get_db, get_async_db, check_database_settings
+from . import models, crud, schemas, async_crud, exports, imports, invoices, metrics, reorder
+from .dependencies import get_current_active_user, get_current_active_user_async, require_admin_role
+from .maintenance import run_migrations
 from .routers import auth, products, clients, suppliers, sales, orders, reports, settings
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Crée les tables dans la base de données si elles n'existent pas
 # Dans un environnement de production, on utiliserait un outil de migration comme Alembic.
 models.Base.metadata.create_all(bind=engine)
+run_migrations()
 
 app = FastAPI(
     title="Quincaillerie PRO API",
@@ -25,6 +32,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Mesures par route : latence et nombre d'instructions SQL, étiquetées par le gabarit de la route
+# (« /api/sales/{sale_id}/invoice ») pour ne pas créer une série par identifiant
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    with metrics.track("http", f"{request.method} unmatched") as tracked:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            tracked.name = f"{request.method} {route.path}"
+        tracked.status = str(response.status_code)
+    return response
+
 # Inclure les routeurs des différents modules
 app.include_router(auth.router, tags=["Authentication"])
 app.include_router(products.router, prefix="/api", tags=["Products"])
@@ -42,6 +61,7 @@ def startup_event():
     Événement au démarrage de l'application pour créer un utilisateur admin par défaut
     et des paramètres de base.
     """
+    check_database_settings()
     db = next(get_db())
     try:
         # Vérifier si un utilisateur admin existe déjà
@@ -72,6 +92,182 @@ def startup_event():
     finally:
         db.close()
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/", tags=["Root"])
 def read_root():
     return {"message": "Welcome to Quincaillerie PRO API"}
+
+# Routes les plus sollicitées, servies par le moteur asynchrone (voir database.get_async_db), authentification comprise
+@app.get("/api/search/products", response_model=List[schemas.Product], tags=["Products"])
+async def search_products(q: str, limit: int = 20, in_stock: bool = False, db: AsyncSession = Depends(get_async_db), current_user: schemas.User = Depends(get_current_active_user_async)):
+    return await async_crud.search_products(db, q, limit=min(limit, 100), in_stock=in_stock)
+
+@app.get("/api/pos/products", response_model=schemas.Page[schemas.Product], tags=["Products"])
+async def pos_list_products(category: Optional[str] = None, cursor: Optional[str] = None, limit: int = 24, db: AsyncSession = Depends(get_async_db), current_user: schemas.User = Depends(get_current_active_user_async)):
+    # Grille de la caisse : produits en stock par pages (ordre alphabétique), filtrables par catégorie
+    products, next_cursor = await async_crud.get_products_page(db, cursor=cursor, limit=min(limit, 100), category=category, in_stock=True)
+    return {"items": products, "next_cursor": next_cursor}
+
+@app.post("/api/pos/quote", response_model=schemas.Quote, tags=["Sales"])
+async def pos_quote(cart: schemas.Cart, db: AsyncSession = Depends(get_async_db), current_user: schemas.User = Depends(get_current_active_user_async)):
+    return await async_crud.quote_cart(db, cart)
+
+@app.get("/api/pos/products/{product_id}", response_model=schemas.Product, tags=["Products"])
+async def pos_read_product(product_id: int, db: AsyncSession = Depends(get_async_db), current_user: schemas.User = Depends(get_current_active_user_async)):
+    db_product = await async_crud.get_product(db, product_id)
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return db_product
+
+@app.post("/api/pos/sales", response_model=schemas.Sale, tags=["Sales"])
+async def pos_create_sale(sale: schemas.SaleCreate, db: AsyncSession = Depends(get_async_db), current_user: schemas.User = Depends(get_current_active_user_async)):
+    try:
+        return await async_crud.create_sale(db, sale, user_id=current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/pos/dashboard", tags=["Dashboard & Reports"])
+async def pos_dashboard(db: AsyncSession = Depends(get_async_db), current_user: schemas.User = Depends(get_current_active_user_async)):
+    return await async_crud.get_dashboard_kpis(db)
+
+def _stream_export(iter_rows, columns, start_date: date, end_date: date, export_format: str, basename: str):
+    writer, media_type = exports.EXPORT_FORMATS[export_format]
+    def rows():
+        # Session propre au flux : celle de `get_db` est fermée avant la fin de l'envoi de la réponse
+        db = SessionLocal()
+        try:
+            yield from iter_rows(db, start_date, end_date)
+        finally:
+            db.close()
+    filename = f"{basename}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{export_format}"
+    return StreamingResponse(writer(columns, rows()), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.post("/api/catalog/import", tags=["Products"])
+def import_catalog(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: schemas.User = Depends(require_admin_role)):
+    # Route synchrone : l'import tourne dans le pool de threads sans bloquer la boucle d'événements
+    try:
+        rows = imports.read_product_file(file.filename or "", file.file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return crud.import_products(db, rows, user_id=current_user.id)
+
+@app.post("/api/catalog/repricing/preview", tags=["Products"])
+def preview_repricing(repricing: schemas.BulkRepricing, limit: int = 500, db: Session = Depends(get_db), current_user: schemas.User = Depends(require_admin_role)):
+    return [row._asdict() for row in crud.preview_repricing(db, repricing, limit=limit)]
+
+@app.post("/api/catalog/repricing", tags=["Products"])
+def apply_repricing(repricing: schemas.BulkRepricing, db: Session = Depends(get_db), current_user: schemas.User = Depends(require_admin_role)):
+    return {"updated": crud.apply_repricing(db, repricing, user_id=current_user.id)}
+
+@app.get("/api/catalog/{product_id}/price-history", response_model=List[schemas.PriceHistory], tags=["Products"])
+def read_price_history(product_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)):
+    return crud.get_price_history(db, product_id)
+
+@app.get("/api/suppliers/{supplier_id}/profile", response_model=schemas.SupplierProfile, tags=["Suppliers"])
+def read_supplier_profile(supplier_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)):
+    profile = crud.get_supplier_profile(db, supplier_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Supplier not found")
+    return profile
+
+@app.get("/api/suppliers/{supplier_id}/orders", response_model=schemas.Page[schemas.PurchaseOrder], tags=["Suppliers"])
+def read_supplier_orders(supplier_id: int, cursor: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)):
+    orders, next_cursor = crud.get_purchase_orders_page(db, cursor=cursor, limit=min(limit, 100), supplier_id=supplier_id, profile="detail")
+    return {"items": orders, "next_cursor": next_cursor}
+
+@app.get("/api/clients/{client_id}/profile", response_model=schemas.ClientProfile, tags=["Clients"])
+def read_client_profile(client_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)):
+    profile = crud.get_client_profile(db, client_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+    return profile
+
+@app.get("/api/clients/{client_id}/sales", response_model=schemas.Page[schemas.Sale], tags=["Clients"])
+def read_client_sales(client_id: int, cursor: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)):
+    sales, next_cursor = crud.get_sales_page(db, cursor=cursor, limit=min(limit, 100), client_id=client_id, profile="detail")
+    return {"items": sales, "next_cursor": next_cursor}
+
+@app.get("/api/clients/{client_id}/credit", tags=["Clients"])
+def read_client_credit(client_id: int, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)):
+    credit = crud.get_client_credit(db, client_id)
+    if credit is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+    return credit
+
+@app.get("/api/clients/{client_id}/ledger", response_model=schemas.Page[schemas.ClientLedgerEntry], tags=["Clients"])
+def read_client_ledger(client_id: int, cursor: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)):
+    entries, next_cursor = crud.get_client_ledger_page(db, client_id, cursor=cursor, limit=min(limit, 200))
+    return {"items": entries, "next_cursor": next_cursor}
+
+@app.post("/api/clients/{client_id}/payments", tags=["Clients"])
+def create_client_payment(client_id: int, payment: schemas.ClientPayment, db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)):
+    try:
+        return crud.record_client_payment(db, client_id, payment.amount, payment.payment_method, sale_id=payment.sale_id, note=payment.note, user_id=current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/clients/{client_id}/credit-notes", tags=["Clients"])
+def create_client_credit_note(client_id: int, credit_note: schemas.ClientCreditNote, db: Session = Depends(get_db), current_user: schemas.User = Depends(require_admin_role)):
+    try:
+        return crud.record_credit_note(db, client_id, credit_note.amount, credit_note.note, sale_id=credit_note.sale_id, user_id=current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/reports/aged-receivables", tags=["Dashboard & Reports"])
+def read_aged_receivables(as_of: Optional[date] = None, db: Session = Depends(get_db), current_user: schemas.User = Depends(require_admin_role)):
+    return [row._asdict() for row in crud.get_aged_receivables(db, as_of)]
+
+@app.get("/api/purchase-orders/reorder-proposals", response_model=List[schemas.ReorderProposal], tags=["Purchase Orders"])
+def read_reorder_proposals(cover_days: int = reorder.COVER_DAYS, db: Session = Depends(get_db), current_user: schemas.User = Depends(require_admin_role)):
+    # Lecture seule, sur la demande enregistrée ; la commande retenue est créée par la route habituelle avec le champ `order`
+    return reorder.propose_purchase_orders(db, cover_days=max(cover_days, 0), refresh=False)
+
+@app.post("/api/purchase-orders/reorder-proposals", response_model=List[schemas.ReorderProposal], tags=["Purchase Orders"])
+def refresh_reorder_proposals(cover_days: int = reorder.COVER_DAYS, db: Session = Depends(get_db), current_user: schemas.User = Depends(require_admin_role)):
+    # Met d'abord à jour product_demand (incrémental), puis rend les brouillons
+    return reorder.propose_purchase_orders(db, cover_days=max(cover_days, 0), refresh=True)
+
+@app.get("/api/sales/{sale_id}/invoice", tags=["Sales"])
+def read_invoice(sale_id: int, format: Literal["html", "pdf"] = "html", db: Session = Depends(get_db), current_user: schemas.User = Depends(get_current_active_user)):
+    if format == "pdf":
+        if not invoices.PDF_AVAILABLE:
+            raise HTTPException(status_code=501, detail="Facture PDF indisponible (fpdf2 non installé)")
+        pdf_future = invoices.submit_invoice_pdf(db, sale_id)
+        if pdf_future is None:
+            raise HTTPException(status_code=404, detail="Sale not found")
+        return Response(pdf_future.result(), media_type="application/pdf", headers={"Content-Disposition": f'inline; filename="facture_{sale_id}.pdf"'})
+    html = invoices.get_invoice_html(db, sale_id)
+    if html is None:
+        raise HTTPException(status_code=404, detail="Sale not found")
+    return HTMLResponse(html)
+
+@app.get("/api/invoices/archive", tags=["Sales"])
+def export_invoice_archive(start_date: Optional[date] = None, end_date: Optional[date] = None, client_id: Optional[int] = None, format: Literal["html", "pdf"] = "html",
+                           content: Literal["all", "invoices", "statements"] = "all", current_user: schemas.User = Depends(require_admin_role)):
+    if (start_date is None) != (end_date is None) or (start_date is None and client_id is None):
+        raise HTTPException(status_code=400, detail="Indiquer une période (start_date et end_date) et/ou un client")
+    if format == "pdf" and not invoices.PDF_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Facture PDF indisponible (fpdf2 non installé)")
+    def archive():
+        db = SessionLocal()
+        try:
+            yield from invoices.iter_invoice_archive(db, start_date, end_date, client_id, format, invoices=content != "statements", statements=content != "invoices")
+        finally:
+            db.close()
+    filename = f"factures_{start_date:%Y%m%d}_{end_date:%Y%m%d}.zip" if start_date else f"factures_client_{client_id}.zip"
+    return StreamingResponse(archive(), media_type="application/zip", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/api/reports/summary", tags=["Dashboard & Reports"])
+def read_report(start_date: date, end_date: date, group_by: Literal["day", "week", "month", "product", "category", "client", "supplier", "user"] = "day", db: Session = Depends(get_db), current_user: schemas.User = Depends(require_admin_role)):
+    return [row._asdict() for row in crud.get_report(db, start_date, end_date, group_by)]
+
+@app.get("/api/reports/sales/export", tags=["Dashboard & Reports"])
+def export_sales(start_date: date, end_date: date, format: Literal["csv", "xlsx"] = "csv", current_user: schemas.User = Depends(require_admin_role)):
+    return _stream_export(crud.iter_sales_export_rows, crud.SALES_EXPORT_COLUMNS, start_date, end_date, format, "ventes")
+
+@app.get("/api/reports/received-orders/export", tags=["Dashboard & Reports"])
+def export_received_orders(start_date: date, end_date: date, format: Literal["csv", "xlsx"] = "csv", current_user: schemas.User = Depends(require_admin_role)):
+    return _stream_export(crud.iter_received_orders_export_rows, crud.ORDERS_EXPORT_COLUMNS, start_date, end_date, format, "achats")
@@ -0,0 +1,153 @@
+"""
+Commandes de maintenance de la base de données.
+
+Usage : python -m app.maintenance <commande>
+"""
+import argparse
+from sqlalchemy import inspect, literal, text
+from .database import SessionLocal, engine
+from . import models, crud, reorder
+
+def _add_missing_columns(bind):
+    # `create_all` ne modifie pas les tables existantes : on ajoute les colonnes nouvellement déclarées
+    inspector = inspect(bind)
+    added = []
+    with bind.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" NOT NULL DEFAULT {_ddl_default(column, bind.dialect)}"
+                elif not column.nullable:
+                    # Défaut appelable ou expression SQL : rien à écrire dans les lignes existantes
+                    raise RuntimeError(f"Migration impossible de {table.name}.{column.name} : colonne NOT NULL sans défaut scalaire (ajouter un défaut scalaire ou la rendre nullable).")
+                conn.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+def _ddl_default(column, dialect):
+    # Valeur par défaut rendue par le type de la colonne (un Enum est écrit comme en base, pas avec son repr Python)
+    return literal(column.default.arg, column.type).compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+
+def _create_missing_indexes(bind):
+    created = []
+    inspector = inspect(bind)
+    for table in models.Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind)
+                created.append(index.name)
+    return created
+
+PRODUCT_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, sku, category, content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, sku, category) VALUES (new.id, new.name, new.sku, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, sku, category) VALUES ('delete', old.id, old.name, old.sku, old.category);
+    END""",
+    # Limité aux colonnes indexées : les décréments de stock des ventes ne touchent pas l'index
+    """CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, sku, category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, sku, category) VALUES ('delete', old.id, old.name, old.sku, old.category);
+        INSERT INTO products_fts(rowid, name, sku, category) VALUES (new.id, new.name, new.sku, new.category);
+    END""",
+]
+
+PRODUCT_SEARCH_OBJECTS = {"products_fts", "products_fts_ai", "products_fts_ad", "products_fts_au"}
+
+def create_product_search_index(bind):
+    # Index plein texte des produits (SQLite FTS5 uniquement) ; reconstruit s'il manquait un élément
+    if bind.dialect.name != "sqlite":
+        return False
+    with bind.begin() as conn:
+        existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE name LIKE 'products_fts%'")).scalars())
+        if PRODUCT_SEARCH_OBJECTS <= existing:
+            return False
+        for ddl in PRODUCT_SEARCH_DDL:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+    return True
+
+def run_migrations(bind=engine):
+    """
+    Mises à niveau idempotentes d'une base existante, appelées au démarrage après `create_all`.
+    Dans un environnement de production, on utiliserait un outil de migration comme Alembic.
+    """
+    for column in _add_missing_columns(bind):
+        print(f"Colonne ajoutée : {column}")
+    for index in _create_missing_indexes(bind):
+        print(f"Index créé : {index}")
+    if create_product_search_index(bind):
+        print("Index de recherche des produits créé.")
+    db = SessionLocal(bind=bind)
+    try:
+        backfilled = crud.backfill_sale_item_costs(db)
+        if backfilled:
+            print(f"Coût d'achat renseigné sur {backfilled} ligne(s) de vente.")
+        seeded = crud.seed_stock_ledger(db)
+        if seeded:
+            print(f"Journal de stock initialisé pour {seeded} produit(s).")
+        opened = crud.seed_client_ledger(db)
+        if opened:
+            print(f"Compte client initialisé pour {opened} vente(s) à crédit.")
+        if not db.query(models.DailySalesRollup.day).first() and db.query(models.Sale.id).first():
+            days = crud.rebuild_daily_sales_rollup(db)
+            print(f"Agrégats journaliers des ventes reconstruits ({days} jour(s)).")
+    finally:
+        db.close()
+
+def _reconcile_stock(db):
+    corrected = crud.reconcile_stock_snapshots(db)
+    print(f"{corrected} produit(s) corrigé(s) depuis le journal des mouvements de stock.")
+
+def _reconcile_balances(db):
+    corrected = crud.reconcile_client_balances(db)
+    print(f"{corrected} client(s) corrigé(s) depuis le journal du compte client.")
+
+def _rebuild_search_index(db):
+    db.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+    db.commit()
+    print("Index de recherche des produits reconstruit.")
+
+def _rebuild_rollup(db):
+    days = crud.rebuild_daily_sales_rollup(db)
+    print(f"Agrégats journaliers des ventes reconstruits ({days} jour(s)).")
+
+def _refresh_demand(db):
+    products = reorder.refresh_demand(db, full=True)
+    print(f"Demande journalière recalculée pour {products} produit(s).")
+
+COMMANDS = {
+    "reconcile-stock": _reconcile_stock,
+    "reconcile-balances": _reconcile_balances,
+    "rebuild-rollup": _rebuild_rollup,
+    "rebuild-search": _rebuild_search_index,
+    "refresh-demand": _refresh_demand,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance", description="Maintenance de la base Quincaillerie PRO")
+    parser.add_argument("command", choices=["migrate", *COMMANDS])
+    args = parser.parse_args(argv)
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations()
+    if args.command == "migrate":
+        return
+    db = SessionLocal()
+    try:
+        COMMANDS[args.command](db)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
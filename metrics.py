@@ -0,0 +1,186 @@
+"""
+Mesures de l'application au format texte Prometheus (sans dépendance externe).
+
+- `instrument_engine(bind)` (appelé par database.py) : durée et nombre des requêtes SQL, journal des
+  requêtes lentes avec l'instruction normalisée, occupation du pool de connexions.
+- `track(kind, name)` : mesure un traitement (route FastAPI via le middleware de main.py, page
+  Streamlit) avec le nombre d'instructions SQL qu'il a émises.
+- `render()` : contenu de l'endpoint /metrics.
+"""
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from .config import METRICS_ENABLED, SLOW_QUERY_MS
+
+logger = logging.getLogger("quincaillerie.metrics")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _bucket_label(bound):
+    return f'le="{bound}"'
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name, self.help, self.labelnames = name, help_text, labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in sorted(self._values.items())]
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help_text, labelnames, buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            entry = self._values.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [_bucket_label(bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [_bucket_label('+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+REQUEST_DURATION = Histogram("qp_request_duration_seconds", "Durée des traitements (routes HTTP, pages Streamlit).", ("kind", "name", "status"))
+REQUEST_STATEMENTS = Histogram("qp_request_sql_statements", "Instructions SQL émises par traitement.", ("kind", "name"), COUNT_BUCKETS)
+QUERY_DURATION = Histogram("qp_db_query_duration_seconds", "Durée des instructions SQL.", ("operation",))
+SLOW_QUERIES = Counter("qp_db_slow_queries_total", f"Instructions SQL plus lentes que {SLOW_QUERY_MS:g} ms.", ("operation",))
+METRICS = [REQUEST_DURATION, REQUEST_STATEMENTS, QUERY_DURATION, SLOW_QUERIES]
+
+# Compteur d'instructions SQL du traitement en cours (copié dans les threads de FastAPI avec le contexte)
+_current_statements = ContextVar("qp_current_statements", default=None)
+
+class Tracked:
+    __slots__ = ("name", "statements", "duration", "status")
+
+    def __init__(self, name):
+        self.name = name # Modifiable dans le bloc (ex. gabarit de route connu après le routage)
+        self.statements = 0
+        self.duration = 0.0
+        self.status = None # Renseigné par l'appelant (code HTTP), sinon "ok" / "error"
+
+@contextmanager
+def track(kind: str, name: str):
+    """
+    Mesure la durée et le nombre d'instructions SQL du bloc ; `status` vaut "error" si une exception
+    s'échappe (les interruptions de contrôle comme st.rerun, dérivées de BaseException, ne comptent pas).
+    """
+    tracked = Tracked(name)
+    token = _current_statements.set(tracked)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield tracked
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        tracked.duration = time.perf_counter() - started
+        _current_statements.reset(token)
+        if METRICS_ENABLED:
+            REQUEST_DURATION.observe(tracked.duration, kind, tracked.name, tracked.status or status)
+            REQUEST_STATEMENTS.observe(tracked.statements, kind, tracked.name)
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)"), "(?, ...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+def normalize_statement(statement: str):
+    # Littéraux remplacés et listes IN repliées : une même requête donne toujours la même empreinte
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+def _operation(statement: str):
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA") else "OTHER"
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("qp_query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("qp_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    operation = _operation(statement)
+    QUERY_DURATION.observe(elapsed, operation)
+    tracked = _current_statements.get()
+    if tracked is not None:
+        tracked.statements += 1
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(operation)
+        logger.warning("Requête lente (%.1f ms) : %s", elapsed * 1000, normalize_statement(statement))
+
+def _handle_error(context):
+    starts = context.connection.info.get("qp_query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+_engines = {}
+
+def instrument_engine(bind, name: str = "sync"):
+    if not METRICS_ENABLED or name in _engines:
+        return
+    event.listen(bind, "before_cursor_execute", _before_cursor_execute)
+    event.listen(bind, "after_cursor_execute", _after_cursor_execute)
+    event.listen(bind, "handle_error", _handle_error)
+    _engines[name] = bind
+
+def _pool_lines():
+    # Occupation lue à la demande ; les pools sans taille fixe (SQLite en mémoire, NullPool) n'exposent que ce qu'ils ont
+    gauges = {
+        "qp_db_pool_size": ("Taille du pool de connexions.", "size"),
+        "qp_db_pool_checked_out": ("Connexions actuellement empruntées.", "checkedout"),
+        "qp_db_pool_overflow": ("Connexions ouvertes au-delà de la taille du pool.", "overflow"),
+    }
+    lines = []
+    for gauge, (help_text, method) in gauges.items():
+        # overflow() est négatif tant que le pool n'est pas plein : ramené à 0
+        samples = [(name, max(getattr(bind.pool, method)(), 0)) for name, bind in _engines.items() if hasattr(bind.pool, method)]
+        if samples:
+            lines += [f"# HELP {gauge} {help_text}", f"# TYPE {gauge} gauge"]
+            lines += [f'{gauge}{{engine="{name}"}} {value}' for name, value in samples]
+    return lines
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _pool_lines()
+    return "\n".join(lines) + "\n"
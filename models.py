@@ -1,11 +1,17 @@
 import enum
+from datetime import datetime
 from sqlalchemy import (
-    Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Enum
+    Boolean, Column, ForeignKey, Integer, String, Float, Date, DateTime, Enum, Index
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
 
+def app_now():
+    # Horloge unique des horodatages écrits par l'application (heure locale, naïve). Le `server_default`
+    # ne sert plus qu'aux insertions SQL brutes : CURRENT_TIMESTAMP de SQLite est en UTC.
+    return datetime.now()
+
 # Définition des rôles et statuts en tant qu'Enums pour la cohérence
 class UserRole(str, enum.Enum):
     ADMIN = "admin"
@@ -23,6 +29,17 @@ class OrderStatus(str, enum.Enum):
     EN_COURS = "en-cours"
     RECUE = "recue"
 
+class StockMovementType(str, enum.Enum):
+    VENTE = "vente"
+    RECEPTION = "reception"
+    AJUSTEMENT = "ajustement"
+    RETOUR = "retour"
+
+class LedgerEntryType(str, enum.Enum):
+    FACTURE = "facture"
+    PAIEMENT = "paiement"
+    AVOIR = "avoir"
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -41,10 +58,13 @@ class Supplier(Base):
     phone = Column(String, nullable=True)
     email = Column(String, nullable=True)
     address = Column(String, nullable=True)
+    lead_time_days = Column(Integer, nullable=False, default=7) # Délai de livraison habituel, utilisé par reorder.py
 
     products = relationship("Product", back_populates="supplier")
     purchase_orders = relationship("PurchaseOrder", back_populates="supplier")
 
+    __table_args__ = (Index("ix_suppliers_name_id", "name", "id"),)
+
 class Client(Base):
     __tablename__ = "clients"
     id = Column(Integer, primary_key=True, index=True)
@@ -55,9 +75,13 @@ class Client(Base):
     address = Column(String, nullable=True)
     nif = Column(String, nullable=True)
     stat = Column(String, nullable=True)
+    balance = Column(Float, nullable=False, default=0) # Encours : solde du compte client, maintenu avec le journal
+    credit_limit = Column(Float, nullable=True) # Plafond d'encours ; None = pas de plafond
 
     sales = relationship("Sale", back_populates="client")
 
+    __table_args__ = (Index("ix_clients_name_id", "name", "id"),)
+
 class Product(Base):
     __tablename__ = "products"
     id = Column(Integer, primary_key=True, index=True)
@@ -67,6 +91,8 @@ class Product(Base):
     purchase_price = Column(Float, nullable=False)
     selling_price = Column(Float, nullable=False)
     promo_price = Column(Float, nullable=True)
+    promo_start = Column(Date, nullable=True) # Période d'application du prix promo (bornes incluses, ouverte si vide)
+    promo_end = Column(Date, nullable=True)
     stock_quantity = Column(Float, nullable=False, default=0)
     unit = Column(String, nullable=True, default="Unité")
     image_url = Column(String, nullable=True)
@@ -76,14 +102,23 @@ class Product(Base):
     supplier = relationship("Supplier", back_populates="products")
     sale_items = relationship("SaleItem", back_populates="product")
     purchase_order_items = relationship("PurchaseOrderItem", back_populates="product")
+    stock_movements = relationship("StockMovement", back_populates="product")
+    price_history = relationship("PriceHistory", back_populates="product")
+
+    __table_args__ = (
+        Index("ix_products_name_id", "name", "id"),
+        Index("ix_products_supplier_id", "supplier_id"),
+        Index("ix_products_category_name_id", "category", "name", "id"),
+    )
 
 class Sale(Base):
     __tablename__ = "sales"
     id = Column(Integer, primary_key=True, index=True)
-    sale_date = Column(DateTime(timezone=True), server_default=func.now())
+    sale_date = Column(DateTime(timezone=True), default=app_now, server_default=func.now())
     total_amount = Column(Float, nullable=False)
     payment_method = Column(String, nullable=False)
     status = Column(Enum(SaleStatus), nullable=False, default=SaleStatus.PAYEE)
+    amount_paid = Column(Float, nullable=False, default=0) # Règlements imputés sur une vente à crédit
     
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -92,11 +127,20 @@ class Sale(Base):
     user = relationship("User", back_populates="sales")
     items = relationship("SaleItem", back_populates="sale", cascade="all, delete-orphan")
 
+    # Index alignés sur les filtres des requêtes (plages de dates semi-ouvertes, égalité en tête) :
+    # période seule, ventes par statut (crédits en cours) et historique d'un client, triés par date
+    __table_args__ = (
+        Index("ix_sales_sale_date_id", "sale_date", "id"),
+        Index("ix_sales_status_sale_date", "status", "sale_date", "id"),
+        Index("ix_sales_client_sale_date", "client_id", "sale_date", "id"),
+    )
+
 class SaleItem(Base):
     __tablename__ = "sale_items"
     id = Column(Integer, primary_key=True, index=True)
     quantity = Column(Float, nullable=False)
     price_per_unit = Column(Float, nullable=False)
+    unit_cost = Column(Float, nullable=True) # Prix d'achat du produit au moment de la vente
     
     sale_id = Column(Integer, ForeignKey("sales.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
@@ -104,10 +148,15 @@ class SaleItem(Base):
     sale = relationship("Sale", back_populates="items")
     product = relationship("Product", back_populates="sale_items")
 
+    __table_args__ = (
+        Index("ix_sale_items_sale_id", "sale_id"),
+        Index("ix_sale_items_product_sale", "product_id", "sale_id"),
+    )
+
 class PurchaseOrder(Base):
     __tablename__ = "purchase_orders"
     id = Column(Integer, primary_key=True, index=True)
-    order_date = Column(DateTime(timezone=True), server_default=func.now())
+    order_date = Column(DateTime(timezone=True), default=app_now, server_default=func.now())
     reception_date = Column(DateTime(timezone=True), nullable=True)
     total_cost = Column(Float, nullable=False)
     status = Column(Enum(OrderStatus), nullable=False, default=OrderStatus.EN_COURS)
@@ -117,6 +166,12 @@ class PurchaseOrder(Base):
     supplier = relationship("Supplier", back_populates="purchase_orders")
     items = relationship("PurchaseOrderItem", back_populates="order", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_purchase_orders_order_date_id", "order_date", "id"),
+        Index("ix_purchase_orders_status_reception", "status", "reception_date"),
+        Index("ix_purchase_orders_supplier_order_date", "supplier_id", "order_date", "id"),
+    )
+
 class PurchaseOrderItem(Base):
     __tablename__ = "purchase_order_items"
     id = Column(Integer, primary_key=True, index=True)
@@ -129,7 +184,99 @@ class PurchaseOrderItem(Base):
     order = relationship("PurchaseOrder", back_populates="items")
     product = relationship("Product", back_populates="purchase_order_items")
 
+    __table_args__ = (Index("ix_purchase_order_items_order_id", "order_id"),)
+
+# Journal des mouvements de stock : uniquement en ajout, jamais modifié.
+# `Product.stock_quantity` en est l'instantané maintenu dans la même transaction.
+class StockMovement(Base):
+    __tablename__ = "stock_movements"
+    id = Column(Integer, primary_key=True, index=True)
+    movement_date = Column(DateTime(timezone=True), nullable=False, default=app_now, server_default=func.now())
+    movement_type = Column(Enum(StockMovementType), nullable=False)
+    quantity = Column(Float, nullable=False) # Variation signée : négative pour une sortie
+    note = Column(String, nullable=True)
+
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    sale_id = Column(Integer, ForeignKey("sales.id"), nullable=True)
+    order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    product = relationship("Product", back_populates="stock_movements")
+
+    __table_args__ = (
+        Index("ix_stock_movements_product_date", "product_id", "movement_date"),
+        Index("ix_stock_movements_date", "movement_date"),
+    )
+
+# Compte client : uniquement en ajout, jamais modifié. Montant signé : positif pour une vente à crédit,
+# négatif pour un paiement ou un avoir. `Client.balance` en est le solde maintenu dans la même transaction.
+class ClientLedgerEntry(Base):
+    __tablename__ = "client_ledger"
+    id = Column(Integer, primary_key=True, index=True)
+    entry_date = Column(DateTime(timezone=True), nullable=False, default=app_now, server_default=func.now())
+    entry_type = Column(Enum(LedgerEntryType), nullable=False)
+    amount = Column(Float, nullable=False)
+    payment_method = Column(String, nullable=True)
+    note = Column(String, nullable=True)
+
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    sale_id = Column(Integer, ForeignKey("sales.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    __table_args__ = (
+        Index("ix_client_ledger_client_date", "client_id", "entry_date", "id"),
+        Index("ix_client_ledger_sale_id", "sale_id"),
+    )
+
+# Demande journalière par produit (moyenne et écart-type sur la fenêtre glissante), calculée par reorder.py.
+# Seuls les produits vendus depuis `through_sale_item_id` sont recalculés au passage suivant.
+class ProductDemand(Base):
+    __tablename__ = "product_demand"
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    daily_mean = Column(Float, nullable=False, default=0)
+    daily_std = Column(Float, nullable=False, default=0)
+    window_days = Column(Integer, nullable=False)
+    through_sale_item_id = Column(Integer, nullable=False) # Dernière ligne de vente prise en compte
+    computed_at = Column(DateTime(timezone=True), nullable=False, default=app_now, server_default=func.now())
+
+# Agrégats journaliers maintenus par create_sale, settle_credit_sale et receive_purchase_order
+# pour que les indicateurs ne dépendent pas de la taille de l'historique.
+class DailySalesRollup(Base):
+    __tablename__ = "daily_sales_rollup"
+    day = Column(Date, primary_key=True)
+    revenue = Column(Float, nullable=False, default=0)
+    sale_count = Column(Integer, nullable=False, default=0)
+    cost_of_goods = Column(Float, nullable=False, default=0)
+    realized_profit = Column(Float, nullable=False, default=0)
+    credit_outstanding = Column(Float, nullable=False, default=0)
+    purchases_received = Column(Float, nullable=False, default=0)
+
+# Compteur d'écritures par table, lu par le cache des données de référence (cache.py)
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+    table_name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
 class Setting(Base):
     __tablename__ = "settings"
     key = Column(String, primary_key=True, index=True)
     value = Column(String, nullable=True)
+
+class PriceHistory(Base):
+    __tablename__ = "price_history"
+    id = Column(Integer, primary_key=True, index=True)
+    changed_at = Column(DateTime(timezone=True), nullable=False, default=app_now, server_default=func.now())
+    old_selling_price = Column(Float, nullable=True)
+    new_selling_price = Column(Float, nullable=True)
+    old_promo_price = Column(Float, nullable=True)
+    new_promo_price = Column(Float, nullable=True)
+    promo_start = Column(Date, nullable=True)
+    promo_end = Column(Date, nullable=True)
+    note = Column(String, nullable=True)
+
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    product = relationship("Product", back_populates="price_history")
+
+    __table_args__ = (Index("ix_price_history_product_changed", "product_id", "changed_at"),)
@@ -0,0 +1,99 @@
+"""
+Réapprovisionnement par vitesse de vente.
+
+La demande journalière de chaque produit (moyenne et écart-type sur `WINDOW_DAYS` jours) est calculée
+avec NumPy à partir d'un extrait compact des lignes de vente (produit, jour, quantité), puis conservée
+dans `product_demand`. Le calcul est incrémental : sont relus et recalculés les produits vendus depuis le
+passage précédent, et ceux dont la demande non nulle date d'un jour antérieur (la fenêtre a glissé et des
+ventes en sont sorties) ; un produit qui ne se vend plus voit ainsi sa demande baisser jusqu'à zéro.
+Un recalcul complet reste possible (`full=True`, ou `python -m app.maintenance refresh-demand`).
+
+Les seuils sont dérivés au moment de la proposition, avec le délai de livraison actuel du fournisseur :
+    stock de sécurité = z × écart-type × √délai
+    point de commande = demande × délai + stock de sécurité
+    stock cible       = demande × (délai + jours de couverture) + stock de sécurité
+Un produit dont le stock disponible (stock + quantités en commande) est au point de commande ou en
+dessous est commandé jusqu'au stock cible. Les propositions sont regroupées par fournisseur sous forme de
+`schemas.PurchaseOrderCreate`, prêtes pour `crud.create_purchase_order`.
+"""
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy.orm import Session
+from . import crud, schemas
+
+WINDOW_DAYS = 90
+COVER_DAYS = 30
+SERVICE_Z = 1.65 # Taux de service visé d'environ 95 %
+DEFAULT_LEAD_TIME_DAYS = 7
+
+def daily_demand(product_ids, rows, start_date: date, window_days: int):
+    """Moyenne et écart-type de la demande journalière (jours sans vente compris) pour chaque produit de `product_ids`."""
+    ids = np.unique(np.asarray(product_ids, dtype=np.int64))
+    if not len(rows):
+        return ids, np.zeros(len(ids)), np.zeros(len(ids))
+    product = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    day = np.fromiter(((row[1].date() - start_date).days for row in rows), dtype=np.int64, count=len(rows))
+    quantity = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    # Matrice produits × jours remplie en une passe (les lignes d'un même jour s'additionnent)
+    position = np.searchsorted(ids, product)
+    totals = np.bincount(position * window_days + np.clip(day, 0, window_days - 1), weights=quantity, minlength=len(ids) * window_days)
+    totals = totals.reshape(len(ids), window_days)
+    return ids, totals.mean(axis=1), totals.std(axis=1)
+
+def refresh_demand(db: Session, full: bool = False, window_days: int = WINDOW_DAYS, today: date = None):
+    """Recalcule la demande des produits vendus depuis le dernier passage ou devenue périmée ; rend le nombre de produits recalculés."""
+    today = today or date.today()
+    start_date = today - timedelta(days=window_days - 1)
+    since = 0 if full else crud.get_demand_watermark(db)
+    through = crud.get_last_sale_item_id(db)
+    if full and through == 0:
+        return 0
+    product_ids, rows = crud.get_sales_velocity_extract(db, since, through, start_date, stale_before=datetime.combine(today, datetime.min.time()), window_days=window_days)
+    if not product_ids:
+        return 0
+    ids, mean, std = daily_demand(product_ids, rows, start_date, window_days)
+    computed_at = datetime.now()
+    crud.save_product_demand(db, [
+        {"product_id": int(product_id), "daily_mean": float(m), "daily_std": float(s), "window_days": window_days, "through_sale_item_id": through, "computed_at": computed_at}
+        for product_id, m, s in zip(ids, mean, std)
+    ])
+    return len(ids)
+
+def propose_purchase_orders(db: Session, cover_days: int = COVER_DAYS, service_z: float = SERVICE_Z, refresh: bool = True):
+    """
+    Commandes brouillons par fournisseur pour les produits sous leur point de commande.
+    Les produits sans fournisseur ne peuvent pas être commandés et sont ignorés.
+    """
+    if refresh:
+        refresh_demand(db)
+    candidates = [row for row in crud.get_reorder_candidates(db) if row.supplier_id is not None]
+    if not candidates:
+        return []
+    lead = np.array([DEFAULT_LEAD_TIME_DAYS if row.lead_time_days is None else row.lead_time_days for row in candidates], dtype=np.float64)
+    mean = np.array([row.daily_mean for row in candidates], dtype=np.float64)
+    std = np.array([row.daily_std for row in candidates], dtype=np.float64)
+    available = np.array([(row.stock_quantity or 0) + row.on_order for row in candidates], dtype=np.float64)
+    safety = service_z * std * np.sqrt(lead)
+    reorder_point = mean * lead + safety
+    target = mean * (lead + cover_days) + safety
+    quantity = np.ceil(target - available)
+    selected = np.flatnonzero((available <= reorder_point) & (quantity > 0))
+
+    proposals = {}
+    for i in selected:
+        row = candidates[i]
+        proposal = proposals.setdefault(row.supplier_id, {
+            "supplier_id": row.supplier_id, "supplier_name": row.supplier_name, "lead_time_days": int(lead[i]), "total_cost": 0.0, "lines": [],
+        })
+        proposal["lines"].append({
+            "product_id": row.id, "sku": row.sku, "name": row.name, "unit": row.unit, "stock_quantity": row.stock_quantity or 0, "on_order": row.on_order,
+            "daily_demand": round(float(mean[i]), 3), "reorder_point": round(float(reorder_point[i]), 1), "target_stock": round(float(target[i]), 1),
+            "quantity": float(quantity[i]), "purchase_price_per_unit": row.purchase_price,
+        })
+        proposal["total_cost"] += float(quantity[i]) * row.purchase_price
+    for proposal in proposals.values():
+        proposal["order"] = schemas.PurchaseOrderCreate(supplier_id=proposal["supplier_id"], items=[
+            schemas.PurchaseOrderItemCreate(product_id=line["product_id"], quantity=line["quantity"], purchase_price_per_unit=line["purchase_price_per_unit"])
+            for line in proposal["lines"]
+        ])
+    return sorted(proposals.values(), key=lambda proposal: proposal["total_cost"], reverse=True)
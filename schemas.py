@@ -1,7 +1,14 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime
-from .models import UserRole, ClientType, SaleStatus, OrderStatus
+from pydantic import BaseModel, Field, model_validator
+from typing import Generic, List, Optional, TypeVar
+from datetime import date, datetime
+from .models import UserRole, ClientType, SaleStatus, OrderStatus, StockMovementType, LedgerEntryType
+
+T = TypeVar("T")
+
+# Page d'une liste paginée par curseur (keyset) : `next_cursor` est opaque, None sur la dernière page
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
 
 # Schemas pour l'Authentification et les Utilisateurs
 class Token(BaseModel):
@@ -18,6 +25,11 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
+class UserUpdate(BaseModel):
+    role: Optional[UserRole] = None
+    is_active: Optional[bool] = None
+    password: Optional[str] = None
+
 class User(UserBase):
     id: int
     is_active: bool
@@ -32,6 +44,7 @@ class SupplierBase(BaseModel):
     phone: Optional[str] = None
     email: Optional[str] = None
     address: Optional[str] = None
+    lead_time_days: int = Field(7, ge=0)
 
 class SupplierCreate(SupplierBase):
     pass
@@ -42,6 +55,7 @@ class SupplierUpdate(BaseModel):
     phone: Optional[str] = None
     email: Optional[str] = None
     address: Optional[str] = None
+    lead_time_days: Optional[int] = Field(None, ge=0)
 
 class Supplier(SupplierBase):
     id: int
@@ -49,6 +63,15 @@ class Supplier(SupplierBase):
     class Config:
         from_attributes = True
 
+# Fiche fournisseur : agrégats calculés en base (crud.get_supplier_profile)
+class SupplierProfile(Supplier):
+    product_count: int
+    order_count: int
+    total_spent: float
+    pending_orders: int
+    last_order_date: Optional[datetime] = None
+    last_reception_date: Optional[datetime] = None
+
 # Schemas pour les Clients
 class ClientBase(BaseModel):
     name: str
@@ -58,6 +81,7 @@ class ClientBase(BaseModel):
     address: Optional[str] = None
     nif: Optional[str] = None
     stat: Optional[str] = None
+    credit_limit: Optional[float] = Field(None, ge=0)
 
 class ClientCreate(ClientBase):
     pass
@@ -70,26 +94,42 @@ class ClientUpdate(BaseModel):
     address: Optional[str] = None
     nif: Optional[str] = None
     stat: Optional[str] = None
+    credit_limit: Optional[float] = Field(None, ge=0)
 
-class Client(ClientBase):
+# Fiche sans solde : instantané du cache de référence (crud.get_reference_clients), que les écritures
+# du compte client n'invalident pas ; le solde se lit sur Client ou crud.get_client_credit
+class ClientReference(ClientBase):
     id: int
 
     class Config:
         from_attributes = True
 
+class Client(ClientReference):
+    balance: float = 0
+
+# Fiche client : agrégats calculés en base (crud.get_client_profile)
+class ClientProfile(Client):
+    sale_count: int
+    total_spent: float
+    last_sale_date: Optional[datetime] = None
+
 # Schemas pour les Produits
-class ProductBase(BaseModel):
+class ProductCatalogBase(BaseModel):
     sku: str
     name: str
     category: Optional[str] = "Non classé"
     purchase_price: float = Field(..., gt=0)
     selling_price: float = Field(..., gt=0)
     promo_price: Optional[float] = Field(None, gt=0)
-    stock_quantity: float = Field(..., ge=0)
+    promo_start: Optional[date] = None
+    promo_end: Optional[date] = None
     unit: Optional[str] = "Unité"
     image_url: Optional[str] = None
     supplier_id: Optional[int] = None
 
+class ProductBase(ProductCatalogBase):
+    stock_quantity: float = Field(..., ge=0)
+
 class ProductCreate(ProductBase):
     pass
 
@@ -98,19 +138,69 @@ class ProductUpdate(BaseModel):
     category: Optional[str] = None
     purchase_price: Optional[float] = Field(None, gt=0)
     selling_price: Optional[float] = Field(None, gt=0)
-    promo_price: Optional[float] = Field(None, gt=0)
+    promo_price: Optional[float] = Field(None, gt=0) # Promotion : une valeur nulle transmise explicitement l'efface
+    promo_start: Optional[date] = None
+    promo_end: Optional[date] = None
     stock_quantity: Optional[float] = Field(None, ge=0)
     unit: Optional[str] = None
     image_url: Optional[str] = None
     supplier_id: Optional[int] = None
 
-class Product(ProductBase):
+# Fiche sans stock : instantané du cache de référence (crud.get_reference_products), que les mouvements
+# de stock (ventes, réceptions, ajustements) n'invalident pas ; le stock se lit sur Product
+class ProductReference(ProductCatalogBase):
     id: int
     supplier: Optional[Supplier] = None # Afficher le fournisseur lié
 
     class Config:
         from_attributes = True
 
+class Product(ProductReference):
+    stock_quantity: float = Field(..., ge=0)
+
+# Révision des prix en masse : sélection (critères cumulés) puis nouveau prix de vente et/ou promo
+class BulkRepricing(BaseModel):
+    category: Optional[str] = None
+    supplier_id: Optional[int] = None
+    skus: Optional[List[str]] = None
+    all_products: bool = False # Requis pour réviser tout le catalogue, sans aucun critère
+    coefficient: Optional[float] = Field(None, gt=0) # Prix de vente = prix d'achat × coefficient
+    percent_change: Optional[float] = Field(None, gt=-100) # Variation du prix de vente actuel, en %
+    promo_percent: Optional[float] = Field(None, gt=0, lt=100) # Remise appliquée au prix de vente
+    promo_start: Optional[date] = None
+    promo_end: Optional[date] = None
+    clear_promo: bool = False
+
+    @model_validator(mode="after")
+    def check_operation(self):
+        if self.coefficient is not None and self.percent_change is not None:
+            raise ValueError("Choisir un coefficient ou une variation en %, pas les deux.")
+        if self.promo_percent is not None and self.clear_promo:
+            raise ValueError("Une promotion ne peut pas être à la fois appliquée et retirée.")
+        if self.coefficient is None and self.percent_change is None and self.promo_percent is None and not self.clear_promo:
+            raise ValueError("Aucune modification de prix demandée.")
+        if not (self.category or self.supplier_id or self.skus or self.all_products):
+            raise ValueError("Choisir une catégorie, un fournisseur ou des SKU, ou cocher explicitement tout le catalogue.")
+        if self.promo_start and self.promo_end and self.promo_end < self.promo_start:
+            raise ValueError("La fin de la promotion précède son début.")
+        return self
+
+class PriceHistory(BaseModel):
+    id: int
+    product_id: int
+    changed_at: datetime
+    old_selling_price: Optional[float] = None
+    new_selling_price: Optional[float] = None
+    old_promo_price: Optional[float] = None
+    new_promo_price: Optional[float] = None
+    promo_start: Optional[date] = None
+    promo_end: Optional[date] = None
+    note: Optional[str] = None
+    user_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
 # Schemas pour les Ventes
 class SaleItemBase(BaseModel):
     product_id: int
@@ -122,6 +212,7 @@ class SaleItemCreate(SaleItemBase):
 
 class SaleItem(SaleItemBase):
     id: int
+    unit_cost: Optional[float] = None
     product: Product # Afficher le produit détaillé dans l'item de vente
 
     class Config:
@@ -131,6 +222,7 @@ class SaleBase(BaseModel):
     total_amount: float
     payment_method: str
     status: SaleStatus
+    amount_paid: float = 0
     client_id: Optional[int] = None
     user_id: int
 
@@ -150,6 +242,61 @@ class Sale(SaleBase):
     class Config:
         from_attributes = True
         
+# Compte client : paiements (partiels ou non) et avoirs, imputés sur une vente ou sur les plus anciennes
+class ClientPayment(BaseModel):
+    amount: float = Field(..., gt=0)
+    payment_method: str
+    sale_id: Optional[int] = None
+    note: Optional[str] = None
+
+class ClientCreditNote(BaseModel):
+    amount: float = Field(..., gt=0)
+    note: str
+    sale_id: Optional[int] = None
+
+class ClientLedgerEntry(BaseModel):
+    id: int
+    entry_date: datetime
+    entry_type: LedgerEntryType
+    amount: float
+    payment_method: Optional[str] = None
+    note: Optional[str] = None
+    client_id: int
+    sale_id: Optional[int] = None
+    user_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+# Panier et devis côté serveur (crud.quote_cart) : le client n'envoie que produits et quantités
+class CartItem(BaseModel):
+    product_id: int
+    quantity: float = Field(..., gt=0)
+
+class Cart(BaseModel):
+    items: List[CartItem]
+    client_id: Optional[int] = None
+
+class QuoteLine(BaseModel):
+    product_id: int
+    sku: Optional[str] = None
+    name: Optional[str] = None # None : produit inconnu
+    unit: Optional[str] = None
+    quantity: float
+    unit_price: float = 0
+    regular_price: float = 0
+    line_total: float = 0
+    available: float
+    in_stock: bool
+
+class Quote(BaseModel):
+    lines: List[QuoteLine]
+    total: float
+    savings: float # Remise due aux promotions du jour
+    ok: bool
+    client_id: Optional[int] = None
+    credit: Optional[dict] = None # Encours, plafond et crédit disponible du client
+
 # Schemas pour les Commandes Fournisseurs
 class PurchaseOrderItemBase(BaseModel):
     product_id: int
@@ -185,6 +332,59 @@ class PurchaseOrder(PurchaseOrderBase):
     class Config:
         from_attributes = True
 
+# Propositions de réapprovisionnement (reorder.py) : une commande brouillon par fournisseur
+class ReorderLine(BaseModel):
+    product_id: int
+    sku: str
+    name: str
+    unit: Optional[str] = None
+    stock_quantity: float
+    on_order: float
+    daily_demand: float
+    reorder_point: float
+    target_stock: float
+    quantity: float
+    purchase_price_per_unit: float
+
+class ReorderProposal(BaseModel):
+    supplier_id: int
+    supplier_name: str
+    lead_time_days: int
+    total_cost: float
+    lines: List[ReorderLine]
+    order: PurchaseOrderCreate # À transmettre tel quel à la création de commande
+
+# Schemas pour les Mouvements de Stock
+class StockMovementBase(BaseModel):
+    product_id: int
+    movement_type: StockMovementType
+    quantity: float
+    note: Optional[str] = None
+
+# Signe imposé par type de mouvement (l'ajustement peut aller dans les deux sens) ;
+# les mouvements liés à une vente ou à une commande sont écrits par crud.create_sale / receive_purchase_order
+MOVEMENT_SIGNS = {StockMovementType.VENTE: -1, StockMovementType.RECEPTION: 1, StockMovementType.RETOUR: 1}
+
+class StockMovementCreate(StockMovementBase):
+    @model_validator(mode="after")
+    def check_sign(self):
+        if self.quantity == 0:
+            raise ValueError("La quantité d'un mouvement ne peut pas être nulle.")
+        sign = MOVEMENT_SIGNS.get(self.movement_type)
+        if sign is not None and self.quantity * sign < 0:
+            raise ValueError(f"Un mouvement « {self.movement_type.value} » doit être {'négatif' if sign < 0 else 'positif'}.")
+        return self
+
+class StockMovement(StockMovementBase):
+    id: int
+    movement_date: datetime
+    sale_id: Optional[int] = None
+    order_id: Optional[int] = None
+    user_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
 # Schemas pour les Paramètres
 class SettingBase(BaseModel):
     key: str
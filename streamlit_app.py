@@ -2,9 +2,12 @@
 
 import streamlit as st
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine
-from app import crud, schemas, models
+from app.database import SessionLocal, engine, check_database_settings
+from app import crud, schemas, models, exports, imports, invoices, metrics, reorder
+from app.config import REPORT_PREVIEW_ROWS, UI_EXPORT_MAX_ROWS
+from app.maintenance import run_migrations
 import pandas as pd
+from pydantic import ValidationError
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import json
@@ -36,10 +39,18 @@ st.markdown("""
 
 # --- CONSTANTES DE L'APPLICATION ---
 CATEGORIES = ["Peinture", "Plomberie", "Électricité", "Outillage", "Matériaux de Construction", "Quincaillerie", "Jardinage", "Sécurité", "Non classé"]
+POS_PAGE_SIZE = 24 # Produits affichés par page dans la grille de la caisse
 UNITS = ['Unité', 'Boite', 'Carton', 'Fût', 'Bidon', 'Sac', 'Rouleau', 'kg', 'Gramme', 'Litre', 'Mètre', 'Barre']
 COEFFICIENTS = {"Aucun (Manuel)": 1.0, "Marge de 20%": 1.2, "Marge de 30%": 1.3, "Marge de 40%": 1.4, "Marge de 50%": 1.5, "Marge de 75%": 1.75, "Marge de 100% (x2)": 2.0}
 
-models.Base.metadata.create_all(bind=engine)
+@st.cache_resource
+def init_database():
+    # Création des tables et mises à niveau : une seule fois par processus, pas à chaque rerun
+    check_database_settings()
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations()
+
+init_database()
 
 # Initialisation de la session state
 if 'db' not in st.session_state: st.session_state.db = SessionLocal()
@@ -79,13 +90,48 @@ def update_selling_price():
             st.session_state.selling_price_input = float(round(purchase_price * coefficient))
     except Exception: pass
 
-def generer_html_facture(sale: models.Sale, settings: dict):
-    def format_currency(value): return f"{value or 0:,.2f}".replace(",", " ")
-    items_html = "".join([f"<tr><td>{item.product.name} (Réf: {item.product.sku})</td><td class='center'>{item.quantity}</td><td class='right'>{format_currency(item.price_per_unit)} Ar</td><td class='right'>{format_currency(item.quantity * item.price_per_unit)} Ar</td></tr>" for item in sale.items])
-    client_html = "<h4>Client : Vente au comptoir</h4>"
-    if sale.client:
-        client_html = f"<h4>Client : {sale.client.name}</h4><p>{sale.client.address or ''}<br>Tel: {sale.client.phone or 'N/A'}<br>NIF: {sale.client.nif or 'N/A'} | STAT: {sale.client.stat or 'N/A'}</p>"
-    return f"""<!DOCTYPE html><html lang="fr"><head><meta charset="UTF-8"><title>Facture N°{sale.id}</title><style>body{{font-family:sans-serif;margin:0;}}.invoice-box{{max-width:800px;margin:auto;padding:30px;border:1px solid #eee;background:#fff;}} .header{{text-align:center;border-bottom:2px solid #333;padding-bottom:10px;margin-bottom:20px;}} .invoice-details{{display:flex;justify-content:space-between;margin-bottom:30px;}} table{{width:100%;border-collapse:collapse;}} th,td{{border-bottom:1px solid #ddd;padding:8px;}} th{{background-color:#f2f2f2;text-align:left;}} .right{{text-align:right;}} .center{{text-align:center;}} .total-row{{font-weight:bold;font-size:1.2em;border-top:2px solid #333;}} .footer{{text-align:center;margin-top:30px;font-size:0.9em;color:#777;}}</style></head><body><div class="invoice-box"><div class="header"><h2>{settings.get('nom_societe','Quincaillerie PRO')}</h2><p>{settings.get('adresse_societe','')}<br>Tél: {settings.get('tel_societe','')} | Email: {settings.get('email_societe','')}<br>NIF: {settings.get('nif_societe','')} | STAT: {settings.get('stat_societe','')}</p></div><div class="invoice-details"><div><strong>Facture N° :</strong> {sale.id}<br><strong>Date :</strong> {sale.sale_date.strftime('%d/%m/%Y %H:%M')}</div><div>{client_html}</div></div><table><thead><tr><th>Produit</th><th class="center">Quantité</th><th class="right">P.U.</th><th class="right">Sous-total</th></tr></thead><tbody>{items_html}</tbody><tfoot><tr><td colspan="3" class="total-row right">TOTAL</td><td class="total-row right">{format_currency(sale.total_amount)} Ar</td></tr></tfoot></table><div class="footer"><p>Merci de votre visite !</p></div></div></body></html>"""
+def paginer(key, fetch_page):
+    # Pagination par curseur : la pile des curseurs visités permet de revenir à la page précédente
+    stack_key = f"{key}_cursors"
+    if stack_key not in st.session_state: st.session_state[stack_key] = [None]
+    stack = st.session_state[stack_key]
+    rows, next_cursor = fetch_page(stack[-1])
+    c_prev, c_page, c_next = st.columns([1, 2, 1])
+    if len(stack) > 1 and c_prev.button("◀ Précédent", key=f"{key}_prev", use_container_width=True):
+        stack.pop(); st.rerun()
+    c_page.caption(f"Page {len(stack)}")
+    if next_cursor and c_next.button("Suivant ▶", key=f"{key}_next", use_container_width=True):
+        stack.append(next_cursor); st.rerun()
+    return rows
+
+def boutons_export(basename, columns, iter_rows, start_date, end_date, row_count, api_path=None):
+    # Fichier produit seulement pour le format demandé, plafonné à UI_EXPORT_MAX_ROWS lignes ;
+    # `iter_rows(limit)` relit la période en flux. L'export complet passe par l'API (`api_path`)
+    c_csv, c_xlsx = st.columns(2)
+    for col, export_format in ((c_csv, "csv"), (c_xlsx, "xlsx")):
+        writer, mime = exports.EXPORT_FORMATS[export_format]
+        key = f"export_{basename}_{export_format}"
+        period = (start_date, end_date)
+        if col.button(f"⚙️ Préparer l'export {export_format.upper()}", key=f"{key}_prepare", use_container_width=True):
+            st.session_state[key] = (period, b"".join(writer(columns, iter_rows(UI_EXPORT_MAX_ROWS))))
+        prepared = st.session_state.get(key)
+        if prepared and prepared[0] == period:
+            col.download_button(f"⬇️ Exporter en {export_format.upper()}", data=prepared[1], file_name=f"{basename}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{export_format}", mime=mime, key=key + "_download", use_container_width=True)
+    if row_count > UI_EXPORT_MAX_ROWS:
+        st.caption(f"Export limité aux {UI_EXPORT_MAX_ROWS} premières lignes sur {row_count}." + (f" Export complet : {api_path}?start_date={start_date}&end_date={end_date}&format=csv" if api_path else ""))
+
+def boutons_facture(sale_id, key):
+    # HTML et PDF servis depuis le cache des factures ; le PDF est produit en arrière-plan
+    html_facture = invoices.get_invoice_html(db, sale_id)
+    if html_facture is None: return
+    c_html, c_pdf = st.columns(2)
+    c_html.download_button(label=f"📄 Facture N°{sale_id} (HTML)", data=html_facture, file_name=f"facture_{sale_id}.html", mime="text/html", type="primary", key=f"{key}_html", use_container_width=True)
+    pdf_future = invoices.submit_invoice_pdf(db, sale_id)
+    if pdf_future is None: return
+    if pdf_future.done():
+        c_pdf.download_button(label=f"📑 Facture N°{sale_id} (PDF)", data=pdf_future.result(), file_name=f"facture_{sale_id}.pdf", mime="application/pdf", key=f"{key}_pdf", use_container_width=True)
+    elif c_pdf.button("⏳ PDF en préparation… Actualiser", key=f"{key}_pdf_wait", use_container_width=True):
+        st.rerun()
 
 # --- PAGES DE L'APPLICATION ---
 def page_dashboard():
@@ -106,7 +152,7 @@ def page_dashboard():
         else: st.dataframe([{"Produit": p.name, "Stock Restant": p.stock_quantity} for p in low_stock_products], use_container_width=True, hide_index=True)
     with col_recent_sales, st.container(border=True):
         st.subheader("🕒 Ventes Récentes")
-        recent_sales = crud.get_sales(db, limit=5)
+        recent_sales = crud.get_sales(db, limit=5, profile="list")
         if not recent_sales: st.info("Aucune vente récente.")
         else:
             for sale in recent_sales:
@@ -130,31 +176,47 @@ def page_finances():
         df_chart = pd.DataFrame({"Mois": months, "Chiffre Affaires": chart_data})
         df_chart['Mois'] = pd.Categorical(df_chart['Mois'], categories=months, ordered=True)
         st.bar_chart(df_chart, x="Mois", y="Chiffre Affaires", use_container_width=True)
+    with st.container(border=True):
+        st.subheader("Balance Âgée des Créances Clients")
+        aged = crud.get_aged_receivables(db)
+        if not aged: st.info("Aucune créance client.")
+        else:
+            st.dataframe([{"Client": row.name, **{label: row._mapping[key] for key, (label, _, _) in crud.AGING_BUCKETS.items()}, "Total dû": row.total,
+                           "Plafond": row.credit_limit} for row in aged], hide_index=True, use_container_width=True)
     with st.container(border=True):
         st.subheader("Ventes à Crédit en Attente de Paiement")
-        credit_sales = [sale for sale in crud.get_sales(db, limit=1000) if sale.status == models.SaleStatus.CREDIT]
+        credit_sales = paginer("credit_sales", lambda cursor: crud.get_sales_page(db, cursor=cursor, limit=50, status=models.SaleStatus.CREDIT, oldest_first=True))
         if not credit_sales: st.info("Aucune vente à crédit en attente.")
         else:
-            for sale in sorted(credit_sales, key=lambda s: s.sale_date):
+            for sale in credit_sales:
                 days_old = (datetime.now().date() - sale.sale_date.date()).days
                 with st.container(border=True):
                     col1, col2 = st.columns([4, 1])
                     col1.markdown(f"**Vente n°{sale.id}** pour **{sale.client.name if sale.client else 'N/A'}**")
-                    col1.text(f"Montant: {sale.total_amount:,.2f} Ar | Ancienneté: {days_old} jours".replace(",", " "))
+                    col1.text(f"Montant: {sale.total_amount:,.2f} Ar | Reste dû: {sale.total_amount - sale.amount_paid:,.2f} Ar | Ancienneté: {days_old} jours".replace(",", " "))
                     if col2.button("Régler le crédit", key=f"settle_{sale.id}", use_container_width=True):
                         st.session_state.settling_sale_id = sale.id; st.rerun()
     if st.session_state.get("settling_sale_id"):
-        sale_to_settle = crud.get_sale(db, st.session_state.settling_sale_id)
+        sale_to_settle = crud.get_sale(db, st.session_state.settling_sale_id, profile="list")
         if sale_to_settle:
             with st.form("settle_credit_form"):
                 st.subheader(f"Régler la Vente N°{sale_to_settle.id}")
-                st.write(f"Client: **{sale_to_settle.client.name if sale_to_settle.client else 'N/A'}** | Montant: **{sale_to_settle.total_amount:,.2f} Ar**".replace(",", " "))
+                remaining = sale_to_settle.total_amount - sale_to_settle.amount_paid
+                st.write(f"Client: **{sale_to_settle.client.name if sale_to_settle.client else 'N/A'}** | Montant: **{sale_to_settle.total_amount:,.2f} Ar** | Reste dû: **{remaining:,.2f} Ar**".replace(",", " "))
                 payment_method = st.selectbox("Mode de règlement", ["Espèce", "Chèque", "Virement", "Carte visa", "Airtel money", "Orange money", "Mvola"])
+                # Paiement partiel possible pour les ventes rattachées à un compte client
+                amount = st.number_input("Montant encaissé (Ar)", min_value=0.0, max_value=float(remaining), value=float(remaining), disabled=not sale_to_settle.client_id)
                 c1, c2 = st.columns(2)
                 if c1.form_submit_button("Confirmer", type="primary", use_container_width=True):
-                    crud.settle_credit_sale(db, sale_id=sale_to_settle.id, payment_method=payment_method)
-                    st.toast(f"La vente n°{sale_to_settle.id} a été réglée.", icon="🎉")
-                    st.session_state.settling_sale_id = None; st.rerun()
+                    try:
+                        if sale_to_settle.client_id and amount < remaining:
+                            crud.record_client_payment(db, sale_to_settle.client_id, amount, payment_method, sale_id=sale_to_settle.id, user_id=st.session_state.current_user.id)
+                            st.toast(f"Paiement partiel enregistré sur la vente n°{sale_to_settle.id}.", icon="💰")
+                        else:
+                            crud.settle_credit_sale(db, sale_id=sale_to_settle.id, payment_method=payment_method)
+                            st.toast(f"La vente n°{sale_to_settle.id} a été réglée.", icon="🎉")
+                        st.session_state.settling_sale_id = None; st.rerun()
+                    except ValueError as e: st.error(f"Erreur: {e}")
                 if c2.form_submit_button("Annuler", use_container_width=True):
                     st.session_state.settling_sale_id = None; st.rerun()
 
@@ -178,7 +240,7 @@ def page_produits():
             default_supplier_name = editing_product.supplier.name if editing_product and editing_product.supplier else ""
             default_purchase_price = editing_product.purchase_price if editing_product else 0.0
             default_selling_price = editing_product.selling_price if editing_product else 0.0
-            default_promo_price = editing_product.promo_price if editing_product else 0.0
+            default_promo_price = (editing_product.promo_price or 0.0) if editing_product else 0.0
             default_stock = editing_product.stock_quantity if editing_product else 0
             
             name = st.text_input("Nom", value=default_name)
@@ -186,7 +248,7 @@ def page_produits():
             c1, c2 = st.columns(2)
             category = c1.selectbox("Catégorie", options=CATEGORIES, index=CATEGORIES.index(default_category) if default_category in CATEGORIES else 0)
             unit = c2.selectbox("Unité", options=UNITS, index=UNITS.index(default_unit) if default_unit in UNITS else 0)
-            suppliers = crud.get_suppliers(db)
+            suppliers = crud.get_reference_suppliers(db)
             supplier_map = {s.name: s.id for s in suppliers}
             supplier_list = list(supplier_map.keys())
             supplier_name = st.selectbox("Fournisseur", options=supplier_list, index=supplier_list.index(default_supplier_name) if default_supplier_name in supplier_list else 0)
@@ -196,7 +258,10 @@ def page_produits():
             purchase_price = col1.number_input("Prix d'achat", min_value=0.0, step=0.01, value=default_purchase_price)
             coefficient_str = col2.selectbox("Marge", options=COEFFICIENTS.keys())
             selling_price = col3.number_input("Prix de vente", min_value=0.0, step=0.01, value=default_selling_price)
-            promo_price = st.number_input("Prix promo", min_value=0.0, step=0.01, value=default_promo_price)
+            cp1, cp2, cp3 = st.columns(3)
+            promo_price = cp1.number_input("Prix promo", min_value=0.0, step=0.01, value=default_promo_price, help="0 : aucune promotion (la promotion en cours est retirée)")
+            promo_start = cp2.date_input("Début promo", value=editing_product.promo_start if editing_product else None, format="DD/MM/YYYY")
+            promo_end = cp3.date_input("Fin promo", value=editing_product.promo_end if editing_product else None, format="DD/MM/YYYY")
             st.markdown("---")
             st.number_input("Stock", value=default_stock, disabled=True)
             
@@ -205,7 +270,7 @@ def page_produits():
             if col_btn1.form_submit_button("Enregistrer", type="primary", use_container_width=True):
                 final_sku = editing_product.sku if editing_product else crud.generate_sku(db, name)
                 final_promo_price = promo_price if promo_price > 0 else None
-                product_data = {"name": name, "sku": final_sku, "category": category, "supplier_id": supplier_map.get(supplier_name), "purchase_price": purchase_price, "selling_price": selling_price, "unit": unit, "promo_price": final_promo_price}
+                product_data = {"name": name, "sku": final_sku, "category": category, "supplier_id": supplier_map.get(supplier_name), "purchase_price": purchase_price, "selling_price": selling_price, "unit": unit, "promo_price": final_promo_price, "promo_start": promo_start, "promo_end": promo_end}
                 
                 if st.session_state.editing_id:
                     crud.update_product(db, product_id=st.session_state.editing_id, product_update=schemas.ProductUpdate(**product_data))
@@ -219,12 +284,67 @@ def page_produits():
             if col_btn2.form_submit_button("Annuler", use_container_width=True):
                 st.session_state.form_type = None; st.session_state.editing_id = None; st.rerun()
 
+    if st.session_state.current_user.role == "admin":
+        with st.expander("💱 Révision des prix en masse"):
+            suppliers_by_name = {s.name: s.id for s in crud.get_reference_suppliers(db)}
+            c1, c2 = st.columns(2)
+            rp_category = c1.selectbox("Catégorie", options=["Toutes"] + CATEGORIES, key="rp_category")
+            rp_supplier = c2.selectbox("Fournisseur", options=["Tous"] + list(suppliers_by_name), key="rp_supplier")
+            rp_skus = st.text_input("SKU (séparés par des virgules, optionnel)", key="rp_skus")
+            rp_all = st.checkbox("Tout le catalogue (aucun critère)", key="rp_all")
+            rp_mode = st.radio("Prix de vente", ["Inchangé", "Coefficient sur le prix d'achat", "Variation en %"], horizontal=True, key="rp_mode")
+            rp_coefficient = rp_percent = None
+            if rp_mode == "Coefficient sur le prix d'achat":
+                rp_coefficient = COEFFICIENTS[st.selectbox("Marge", options=[k for k, v in COEFFICIENTS.items() if v > 1.0], key="rp_coefficient")]
+            elif rp_mode == "Variation en %":
+                rp_percent = st.number_input("Variation (%)", min_value=-99.0, value=5.0, step=0.5, key="rp_percent")
+            rp_promo = st.radio("Promotion", ["Inchangée", "Appliquer une remise", "Retirer"], horizontal=True, key="rp_promo")
+            rp_promo_percent = rp_promo_start = rp_promo_end = None
+            if rp_promo == "Appliquer une remise":
+                cp1, cp2, cp3 = st.columns(3)
+                rp_promo_percent = cp1.number_input("Remise (%)", min_value=1.0, max_value=99.0, value=10.0, key="rp_promo_percent")
+                rp_promo_start = cp2.date_input("Du", value=datetime.now().date(), format="DD/MM/YYYY", key="rp_promo_start")
+                rp_promo_end = cp3.date_input("Au", value=None, format="DD/MM/YYYY", key="rp_promo_end")
+            try:
+                repricing = schemas.BulkRepricing(
+                    category=None if rp_category == "Toutes" else rp_category, supplier_id=suppliers_by_name.get(rp_supplier),
+                    skus=[sku.strip() for sku in rp_skus.split(",") if sku.strip()] or None, all_products=rp_all, coefficient=rp_coefficient, percent_change=rp_percent,
+                    promo_percent=rp_promo_percent, promo_start=rp_promo_start, promo_end=rp_promo_end, clear_promo=rp_promo == "Retirer",
+                )
+            except ValidationError as e:
+                st.info(e.errors()[0]["msg"].removeprefix("Value error, "))
+            else:
+                c1, c2 = st.columns(2)
+                if c1.button("Prévisualiser", use_container_width=True):
+                    preview = crud.preview_repricing(db, repricing, limit=500)
+                    if not preview: st.warning("Aucun produit ne correspond à la sélection.")
+                    else:
+                        st.dataframe(pd.DataFrame([tuple(r)[1:] for r in preview], columns=["SKU", "Produit", "Prix d'achat", "Ancien prix", "Nouveau prix", "Ancienne promo", "Nouvelle promo", "Début promo", "Fin promo"]), use_container_width=True, hide_index=True)
+                        if len(preview) == 500: st.caption("Aperçu limité aux 500 premiers produits.")
+                if c2.button("Appliquer", type="primary", use_container_width=True):
+                    updated = crud.apply_repricing(db, repricing, user_id=st.session_state.current_user.id)
+                    st.success(f"Prix mis à jour pour {updated} produit(s).")
+    with st.expander("📥 Importer un catalogue (CSV / XLSX)"):
+        st.caption("Colonnes reconnues : SKU, Nom, Catégorie, Prix d'achat, Prix de vente, Prix promo, Stock, Unité, Fournisseur. Les SKU absents sont générés ; un SKU existant met à jour le produit.")
+        fichier = st.file_uploader("Fichier du catalogue", type=list(imports.IMPORT_READERS))
+        if fichier and st.button("Importer", type="primary"):
+            try:
+                rows = imports.read_product_file(fichier.name, fichier.getvalue())
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                with st.spinner(f"Import de {len(rows)} ligne(s)..."):
+                    report = crud.import_products(db, rows, user_id=st.session_state.current_user.id)
+                st.success(f"{report['created']} produit(s) créé(s), {report['updated']} mis à jour.")
+                if report["errors"]:
+                    st.warning(f"{len(report['errors'])} ligne(s) ignorée(s) :")
+                    st.dataframe(pd.DataFrame(report["errors"]).rename(columns={"row": "Ligne", "sku": "SKU", "error": "Erreur"}), use_container_width=True, hide_index=True)
     with st.container(border=True):
         st.subheader("Liste des produits")
-        products = crud.get_products(db, limit=1000)
+        products = paginer("products_list", lambda cursor: crud.get_products_page(db, cursor=cursor, limit=100))
         if not products: st.warning("Aucun produit trouvé.")
         else:
-            suppliers_map = {s.id: s.name for s in crud.get_suppliers(db)}
+            suppliers_map = {s.id: s.name for s in crud.get_reference_suppliers(db)}
             display_data = [{"ID": p.id, "Nom": p.name, "SKU": p.sku, "Catégorie": p.category, "Fournisseur": suppliers_map.get(p.supplier_id, "N/A"), "Prix Vente": f"{p.selling_price or 0:,.2f} Ar".replace(",", " "), "Stock": p.stock_quantity, "Unité": p.unit} for p in products]
             st.dataframe(display_data, use_container_width=True, hide_index=True)
             product_map = {f"{p.id} - {p.name}": p.id for p in products}
@@ -238,26 +358,29 @@ def page_fournisseurs():
     with st.expander("➕ Ajouter un nouveau fournisseur"):
         with st.form("new_supplier_form", clear_on_submit=True):
             name = st.text_input("Nom"); contact = st.text_input("Contact"); phone = st.text_input("Téléphone"); email = st.text_input("Email"); address = st.text_area("Adresse")
+            lead_time = st.number_input("Délai de livraison (jours)", min_value=0, value=7, step=1)
             if st.form_submit_button("Ajouter") and name:
-                crud.create_supplier(db, supplier=schemas.SupplierCreate(name=name, contact_person=contact, phone=phone, email=email, address=address))
+                crud.create_supplier(db, supplier=schemas.SupplierCreate(name=name, contact_person=contact, phone=phone, email=email, address=address, lead_time_days=lead_time))
                 st.success(f"Fournisseur '{name}' ajouté !"); st.rerun()
     st.markdown("---")
     st.header("Analyse par Fournisseur")
-    suppliers = crud.get_suppliers(db)
+    suppliers = crud.get_reference_suppliers(db)
     if not suppliers: st.warning("Aucun fournisseur trouvé."); return
     supplier_map = {f"{s.id} - {s.name}": s.id for s in suppliers}
     selected_str = st.selectbox("Sélectionner un fournisseur", options=supplier_map.keys())
     if selected_str:
         supplier_id = supplier_map[selected_str]
-        supplier = crud.get_supplier(db, supplier_id)
+        supplier = crud.get_supplier_profile(db, supplier_id)
         if not supplier: return
-        supplier_orders = crud.get_orders_by_supplier(db, supplier_id=supplier_id)
-        total_spent = sum(o.total_cost for o in supplier_orders)
-        num_products = len([p for p in crud.get_products(db) if p.supplier_id == supplier_id])
         with st.container(border=True):
-            st.subheader(f"Statistiques pour {supplier.name}")
-            c1,c2,c3 = st.columns(3); c1.metric("Total Achats", f"{total_spent:,.2f} Ar".replace(",", " ")); c2.metric("Nb Commandes", len(supplier_orders)); c3.metric("Nb Produits Associés", num_products)
+            st.subheader(f"Statistiques pour {supplier['name']}")
+            c1,c2,c3 = st.columns(3); c1.metric("Total Achats", f"{supplier['total_spent']:,.2f} Ar".replace(",", " ")); c2.metric("Nb Commandes", supplier['order_count'], help=f"{supplier['pending_orders']} en cours"); c3.metric("Nb Produits Associés", supplier['product_count'])
+            if supplier['last_order_date']: st.caption(f"Dernière commande le {supplier['last_order_date']:%d/%m/%Y}" + (f", dernière réception le {supplier['last_reception_date']:%d/%m/%Y}" if supplier['last_reception_date'] else ""))
+            new_lead_time = st.number_input("Délai de livraison (jours)", min_value=0, value=supplier['lead_time_days'], step=1, key=f"lead_time_{supplier_id}")
+            if new_lead_time != supplier['lead_time_days']:
+                crud.update_supplier(db, supplier_id, schemas.SupplierUpdate(lead_time_days=new_lead_time)); st.rerun()
         st.subheader("Historique des Commandes")
+        supplier_orders = paginer(f"supplier_orders_{supplier_id}", lambda cursor: crud.get_purchase_orders_page(db, cursor=cursor, limit=20, supplier_id=supplier_id, profile="detail"))
         if not supplier_orders: st.info("Aucun historique de commandes.")
         else:
             for order in supplier_orders:
@@ -274,26 +397,30 @@ def page_clients():
         with st.form("new_client_form", clear_on_submit=True):
             name=st.text_input("Nom/Raison Sociale"); c_type=st.selectbox("Type", ["Particulier", "Professionnel"]); phone=st.text_input("Téléphone"); email=st.text_input("Email"); address=st.text_area("Adresse")
             nif, stat = (st.text_input("NIF"), st.text_input("STAT")) if c_type == "Professionnel" else (None, None)
+            credit_limit = st.number_input("Plafond de crédit (Ar, 0 = sans plafond)", min_value=0.0, value=0.0, step=10000.0)
             if st.form_submit_button("Ajouter") and name:
-                crud.create_client(db, client=schemas.ClientCreate(name=name, type=c_type, phone=phone, email=email, address=address, nif=nif, stat=stat))
+                crud.create_client(db, client=schemas.ClientCreate(name=name, type=c_type, phone=phone, email=email, address=address, nif=nif, stat=stat, credit_limit=credit_limit or None))
                 st.success(f"Client '{name}' ajouté !"); st.rerun()
     st.markdown("---")
     st.header("Analyse par Client")
-    clients = crud.get_clients(db)
+    clients = crud.get_reference_clients(db)
     if not clients: st.warning("Aucun client trouvé."); return
     client_map = {f"{c.id} - {c.name}": c.id for c in clients}
     selected_str = st.selectbox("Sélectionner un client", options=client_map.keys())
     if selected_str:
         client_id = client_map[selected_str]
-        client = crud.get_client(db, client_id)
+        client = crud.get_client_profile(db, client_id)
         if not client: return
-        client_sales = crud.get_sales_by_client(db, client_id=client_id)
-        total_spent = sum(s.total_amount for s in client_sales)
-        total_credit = sum(s.total_amount for s in client_sales if s.status == models.SaleStatus.CREDIT)
         with st.container(border=True):
-            st.subheader(f"Statistiques pour {client.name}")
-            c1,c2,c3 = st.columns(3); c1.metric("CA Total", f"{total_spent:,.2f} Ar".replace(",", " ")); c2.metric("Crédits Actuels", f"{total_credit:,.2f} Ar".replace(",", " ")); c3.metric("Nb Achats", len(client_sales))
+            st.subheader(f"Statistiques pour {client['name']}")
+            c1,c2,c3 = st.columns(3); c1.metric("CA Total", f"{client['total_spent']:,.2f} Ar".replace(",", " ")); c2.metric("Encours", f"{client['balance']:,.2f} Ar".replace(",", " ")); c3.metric("Nb Achats", client['sale_count'])
+            if client['last_sale_date']: st.caption(f"Dernier achat le {client['last_sale_date']:%d/%m/%Y}")
+            new_limit = st.number_input("Plafond de crédit (Ar, 0 = sans plafond)", min_value=0.0, value=float(client['credit_limit'] or 0), step=10000.0, key=f"credit_limit_{client_id}")
+            if (new_limit or None) != client['credit_limit']:
+                crud.update_client(db, client_id, schemas.ClientUpdate(credit_limit=new_limit or None)); st.rerun()
+        compte_client(client_id, client['balance'])
         st.subheader("Historique des Ventes")
+        client_sales = paginer(f"client_sales_{client_id}", lambda cursor: crud.get_sales_page(db, cursor=cursor, limit=20, client_id=client_id, profile="invoice"))
         if not client_sales: st.info("Aucun historique de ventes.")
         else:
             for sale in client_sales:
@@ -301,17 +428,43 @@ def page_clients():
                     st.markdown(f"**Paiement :** {sale.payment_method}; **Statut :** {sale.status.value}")
                     items_data = [{"Produit": i.product.name, "Qté": i.quantity, "P.U.": f"{i.price_per_unit:,.2f} Ar".replace(",", " ")} for i in sale.items]
                     st.dataframe(items_data, hide_index=True, use_container_width=True)
+            sale_to_reprint = st.selectbox("Réimprimer une facture", options=[None] + [sale.id for sale in client_sales], format_func=lambda sale_id: "—" if sale_id is None else f"Vente n°{sale_id}")
+            if sale_to_reprint: boutons_facture(sale_to_reprint, key="client_invoice")
+
+def compte_client(client_id, balance):
+    # Compte client : encaissement (imputé sur les ventes à crédit les plus anciennes), avoir et journal
+    with st.expander("💳 Compte client"):
+        if balance > 0:
+            with st.form(f"client_payment_{client_id}", clear_on_submit=True):
+                c1, c2 = st.columns(2)
+                amount = c1.number_input("Montant (Ar)", min_value=0.0, max_value=float(balance), value=0.0, step=1000.0)
+                payment_method = c2.selectbox("Mode de règlement", ["Espèce", "Chèque", "Virement", "Carte visa", "Airtel money", "Orange money", "Mvola", "Avoir"])
+                note = st.text_input("Note (obligatoire pour un avoir)")
+                if st.form_submit_button("Enregistrer", type="primary") and amount > 0:
+                    try:
+                        user_id = st.session_state.current_user.id
+                        if payment_method == "Avoir":
+                            if not note: raise ValueError("Un avoir doit être motivé.")
+                            crud.record_credit_note(db, client_id, amount, note, user_id=user_id)
+                        else:
+                            crud.record_client_payment(db, client_id, amount, payment_method, note=note or None, user_id=user_id)
+                        st.toast("Compte client mis à jour.", icon="💰"); st.rerun()
+                    except ValueError as e: st.error(f"Erreur: {e}")
+        else: st.info("Aucun encours pour ce client.")
+        entries = paginer(f"ledger_{client_id}", lambda cursor: crud.get_client_ledger_page(db, client_id, cursor=cursor, limit=20))
+        if entries:
+            st.dataframe([{"Date": e.entry_date.strftime('%d/%m/%Y %H:%M'), "Type": e.entry_type.value, "Montant": e.amount, "Vente": e.sale_id, "Mode": e.payment_method, "Note": e.note} for e in entries], hide_index=True, use_container_width=True)
 
 def page_commandes():
     st.header("Gestion des Commandes Fournisseurs")
     with st.expander("📝 Créer une nouvelle commande"):
-        suppliers = crud.get_suppliers(db)
+        suppliers = crud.get_reference_suppliers(db)
         if not suppliers: st.warning("Veuillez d'abord ajouter un fournisseur.", icon="⚠️"); return
         supplier_map = {s.name: s.id for s in suppliers}
         selected_supplier_name = st.selectbox("1. Choisir un fournisseur", options=supplier_map.keys())
         if selected_supplier_name:
             supplier_id = supplier_map[selected_supplier_name]
-            products_of_supplier = [p for p in crud.get_products(db) if p.supplier_id == supplier_id]
+            products_of_supplier = crud.get_supplier_products(db, supplier_id)
             if not products_of_supplier: st.info("Aucun produit associé à ce fournisseur.")
             else:
                 product_map = {f"{p.name} (Achat: {p.purchase_price} Ar)": p for p in products_of_supplier}
@@ -340,9 +493,24 @@ def page_commandes():
                 order_data = schemas.PurchaseOrderCreate(supplier_id=supplier_id, items=[schemas.PurchaseOrderItemCreate(**item) for item in st.session_state.commande_items if item['quantity'] > 0])
                 crud.create_purchase_order(db, order=order_data)
                 st.success("Commande enregistrée !"); st.session_state.commande_items = []; st.rerun()
+    with st.expander("🔁 Réapprovisionnement suggéré (vitesse de vente)"):
+        st.caption("Quantités calculées sur la demande des 90 derniers jours, le délai de livraison du fournisseur et le stock déjà en commande.")
+        cover_days = st.number_input("Jours de couverture", min_value=0, value=30, step=5)
+        if st.button("Calculer les propositions"):
+            st.session_state.reorder_proposals = reorder.propose_purchase_orders(db, cover_days=cover_days)
+        proposals = st.session_state.get("reorder_proposals")
+        if proposals is not None and not proposals: st.success("Aucun produit sous son point de commande.")
+        for proposal in proposals or []:
+            st.markdown(f"**{proposal['supplier_name']}** — délai {proposal['lead_time_days']} j — Total : {proposal['total_cost']:,.2f} Ar".replace(",", " "))
+            st.dataframe([{"Produit": line["name"], "Stock": line["stock_quantity"], "En commande": line["on_order"], "Demande/j": line["daily_demand"], "Point de commande": line["reorder_point"],
+                           "Stock cible": line["target_stock"], "À commander": line["quantity"], "P.U.": line["purchase_price_per_unit"]} for line in proposal["lines"]], hide_index=True, use_container_width=True)
+            if st.button("Créer cette commande", key=f"reorder_{proposal['supplier_id']}"):
+                order = crud.create_purchase_order(db, order=proposal["order"])
+                st.session_state.reorder_proposals = [p for p in proposals if p is not proposal]
+                st.success(f"Commande N°{order.id} enregistrée."); st.rerun()
     with st.container(border=True):
         st.subheader("Historique des commandes")
-        orders = crud.get_purchase_orders(db)
+        orders = crud.get_purchase_orders(db, profile="list")
         if not orders: st.info("Aucune commande passée.")
         else:
             for order in orders:
@@ -363,55 +531,60 @@ def page_ventes():
     if st.session_state.get("last_sale_id"):
         with st.container(border=True):
             st.success(f"Vente N°{st.session_state.last_sale_id} enregistrée !")
-            sale_to_print = crud.get_sale(db, st.session_state.last_sale_id)
-            settings = crud.get_settings(db)
-            if sale_to_print:
-                html_facture = generer_html_facture(sale_to_print, settings)
-                st.download_button(label=f"📄 Télécharger Facture N°{st.session_state.last_sale_id}", data=html_facture, file_name=f"facture_{st.session_state.last_sale_id}.html", mime="text/html", type="primary")
+            boutons_facture(st.session_state.last_sale_id, key="pos_invoice")
     
     col_selection, col_panier = st.columns([2, 1])
     with col_selection, st.container(border=True):
         st.subheader("1. Sélection des Produits")
-        products_in_stock = [p for p in crud.get_products(db) if p.stock_quantity > 0]
-        if not products_in_stock: st.warning("Aucun produit en stock disponible."); return
-        search_term = st.text_input("Rechercher un produit")
-        if search_term: products_in_stock = [p for p in products_in_stock if search_term.lower() in p.name.lower()]
+        c_search, c_category = st.columns([2, 1])
+        search_term = c_search.text_input("Rechercher un produit (nom, référence, catégorie)")
+        category = c_category.selectbox("Catégorie", options=["Toutes"] + CATEGORIES, disabled=bool(search_term))
+        if search_term:
+            products_in_stock = crud.search_products(db, search_term, limit=POS_PAGE_SIZE, in_stock=True)
+            if not products_in_stock: st.info("Aucun produit en stock ne correspond à la recherche.")
+        else:
+            # Une seule page de produits en stock par rendu, quelle que soit la taille du catalogue
+            products_in_stock = paginer(f"pos_products_{category}", lambda cursor: crud.get_products_page(db, cursor=cursor, limit=POS_PAGE_SIZE, category=None if category == "Toutes" else category, in_stock=True))
+            if not products_in_stock: st.info("Aucun produit en stock dans cette catégorie.")
         for product in products_in_stock:
-            with st.container(border=True):
-                c1, c2, c3 = st.columns([3, 2, 1])
-                price = product.promo_price if product.promo_price and product.promo_price > 0 else product.selling_price
-                c1.markdown(f"**{product.name}**")
-                c2.markdown(f"Prix: **{price:,.2f} Ar** | Stock: `{product.stock_quantity}`".replace(",", " "))
-                if c3.button("Ajouter", key=f"add_sale_{product.id}"):
-                    st.session_state.last_sale_id = None
-                    item_exists = next((item for item in st.session_state.panier_items if item['product_id'] == product.id), None)
-                    if item_exists:
-                        if item_exists['quantity'] < item_exists['max_stock']: item_exists['quantity'] += 1
-                        else: st.toast("Stock maximum atteint.", icon="⚠️")
-                    else:
-                        st.session_state.panier_items.append({"product_id": product.id, "name": product.name, "quantity": 1, "price_per_unit": price, "max_stock": product.stock_quantity})
-                    st.rerun()
+            c1, c2, c3 = st.columns([3, 2, 1])
+            c1.markdown(f"**{product.name}**")
+            c2.markdown(f"Prix: **{crud.effective_price(product):,.2f} Ar** | Stock: `{product.stock_quantity}`".replace(",", " "))
+            if c3.button("Ajouter", key=f"add_sale_{product.id}"):
+                st.session_state.last_sale_id = None
+                item_exists = next((item for item in st.session_state.panier_items if item['product_id'] == product.id), None)
+                if item_exists: item_exists['quantity'] += 1
+                else: st.session_state.panier_items.append({"product_id": product.id, "quantity": 1})
+                st.rerun()
     with col_panier, st.container(border=True):
         st.subheader("2. Panier Actuel")
         if not st.session_state.panier_items: st.info("Le panier est vide.")
         else:
-            total_vente = 0
-            for i, item in enumerate(st.session_state.panier_items):
+            # Le panier ne garde que produits et quantités : prix, promotions et stock viennent du devis serveur
+            quote = crud.quote_cart(db, [(item['product_id'], item['quantity']) for item in st.session_state.panier_items])
+            unknown = {line['product_id'] for line in quote["lines"] if line['name'] is None}
+            if unknown:
+                # Produits supprimés depuis leur ajout au panier : retirés, puis panier re-chiffré
+                st.session_state.panier_items = [item for item in st.session_state.panier_items if item['product_id'] not in unknown]
+                st.toast(f"{len(unknown)} produit(s) introuvable(s) retiré(s) du panier.", icon="⚠️"); st.rerun()
+            quantities = {item['product_id']: item for item in st.session_state.panier_items}
+            for line in quote["lines"]:
                 with st.container(border=True):
-                    st.markdown(f"**{item['name']}**")
+                    st.markdown(f"**{line['name'] or 'Produit introuvable'}**" + (" 🏷️ Promo" if line['unit_price'] < line['regular_price'] else ""))
                     c_qty_lbl, c_qty_wgt, c_total, c_del = st.columns([1,3,3,1])
                     c_qty_lbl.markdown("<p style='padding-top: 30px;'>Qté:</p>", unsafe_allow_html=True)
-                    new_qty = c_qty_wgt.number_input("Qté", min_value=1, max_value=int(item['max_stock']), value=item['quantity'], key=f"qty_sale_{i}", label_visibility="collapsed")
-                    if new_qty != item['quantity']: st.session_state.panier_items[i]['quantity'] = new_qty; st.rerun()
-                    subtotal = item['price_per_unit'] * item['quantity']; total_vente += subtotal
-                    c_total.markdown(f"<p style='text-align: right; padding-top: 30px;'>Total: {subtotal:,.2f} Ar</p>".replace(",", " "), unsafe_allow_html=True)
-                    if c_del.button("🗑️", key=f"del_sale_{i}", use_container_width=True):
-                        st.session_state.panier_items.pop(i); st.rerun()
+                    new_qty = c_qty_wgt.number_input("Qté", min_value=1, value=int(line['quantity']), key=f"qty_sale_{line['product_id']}", label_visibility="collapsed")
+                    if new_qty != line['quantity']: quantities[line['product_id']]['quantity'] = new_qty; st.rerun()
+                    c_total.markdown(f"<p style='text-align: right; padding-top: 30px;'>Total: {line['line_total']:,.2f} Ar</p>".replace(",", " "), unsafe_allow_html=True)
+                    if c_del.button("🗑️", key=f"del_sale_{line['product_id']}", use_container_width=True):
+                        st.session_state.panier_items.remove(quantities[line['product_id']]); st.rerun()
+                    if not line['in_stock']: st.warning(f"Stock disponible : {line['available']}")
             st.markdown("---")
-            st.subheader(f"Total à payer : {total_vente:,.2f} Ar".replace(",", " "))
+            st.subheader(f"Total à payer : {quote['total']:,.2f} Ar".replace(",", " "))
+            if quote['savings'] > 0: st.caption(f"Dont {quote['savings']:,.2f} Ar de remises promotionnelles".replace(",", " "))
             with st.form("finalize_sale_form"):
                 st.subheader("3. Finaliser la Vente")
-                clients = crud.get_clients(db)
+                clients = crud.get_reference_clients(db)
                 client_map = {f"{c.id} - {c.name}": c.id for c in clients}
                 client_map["-- Vente au comptoir --"] = None
                 client_options = list(client_map.keys())
@@ -423,10 +596,13 @@ def page_ventes():
                     client_id = client_map[selected_client_str]
                     if payment_method == "Crédit" and not client_id:
                         st.error("Une vente à crédit doit être associée à un client.")
+                    elif not quote["ok"]:
+                        st.error("Stock insuffisant pour au moins un produit du panier.")
                     else:
-                        sale_data = schemas.SaleCreate(client_id=client_id, payment_method=payment_method, status="credit" if payment_method == "Crédit" else "payee", items=[schemas.SaleItemCreate(**{k: v for k, v in item.items() if k in schemas.SaleItemCreate.model_fields}) for item in st.session_state.panier_items])
+                        sale_data = schemas.SaleCreate(client_id=client_id, payment_method=payment_method, status="credit" if payment_method == "Crédit" else "payee", items=[schemas.SaleItemCreate(product_id=line['product_id'], quantity=line['quantity'], price_per_unit=line['unit_price']) for line in quote["lines"] if line['name'] is not None])
                         try:
                             new_sale = crud.create_sale(db, sale=sale_data, user_id=st.session_state.current_user.id)
+                            invoices.submit_invoice_pdf(db, new_sale.id)
                             st.session_state.panier_items = []
                             st.session_state.last_sale_id = new_sale.id
                             st.rerun()
@@ -452,6 +628,16 @@ def page_personnel():
         else:
             display_data = [{"ID": u.id, "Nom d'utilisateur": u.username, "Rôle": u.role.value, "Actif": "Oui" if u.is_active else "Non"} for u in users]
             st.dataframe(display_data, use_container_width=True, hide_index=True)
+            user_map = {f"{u.id} - {u.username}": u for u in users}
+            selected_user = user_map[st.selectbox("Sélectionner un membre à modifier", options=user_map.keys())]
+            with st.form("edit_user_form"):
+                roles = [e.value for e in models.UserRole]
+                c1, c2 = st.columns(2)
+                new_role = c1.selectbox("Rôle", options=roles, index=roles.index(selected_user.role.value))
+                is_active = c2.checkbox("Compte actif", value=selected_user.is_active)
+                if st.form_submit_button("Mettre à jour"):
+                    crud.update_user(db, user_id=selected_user.id, user_update=schemas.UserUpdate(role=new_role, is_active=is_active))
+                    st.success(f"Utilisateur '{selected_user.username}' mis à jour !"); st.rerun()
 
 def page_parametres():
     st.header("Paramètres de la Société")
@@ -482,31 +668,70 @@ def page_etats():
         c1, c2 = st.columns(2)
         start_date = c1.date_input("Date de début", value=start_default)
         end_date = c2.date_input("Date de fin", value=end_default)
+        group_by = st.selectbox("Regrouper l'analyse par", options=list(crud.REPORT_GROUPINGS), format_func=crud.REPORT_GROUPINGS.get)
+    # Rapports conservés d'une exécution à l'autre (boutons d'export) tant que les filtres ne changent pas
     if st.button("📊 Générer les Rapports", type="primary", use_container_width=True):
-        tab_v, tab_a, tab_s, tab_b = st.tabs(["📈 Ventes", "📥 Achats", "📦 Stock", "💰 Bénéfices"])
+        st.session_state.etats_filters = (start_date, end_date, group_by)
+    if st.session_state.get("etats_filters") == (start_date, end_date, group_by):
+        tab_v, tab_r, tab_a, tab_s, tab_b = st.tabs(["📈 Ventes", "🧮 Analyse", "📥 Achats", "📦 Stock", "💰 Bénéfices"])
         with tab_v:
             st.subheader(f"Rapport Ventes du {start_date.strftime('%d/%m/%Y')} au {end_date.strftime('%d/%m/%Y')}")
-            sales = crud.get_sales_in_date_range(db, start_date=start_date, end_date=end_date)
-            total_ca = sum(s.total_amount for s in sales)
-            c1,c2=st.columns(2); c1.metric("CA Période", f"{total_ca:,.2f} Ar".replace(",", " ")); c2.metric("Nb Ventes", len(sales))
-            if sales: st.dataframe([{"ID": s.id, "Date": s.sale_date.strftime('%d/%m/%Y'), "Client": s.client.name if s.client else "Comptoir", "Montant": s.total_amount} for s in sales], use_container_width=True, hide_index=True)
+            nb_ventes, total_ca = crud.get_sales_export_totals(db, start_date=start_date, end_date=end_date)
+            c1,c2=st.columns(2); c1.metric("CA Période", f"{total_ca:,.2f} Ar".replace(",", " ")); c2.metric("Nb Ventes", nb_ventes)
+            if nb_ventes:
+                sales = crud.iter_sales_export_rows(db, start_date=start_date, end_date=end_date, limit=REPORT_PREVIEW_ROWS)
+                st.dataframe(pd.DataFrame([[exports.format_cell(v) for v in row] for row in sales], columns=crud.SALES_EXPORT_COLUMNS), use_container_width=True, hide_index=True)
+                if nb_ventes > REPORT_PREVIEW_ROWS: st.caption(f"Aperçu : {REPORT_PREVIEW_ROWS} premières ventes sur {nb_ventes}.")
+                boutons_export("ventes", crud.SALES_EXPORT_COLUMNS, lambda limit: crud.iter_sales_export_rows(db, start_date=start_date, end_date=end_date, limit=limit), start_date, end_date, nb_ventes, "/api/reports/sales/export")
+        with tab_r:
+            st.subheader(f"Analyse des ventes par {crud.REPORT_GROUPINGS[group_by].lower()}")
+            report = crud.get_report(db, start_date=start_date, end_date=end_date, group_by=group_by)
+            c1,c2,c3=st.columns(3)
+            c1.metric("CA", f"{sum(r.revenue for r in report):,.2f} Ar".replace(",", " ")); c2.metric("Coût", f"{sum(r.cost for r in report):,.2f} Ar".replace(",", " ")); c3.metric("Marge", f"{sum(r.margin for r in report):,.2f} Ar".replace(",", " "))
+            if report:
+                df_report = pd.DataFrame([tuple(r) for r in report], columns=crud.REPORT_COLUMNS).drop(columns="Clé")
+                st.dataframe(df_report, use_container_width=True, hide_index=True)
+                if group_by in ("day", "week", "month"): st.bar_chart(df_report.set_index("Libellé")[["CA", "Marge"]])
+                boutons_export(f"analyse_{group_by}", crud.REPORT_COLUMNS, lambda limit: report[:limit], start_date, end_date, len(report))
         with tab_a:
             st.subheader(f"Rapport Achats Reçus du {start_date.strftime('%d/%m/%Y')} au {end_date.strftime('%d/%m/%Y')}")
-            orders = crud.get_received_orders_in_date_range(db, start_date=start_date, end_date=end_date)
-            total_achats = sum(o.total_cost for o in orders)
-            c1,c2=st.columns(2); c1.metric("Coût Total Achats", f"{total_achats:,.2f} Ar".replace(",", " ")); c2.metric("Nb Commandes Reçues", len(orders))
-            if orders: st.dataframe([{"ID": o.id, "Date Réception": o.reception_date.strftime('%d/%m/%Y'), "Fournisseur": o.supplier.name, "Coût": o.total_cost} for o in orders], use_container_width=True, hide_index=True)
+            nb_commandes, total_achats = crud.get_received_orders_export_totals(db, start_date=start_date, end_date=end_date)
+            c1,c2=st.columns(2); c1.metric("Coût Total Achats", f"{total_achats:,.2f} Ar".replace(",", " ")); c2.metric("Nb Commandes Reçues", nb_commandes)
+            if nb_commandes:
+                orders = crud.iter_received_orders_export_rows(db, start_date=start_date, end_date=end_date, limit=REPORT_PREVIEW_ROWS)
+                st.dataframe(pd.DataFrame([[exports.format_cell(v) for v in row] for row in orders], columns=crud.ORDERS_EXPORT_COLUMNS), use_container_width=True, hide_index=True)
+                if nb_commandes > REPORT_PREVIEW_ROWS: st.caption(f"Aperçu : {REPORT_PREVIEW_ROWS} premières commandes sur {nb_commandes}.")
+                boutons_export("achats", crud.ORDERS_EXPORT_COLUMNS, lambda limit: crud.iter_received_orders_export_rows(db, start_date=start_date, end_date=end_date, limit=limit), start_date, end_date, nb_commandes, "/api/reports/received-orders/export")
         with tab_s:
             st.subheader("État des Stocks (actuel)")
-            products = crud.get_products(db)
-            total_val = sum(p.purchase_price * p.stock_quantity for p in products)
-            c1,c2=st.columns(2); c1.metric("Valeur Totale Stock", f"{total_val:,.2f} Ar".replace(",", " ")); c2.metric("Nb Références", len(products))
+            nb_references, total_val = crud.get_stock_valuation(db)
+            c1,c2=st.columns(2); c1.metric("Valeur Totale Stock", f"{total_val:,.2f} Ar".replace(",", " ")); c2.metric("Nb Références", nb_references)
+            products = paginer("etats_stock", lambda cursor: crud.get_products_page(db, cursor=cursor, limit=REPORT_PREVIEW_ROWS))
             if products: st.dataframe([{"Produit": p.name, "SKU": p.sku, "Stock": p.stock_quantity, "Valeur": p.purchase_price * p.stock_quantity} for p in products], use_container_width=True, hide_index=True)
         with tab_b:
             st.subheader("Rapport des Bénéfices")
             real_profit = crud.get_realized_profit_in_date_range(db, start_date=start_date, end_date=end_date)
             proj_profit = crud.get_finance_kpis(db).get('projected_profit', 0)
             c1,c2=st.columns(2); c1.metric(f"Bénéfice Réel (période)", f"{real_profit:,.2f} Ar".replace(",", " ")); c2.metric("Bénéfice Prévisionnel (stock)", f"{proj_profit:,.2f} Ar".replace(",", " "))
+    with st.container(border=True):
+        st.subheader("🧾 Factures et relevés en lot")
+        clients = {c.name: c.id for c in crud.get_reference_clients(db)}
+        c1, c2, c3 = st.columns(3)
+        lot_client = c1.selectbox("Client", options=["Tous (période)"] + list(clients))
+        lot_content = c2.radio("Contenu", ["Factures et relevés", "Factures", "Relevés de crédit"])
+        lot_format = c3.radio("Format", ["html", "pdf"] if invoices.PDF_AVAILABLE else ["html"], format_func=str.upper)
+        lot_client_id = clients.get(lot_client)
+        if lot_client_id: st.caption("Toutes les ventes du client, sans filtre de période.")
+        if st.button("Générer l'archive ZIP", use_container_width=True):
+            barre = st.progress(0.0, text="Préparation...")
+            archive = b"".join(invoices.iter_invoice_archive(
+                db, None if lot_client_id else start_date, None if lot_client_id else end_date, lot_client_id, lot_format,
+                invoices=lot_content != "Relevés de crédit", statements=lot_content != "Factures",
+                progress=lambda done, total: barre.progress(min(done / max(total, 1), 1.0), text=f"{done} / {total} document(s)"),
+            ))
+            barre.progress(1.0, text="Archive prête.")
+            nom = f"factures_client_{lot_client_id}.zip" if lot_client_id else f"factures_{start_date:%Y%m%d}_{end_date:%Y%m%d}.zip"
+            st.download_button("⬇️ Télécharger l'archive", data=archive, file_name=nom, mime="application/zip", type="primary")
 
 # --- ROUTAGE PRINCIPAL DE L'INTERFACE ---
 if not st.session_state.logged_in:
@@ -552,4 +777,8 @@ else:
     }
     page_function = PAGES.get(st.session_state.menu_choice)
     if page_function:
-        page_function()
\ No newline at end of file
+        # Durée et nombre de requêtes SQL de chaque rendu de page (mêmes mesures que les routes de l'API)
+        with metrics.track("page", st.session_state.menu_choice) as rendu:
+            page_function()
+        if user.role == "admin":
+            st.sidebar.caption(f"⏱ Page rendue en {rendu.duration * 1000:.0f} ms · {rendu.statements} requête(s) SQL")
\ No newline at end of file
@@ -0,0 +1,36 @@
+import sys
+import types
+from pathlib import Path
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+# Le paquet est importé sous le nom `app` (python -m app.main) : le dépôt peut être extrait sous un autre nom
+ROOT = Path(__file__).resolve().parent.parent
+if "app" not in sys.modules:
+    try:
+        import app # noqa: F401
+    except ImportError:
+        package = types.ModuleType("app")
+        package.__path__ = [str(ROOT)]
+        sys.modules["app"] = package
+
+from app import models, benchmark # noqa: E402
+from app.database import make_engine # noqa: E402
+from app.maintenance import run_migrations # noqa: E402
+
+def make_fixture_db(path, **volumes):
+    """Base SQLite migrée et remplie par benchmark.generate_fixtures ; rend une usine de sessions."""
+    bind = make_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind)
+    run_migrations(bind)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+    db = session_factory()
+    try:
+        benchmark.generate_fixtures(db, **volumes)
+    finally:
+        db.close()
+    return session_factory
+
+@pytest.fixture(scope="session")
+def fixture_db(tmp_path_factory):
+    return make_fixture_db(tmp_path_factory.mktemp("db") / "fixtures.db", products=300, clients=40, suppliers=10, sales=1500, orders=120, days=120)
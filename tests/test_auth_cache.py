@@ -0,0 +1,68 @@
+"""Cache d'authentification : sans SQL quand il sert, invalidé par les modifications de comptes."""
+import asyncio
+import pytest
+from jose import jwt
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app import crud, dependencies, schemas
+from app.config import SECRET_KEY, ALGORITHM
+from app.database import make_engine
+from conftest import make_fixture_db
+
+@pytest.fixture
+def auth_db(tmp_path):
+    path = tmp_path / "auth.db"
+    api_sessions = make_fixture_db(path, products=5, clients=2, suppliers=1, sales=5, orders=1, days=5)
+    dependencies.clear_auth_cache()
+    db = api_sessions()
+    yield path, db
+    db.close()
+    dependencies.clear_auth_cache()
+
+TOKEN = jwt.encode({"sub": "caissier1"}, SECRET_KEY, algorithm=ALGORITHM)
+
+def test_cache_hit_runs_no_query(auth_db):
+    path, db = auth_db
+    dependencies.get_current_user(TOKEN, db)
+    statements = []
+    bind = db.get_bind()
+    listener = lambda *args: statements.append(args[2])
+    event.listen(bind, "before_cursor_execute", listener)
+    try:
+        dependencies.get_current_user(TOKEN, db)
+    finally:
+        event.remove(bind, "before_cursor_execute", listener)
+    assert statements == []
+
+def test_local_update_invalidates_immediately(auth_db):
+    path, db = auth_db
+    assert dependencies.get_current_user(TOKEN, db).is_active
+    crud.update_user(db, 1, schemas.UserUpdate(is_active=False))
+    assert not dependencies.get_current_user(TOKEN, db).is_active
+
+def test_other_process_update_invalidates_after_poll(auth_db):
+    path, db = auth_db
+    assert dependencies.get_current_user(TOKEN, db).is_active
+    # Autre processus (Streamlit, autre worker) : même base, compteur local de ce processus inchangé
+    with make_engine(f"sqlite:///{path}").begin() as conn:
+        conn.execute(text("UPDATE users SET is_active = 0 WHERE id = 1"))
+        conn.execute(text("INSERT INTO table_versions (table_name, version) VALUES ('users', 1) ON CONFLICT (table_name) DO UPDATE SET version = version + 1"))
+    db.rollback()
+    assert dependencies.get_current_user(TOKEN, db).is_active # Version partagée pas encore relue
+    dependencies._shared_version_checked_at = float("-inf") # Délai de relecture écoulé
+    assert not dependencies.get_current_user(TOKEN, db).is_active
+
+def test_async_dependency_uses_the_async_session(auth_db):
+    path, db = auth_db
+    async def authenticate():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with AsyncSession(engine) as session:
+                first = await dependencies.get_current_user_async(TOKEN, session)
+                second = await dependencies.get_current_user_async(TOKEN, session) # Servi par le cache
+                return first, second, await dependencies.get_current_active_user_async(second)
+        finally:
+            await engine.dispose()
+    first, second, active = asyncio.run(authenticate())
+    assert first.username == "caissier1" and second is first and active is first
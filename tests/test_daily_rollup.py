@@ -0,0 +1,24 @@
+"""Agrégats journaliers : le cumul en direct et la reconstruction complète rangent chaque vente le même jour."""
+from datetime import datetime
+from app import crud, models, schemas
+from conftest import make_fixture_db
+
+def _rollup(db):
+    return {row.day: (round(row.revenue, 2), row.sale_count, round(row.credit_outstanding, 2)) for row in db.query(models.DailySalesRollup)}
+
+def test_live_rollup_matches_rebuild_near_midnight(tmp_path, monkeypatch):
+    session_factory = make_fixture_db(tmp_path / "rollup.db", products=20, clients=5, suppliers=2, sales=50, orders=5, days=10)
+    db = session_factory()
+    try:
+        crud.rebuild_daily_sales_rollup(db)
+        monkeypatch.setattr(models, "app_now", lambda: datetime(2030, 1, 1, 23, 59, 59))
+        product = db.query(models.Product).filter(models.Product.stock_quantity >= 1).first()
+        sale = crud.create_sale(db, schemas.SaleCreate(payment_method="Espèce", status=models.SaleStatus.PAYEE, items=[
+            schemas.SaleItemCreate(product_id=product.id, quantity=1, price_per_unit=0),
+        ]), user_id=1)
+        assert sale.sale_date.date() == datetime(2030, 1, 1).date()
+        live = _rollup(db)
+        crud.rebuild_daily_sales_rollup(db)
+        assert _rollup(db) == live
+    finally:
+        db.close()
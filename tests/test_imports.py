@@ -0,0 +1,36 @@
+"""Import du catalogue : lecture des fichiers et enregistrement."""
+import pytest
+from app import crud, imports, models
+
+def test_single_column_csv():
+    assert imports.read_csv("Nom\nVis 6x40\nClou 50\n".encode()) == [{"row": 2, "name": "Vis 6x40"}, {"row": 3, "name": "Clou 50"}]
+
+def test_non_utf8_csv_is_a_readable_error():
+    with pytest.raises(ValueError, match="UTF-8"):
+        imports.read_csv("Nom;Prix de vente\nCâble;1200\n".encode("latin-1"))
+
+def test_generated_skus_avoid_explicit_skus_of_the_file(fixture_db):
+    db = fixture_db()
+    try:
+        prefix = crud.generate_sku(db, "Zzyzx")[:4]
+        report = crud.import_products(db, [
+            {"sku": f"{prefix}00001", "name": "Zzyzx rouge", "purchase_price": 10, "selling_price": 15},
+            {"name": "Zzyzx bleu", "purchase_price": 10, "selling_price": 15},
+        ])
+        assert report["errors"] == [] and report["created"] == 2
+    finally:
+        db.close()
+
+def test_numeric_supplier_and_price_history(fixture_db):
+    db = fixture_db()
+    try:
+        product = db.query(models.Product).first()
+        report = crud.import_products(db, [{"sku": product.sku, "selling_price": product.selling_price + 100, "supplier": 123456}])
+        assert report["errors"] == [{"row": 1, "sku": product.sku, "error": "Fournisseur inconnu : 123456"}]
+        old_price = product.selling_price
+        report = crud.import_products(db, [{"sku": product.sku, "selling_price": old_price + 100}], user_id=1)
+        assert report["updated"] == 1
+        history = crud.get_price_history(db, product.id)[0]
+        assert (history.old_selling_price, history.new_selling_price, history.note) == (old_price, old_price + 100, "Import catalogue")
+    finally:
+        db.close()
@@ -0,0 +1,25 @@
+"""Factures PDF : un rendu en échec n'est pas conservé dans le cache."""
+import pytest
+from app import invoices, models
+
+@pytest.mark.skipif(not invoices.PDF_AVAILABLE, reason="fpdf2 non installé")
+def test_failed_pdf_is_not_cached(fixture_db, monkeypatch):
+    attempts = []
+    def flaky_render(context):
+        attempts.append(context["sale"]["id"])
+        if len(attempts) == 1:
+            raise RuntimeError("échec passager")
+        return b"%PDF"
+    monkeypatch.setattr(invoices, "render_invoice_pdf", flaky_render)
+    invoices._invoice_cache.clear()
+    db = fixture_db()
+    try:
+        sale_id = db.query(models.Sale.id).order_by(models.Sale.id).limit(1).scalar()
+        with pytest.raises(RuntimeError):
+            invoices.submit_invoice_pdf(db, sale_id).result(timeout=10)
+        assert invoices.submit_invoice_pdf(db, sale_id).result(timeout=10) == b"%PDF"
+        assert invoices.submit_invoice_pdf(db, sale_id).result(timeout=10) == b"%PDF"
+        assert len(attempts) == 2
+    finally:
+        db.close()
+        invoices._invoice_cache.clear()
@@ -0,0 +1,52 @@
+"""Profils de chargement (crud.LOAD_PROFILES) : nombre de requêtes constant quel que soit le volume, sans lazy load."""
+import pytest
+from sqlalchemy import event, func
+from app import crud, invoices, models, schemas
+from conftest import make_fixture_db
+
+def _sale_with_most_items(db):
+    return db.query(models.SaleItem.sale_id).group_by(models.SaleItem.sale_id).order_by(func.count().desc()).limit(1).scalar()
+
+# Chaque usage lit exactement ce que lit son appelant réel (page Streamlit, route API, facture)
+USAGES = {
+    "sale_list": lambda db: [(sale.client.name if sale.client else None, sale.user.username) for sale in crud.get_sales_page(db, limit=100, profile="list")[0]],
+    "sale_detail": lambda db: [schemas.Sale.model_validate(sale) for sale in crud.get_sales_page(db, limit=100, profile="detail")[0]],
+    "sale_detail_one": lambda db: schemas.Sale.model_validate(crud.get_sale(db, _sale_with_most_items(db))),
+    "order_list": lambda db: [order.supplier.name for order in crud.get_purchase_orders_page(db, limit=100, profile="list")[0]],
+    "order_detail": lambda db: [schemas.PurchaseOrder.model_validate(order) for order in crud.get_purchase_orders_page(db, limit=100, profile="detail")[0]],
+    "invoice": lambda db: invoices.invoice_context(crud.get_sale(db, _sale_with_most_items(db), profile="invoice"), {}),
+}
+
+@pytest.fixture(scope="module")
+def databases(tmp_path_factory, fixture_db):
+    small = make_fixture_db(tmp_path_factory.mktemp("small") / "small.db", products=20, clients=5, suppliers=3, sales=30, orders=10, days=30)
+    return {"small": small, "large": fixture_db}
+
+def _count_queries(session_factory, usage):
+    db = session_factory()
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    bind = db.get_bind()
+    event.listen(bind, "before_cursor_execute", count)
+    try:
+        with crud.forbid_lazy_loads(db):
+            usage(db)
+    finally:
+        event.remove(bind, "before_cursor_execute", count)
+        db.close()
+    return len(statements)
+
+@pytest.mark.parametrize("name", list(USAGES))
+def test_profile_query_count_is_constant(databases, name):
+    counts = {size: _count_queries(session_factory, USAGES[name]) for size, session_factory in databases.items()}
+    assert counts["small"] == counts["large"], counts
+
+def test_lazy_load_is_refused(fixture_db):
+    db = fixture_db()
+    try:
+        sale = crud.get_sales_page(db, limit=1, profile="list")[0][0]
+        with crud.forbid_lazy_loads(db), pytest.raises(crud.LazyLoadError):
+            sale.items
+    finally:
+        db.close()
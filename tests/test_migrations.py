@@ -0,0 +1,24 @@
+"""Migrations : colonnes ajoutées aux tables existantes par maintenance._add_missing_columns."""
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from app import models
+from app.database import make_engine
+from app.maintenance import _add_missing_columns, _ddl_default
+
+def test_defaults_are_rendered_by_the_column_type():
+    status = models.Sale.__table__.c.status
+    assert str(_ddl_default(status, sqlite.dialect())) == "'PAYEE'"
+    assert str(_ddl_default(status, postgresql.dialect())) == "'PAYEE'"
+    is_active = models.User.__table__.c.is_active
+    assert str(_ddl_default(is_active, postgresql.dialect())) == "true"
+
+def test_missing_column_is_added_with_its_default(tmp_path):
+    bind = make_engine(f"sqlite:///{tmp_path / 'migration.db'}")
+    models.Base.metadata.create_all(bind)
+    with bind.begin() as conn:
+        conn.execute(text("ALTER TABLE suppliers DROP COLUMN lead_time_days"))
+        conn.execute(text("INSERT INTO suppliers (name) VALUES ('Ancien fournisseur')"))
+    assert _add_missing_columns(bind) == ["suppliers.lead_time_days"]
+    assert "lead_time_days" in {column["name"] for column in inspect(bind).get_columns("suppliers")}
+    with bind.connect() as conn:
+        assert conn.execute(text("SELECT lead_time_days FROM suppliers")).scalar() == 7
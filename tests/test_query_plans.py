@@ -0,0 +1,15 @@
+"""Plans d'exécution SQLite des requêtes sensibles au volume (cas définis dans benchmark.PLAN_CHECKS)."""
+import pytest
+from app import benchmark
+
+@pytest.mark.parametrize("name", list(benchmark.PLAN_CHECKS))
+def test_query_uses_its_indexes(fixture_db, name):
+    run, expected = benchmark.PLAN_CHECKS[name]
+    plan = benchmark.query_plan(fixture_db, run)
+    assert plan, "aucune requête SELECT relevée"
+    assert benchmark.plan_problems(plan, expected) == [], "\n".join(plan)
+
+def test_full_scan_detection():
+    plan = ["SEARCH sales USING INDEX ix_sales_status_sale_date (status=?)", "SCAN sale_items USING INDEX ix_sale_items_sale_id", "SCAN sales"]
+    assert benchmark.plan_problems(plan, {"ix_sales_status_sale_date"}) == ["parcours complet : SCAN sales"]
+    assert benchmark.plan_problems(plan[2:], {"ix_sales_status_sale_date"}) == ["index non utilisé : ix_sales_status_sale_date", "parcours complet : SCAN sales"]
@@ -0,0 +1,35 @@
+"""Rapports : clés de période identiques sur SQLite et PostgreSQL (semaines ISO 8601)."""
+from datetime import date, datetime, timedelta
+from sqlalchemy import DateTime, literal, select
+from app import crud, models
+
+def test_week_bucket_is_iso(fixture_db):
+    db = fixture_db()
+    try:
+        # 29/12/2024 : dimanche de la semaine 52 de 2024 ; 30/12/2024 : lundi de la semaine 1 de 2025 ; 01/01/2021 : semaine 53 de 2020
+        for moment, expected in ((datetime(2024, 12, 29, 23, 59), "2024-S52"), (datetime(2024, 12, 30), "2025-S01"), (datetime(2021, 1, 1, 12), "2020-S53")):
+            assert db.execute(select(crud._date_bucket(db, literal(moment, DateTime), "week"))).scalar() == expected
+    finally:
+        db.close()
+
+def test_weekly_report_keys_match_isocalendar(fixture_db):
+    db = fixture_db()
+    try:
+        start, end = date.today() - timedelta(days=60), date.today()
+        expected = {"{}-S{:02d}".format(*sale_date.isocalendar()[:2]) for (sale_date,) in db.query(models.Sale.sale_date).filter(models.Sale.sale_date >= datetime.combine(start, datetime.min.time()))}
+        assert {row.key for row in crud.get_report(db, start, end, group_by="week")} == expected
+    finally:
+        db.close()
+
+def test_export_totals_and_limit(fixture_db):
+    db = fixture_db()
+    try:
+        start, end = date.today() - timedelta(days=60), date.today()
+        rows = list(crud.iter_sales_export_rows(db, start, end))
+        assert crud.get_sales_export_totals(db, start, end) == (len(rows), sum(row[-1] for row in rows))
+        assert list(crud.iter_sales_export_rows(db, start, end, limit=10)) == rows[:10]
+        orders = list(crud.iter_received_orders_export_rows(db, start, end))
+        count, total = crud.get_received_orders_export_totals(db, start, end)
+        assert count == len(orders) and total == sum(row[-1] for row in orders)
+    finally:
+        db.close()
@@ -0,0 +1,13 @@
+"""Ventes : validation du panier avant toute écriture."""
+import pytest
+from app import crud, models, schemas
+
+def test_empty_basket_is_refused(fixture_db):
+    db = fixture_db()
+    try:
+        before = db.query(models.Sale).count()
+        with pytest.raises(ValueError, match="vide"):
+            crud.create_sale(db, schemas.SaleCreate(payment_method="Espèce", status=models.SaleStatus.PAYEE, items=[]), user_id=1)
+        assert db.query(models.Sale).count() == before
+    finally:
+        db.close()
@@ -0,0 +1,16 @@
+"""Index de recherche plein texte (SQLite FTS5) : recréé s'il lui manque un déclencheur."""
+from sqlalchemy import text
+from app import models
+from app.database import make_engine
+from app.maintenance import create_product_search_index
+
+def test_missing_trigger_rebuilds_the_index(tmp_path):
+    bind = make_engine(f"sqlite:///{tmp_path / 'search.db'}")
+    models.Base.metadata.create_all(bind)
+    assert create_product_search_index(bind)
+    assert not create_product_search_index(bind)
+    with bind.begin() as conn:
+        conn.execute(text("DROP TRIGGER products_fts_au"))
+    assert create_product_search_index(bind)
+    with bind.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM sqlite_master WHERE name = 'products_fts_au'")).scalar() == 1
@@ -0,0 +1,53 @@
+"""Stock : corrections relatives et validation des mouvements manuels."""
+import pytest
+from pydantic import ValidationError
+from app import crud, models, schemas
+
+def test_manual_correction_keeps_concurrent_sale(fixture_db):
+    editor, cashier = fixture_db(), fixture_db()
+    try:
+        product = crud.get_product(editor, editor.query(models.Product.id).filter(models.Product.stock_quantity >= 5).limit(1).scalar())
+        seen = product.stock_quantity
+        # Vente validée par la caisse pendant que la fiche produit est ouverte
+        crud.create_sale(cashier, schemas.SaleCreate(payment_method="Espèce", status=models.SaleStatus.PAYEE, items=[
+            schemas.SaleItemCreate(product_id=product.id, quantity=2, price_per_unit=0),
+        ]), user_id=1)
+        crud.update_product(editor, product.id, schemas.ProductUpdate(stock_quantity=seen + 10))
+        assert product.stock_quantity == seen + 10 - 2
+        last = editor.query(models.StockMovement).filter(models.StockMovement.product_id == product.id).order_by(models.StockMovement.id.desc()).first()
+        assert (last.movement_type, last.quantity) == (models.StockMovementType.AJUSTEMENT, 10)
+    finally:
+        editor.close()
+        cashier.close()
+
+@pytest.mark.parametrize("movement_type, quantity", [(models.StockMovementType.RETOUR, -1), (models.StockMovementType.RECEPTION, -3), (models.StockMovementType.VENTE, 2), (models.StockMovementType.AJUSTEMENT, 0)])
+def test_movement_sign_is_checked(movement_type, quantity):
+    with pytest.raises(ValidationError):
+        schemas.StockMovementCreate(product_id=1, movement_type=movement_type, quantity=quantity)
+
+def test_movement_cannot_claim_a_sale():
+    assert "sale_id" not in schemas.StockMovementCreate.model_fields
+
+def test_stock_writes_keep_reference_catalog(fixture_db):
+    db = fixture_db()
+    try:
+        catalog = crud.get_reference_products(db)
+        assert "stock_quantity" not in schemas.ProductReference.model_fields
+        product_id = db.query(models.Product.id).filter(models.Product.stock_quantity >= 1).limit(1).scalar()
+        crud.create_sale(db, schemas.SaleCreate(payment_method="Espèce", status=models.SaleStatus.PAYEE, items=[
+            schemas.SaleItemCreate(product_id=product_id, quantity=1, price_per_unit=0),
+        ]), user_id=1)
+        crud.record_stock_movement(db, schemas.StockMovementCreate(product_id=product_id, movement_type=models.StockMovementType.RETOUR, quantity=1))
+        # Même instantané : ni la vente ni le retour n'invalident le catalogue de référence
+        assert crud.get_reference_products(db) is catalog
+    finally:
+        db.close()
+
+def test_supplier_products_are_filtered_in_sql(fixture_db):
+    db = fixture_db()
+    try:
+        supplier_id = db.query(models.Product.supplier_id).filter(models.Product.supplier_id.isnot(None)).limit(1).scalar()
+        expected = {p.id for p in crud.get_reference_products(db) if p.supplier_id == supplier_id}
+        assert {p.id for p in crud.get_supplier_products(db, supplier_id)} == expected
+    finally:
+        db.close()